@@ -0,0 +1,382 @@
+"""End-to-end pipeline benchmark on synthetic customers and locally generated media.
+
+    python benchmarks/run_benchmarks.py                       # defaults, results → benchmarks/results/
+    python benchmarks/run_benchmarks.py --customers 200 --video-customers 4
+    python benchmarks/run_benchmarks.py --baseline benchmarks/results/<earlier>.json --gate
+
+Everything runs in a throw-away sandbox directory: raw language CSVs with long
+names in every language, lavfi test base videos and tone audio clips, copies of
+the templates, fonts and static cards. The real stage code is run in-process
+against it, after a startup probe that times import → first card in fresh
+interpreters. No network is used (TTS and HeyGen are not part of the run).
+
+Each run writes one JSON file. Metrics are compared with benchmarks/thresholds.json
+(absolute limits) and, with --baseline, with an earlier run (relative
+regression); --gate makes any violation exit non-zero.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO / "main"))
+sys.path.append(str(REPO / "scripts"))   # after main/: scripts/complete_video.py must not shadow main's
+
+RESULTS_DIR = REPO / "benchmarks" / "results"
+THRESHOLDS = REPO / "benchmarks" / "thresholds.json"
+LANGUAGES = ["Hindi", "Tamil", "Telugu", "Kannada"]
+
+# Name parts in the style of CUSTOMER_EXAMPLE (generate_base_videos.py): the
+# long, multi-part names are what push draw_text_auto_fit into shrinking/truncating.
+NAME_PARTS = {
+    "Hindi": ["KHAN", "MOHAMMED", "AHMAR", "AMAN", "TOHID", "SHARMA", "VAIDYA", "RAGHUVANSHI"],
+    "Tamil": ["THAMIZHARASAN", "DHAMODHARAN", "ARUMUGAM", "SUBRAMANIAN", "KARTHIKEYAN"],
+    "Telugu": ["MEDIDA", "VEERA", "VENKATA", "SATYANARAYANA", "NAGESWARA", "RAO"],
+    "Kannada": ["SURESH", "KORAGALL", "YANKAPPA", "MANJUNATHA", "SIDDARAMAIAH"],
+}
+IFSC = ["HDFC0001234", "ICIC0005678", "SBIN0007894", "CNRB0RTGS01", "KKBK0000958"]
+
+
+# ---------- sandbox ----------
+def synthetic_rows(lang, n, rng):
+    rows = []
+    for i in range(n):
+        parts = rng.sample(NAME_PARTS[lang], k=rng.randint(2, min(5, len(NAME_PARTS[lang]))))
+        loan = rng.randint(50_000, 1_762_547)
+        rows.append({
+            "LOAN ACCOUNT NO": f"SF{lang[:2].upper()}{i:09d}",
+            "CUSTOMER NAME": " ".join(parts),
+            "SANCTIONED LOAN AMOUNT": str(loan),
+            "EFFECTIVE INSTALLMENT AMOUNT": f"{loan / rng.choice([24, 36, 60]):.2f}",
+            "IFSC Code": rng.choice(IFSC),
+            "Account Last 4 Digits": f"{rng.randint(0, 9999):04d}",
+        })
+    return rows
+
+
+def ffmpeg(*args):
+    subprocess.run(["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", *args], check=True)
+
+
+def build_sandbox(root: Path, customers, video_seconds, seed):
+    import pandas as pd
+
+    rng = random.Random(seed)
+    for sub in ["templates", "fonts", "static"]:
+        shutil.copytree(REPO / "assets" / sub, root / "assets" / sub)
+    (root / "data").mkdir(parents=True)
+    for lang in LANGUAGES:
+        pd.DataFrame(synthetic_rows(lang, customers, rng)).to_csv(root / "data" / f"{lang}.csv", index=False)
+
+    base_dir = root / "assets" / "base_videos"
+    base_dir.mkdir(parents=True)
+    for n, lang in enumerate(LANGUAGES):
+        ffmpeg("-f", "lavfi", "-i", f"testsrc2=size=1280x720:rate=25:duration={video_seconds}",
+               "-f", "lavfi", "-i", f"sine=frequency={300 + 100 * n}:duration={video_seconds}",
+               "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p",
+               "-c:a", "aac", "-shortest", str(base_dir / f"{lang}.mp4"))
+
+
+def tone_clips(root: Path, ids_langs):
+    """Two mp3 'speech' clips per customer for merge_audio, like generate_audio_snippets writes."""
+    for cid, lang in ids_langs:
+        folder = root / "output_2clips" / f"{cid}_{lang.lower()}"
+        folder.mkdir(parents=True, exist_ok=True)
+        for i, seconds in ((1, 6), (2, 9)):
+            ffmpeg("-f", "lavfi", "-i", f"sine=frequency={200 + 50 * i}:duration={seconds}",
+                   str(folder / f"{i:02d}_{lang.lower()}.mp3"))
+
+
+# ---------- measurement ----------
+def dir_bytes(*dirs):
+    total = 0
+    for d in dirs:
+        for dirpath, _, files in os.walk(d):
+            total += sum(os.path.getsize(os.path.join(dirpath, f)) for f in files)
+    return total
+
+
+def peak_rss_mb():
+    """Peak RSS of this process and of the largest child (ffmpeg) so far, in MB (Linux: KB units)."""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    child = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return round(own, 1), round(child, 1)
+
+
+def cpu_seconds():
+    s, c = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    return s.ru_utime + s.ru_stime + c.ru_utime + c.ru_stime
+
+
+def timed(fn, items, unit, outputs):
+    before = dir_bytes(*outputs)
+    cpu0, t0 = cpu_seconds(), time.perf_counter()
+    fn()
+    wall, cpu = time.perf_counter() - t0, cpu_seconds() - cpu0
+    own, child = peak_rss_mb()
+    count = items() if callable(items) else items
+    return {
+        "items": count, "unit": unit,
+        "wall_s": round(wall, 3), "cpu_s": round(cpu, 3),
+        "per_sec": round(count / wall, 3) if wall else None,
+        "bytes_written": dir_bytes(*outputs) - before,
+        "peak_rss_mb": own, "peak_child_rss_mb": child,
+    }
+
+
+# ---------- stages ----------
+# Run in a fresh interpreter: how long until `import generate_cards` returns, and
+# until the first customer's cards are on disk (fonts, template decode, PNG save).
+STARTUP_PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import generate_cards
+t1 = time.perf_counter()
+heavy = [m for m in ("pandas", "requests", "PIL") if m in sys.modules]
+generate_cards.init()
+row = {"id": "startup", "language": "hindi", "name": "KHAN MOHAMMED AHMAR TOHID", "loan_account_number": "SFHI000000001",
+       "loan_amount_fmt": "₹1,76,254", "emi_amount_fmt": "₹4,896.00", "due_date": "05-Dec-2025",
+       "ifsc": "HDFC0001234", "account_last4": "1234"}
+written = generate_cards.generate_for_row(row)
+t2 = time.perf_counter()
+print("STARTUP " + json.dumps({"import_ms": (t1 - t0) * 1000, "first_card_ms": (t2 - t0) * 1000,
+                  "cards": len(written), "heavy_modules_at_import": heavy}), flush=True)
+"""
+
+
+def bench_startup(runs):
+    env = dict(os.environ, PYTHONPATH=str(REPO / "main"))
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", STARTUP_PROBE], env=env, capture_output=True, text=True, check=True)
+        # stdout also carries the card log lines
+        sample = json.loads(next(l for l in out.stdout.splitlines() if l.startswith("STARTUP "))[len("STARTUP "):])
+        sample["process_ms"] = (time.perf_counter() - t0) * 1000
+        samples.append(sample)
+    if any(s["cards"] != 2 for s in samples):
+        raise RuntimeError("startup probe did not write both cards")
+    median = lambda key: round(statistics.median(s[key] for s in samples), 1)
+    return {
+        "runs": runs,
+        "import_ms": median("import_ms"),
+        "first_card_ms": median("first_card_ms"),
+        "process_ms": median("process_ms"),
+        "heavy_modules_at_import": samples[0]["heavy_modules_at_import"],
+    }
+
+
+def bench_prepare():
+    import prepare_customer_csv
+    return timed(prepare_customer_csv.create_master_csv, lambda: len(_master(["id"])), "customers", ["data"])
+
+
+def _master(columns=None):
+    import customer_store
+    return customer_store.read_customers(columns=columns)
+
+
+def bench_cards():
+    import generate_cards
+
+    # time per text field: draw_text_auto_fit on the per-card path; on the
+    # batched path (CARD_BATCH_SIZE > 1) fit_text plus the text_layer masks the
+    # compositor blends, which is the same fit-and-draw work per field
+    calls, spent = [], []
+    originals = {name: getattr(generate_cards, name) for name in ("draw_text_auto_fit", "fit_text", "text_layer")}
+
+    def timing(name):
+        fn = originals[name]
+
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                spent.append(time.perf_counter() - t0)
+                if name != "text_layer":
+                    calls.append(name)
+        return wrapper
+
+    batched = generate_cards.BATCH_SIZE > 1
+    timed_names = ("fit_text", "text_layer") if batched else ("draw_text_auto_fit",)
+    for name in timed_names:
+        setattr(generate_cards, name, timing(name))
+    try:
+        result = timed(generate_cards.main, lambda: len(list(generate_cards.GENERATED.glob("*.png"))),
+                       "cards", [generate_cards.GENERATED])
+    finally:
+        for name, fn in originals.items():
+            setattr(generate_cards, name, fn)
+    result["card_batch_size"] = generate_cards.BATCH_SIZE
+    result["text_fit_timed"] = "+".join(timed_names)
+    result["draw_text_auto_fit_calls"] = len(calls)
+    result["ms_per_draw_text_auto_fit"] = round(1000 * sum(spent) / len(calls), 3) if calls else None
+    return result
+
+
+def video_subset(per_language):
+    """Write a small master with the first customers of each language for the video stages."""
+    df = _master()
+    subset = df.groupby("language", sort=False).head(per_language)
+    path = Path("data") / "bench_video_master.csv"
+    subset.to_csv(path, index=False)
+    return path, list(zip(subset["id"].astype(str), subset["language"]))
+
+
+def bench_video(subset_csv):
+    import complete_video
+    complete_video.DATA_CSV = subset_csv
+    count = lambda: len(list(complete_video.OUTPUT_DIR.glob("*_video*.m*")))
+    return timed(complete_video.main, count, "videos", [complete_video.OUTPUT_DIR])
+
+
+def bench_merge_audio(ids_langs):
+    import artifact_index
+    import merge_audio
+    import workspace
+
+    # the tone clips were written here, not by the audio stage: index them like any hand-made change
+    artifact_index.rebuild()
+
+    def run():
+        with workspace.Workspace("bench_merge_audio") as ws:
+            for cid, lang in ids_langs:
+                merge_audio.compose_customer_video(cid, lang.lower(), ws)
+
+    count = lambda: len(list(Path(merge_audio.FINAL_OUTPUT_DIR).glob("*.mp4")))
+    return timed(run, count, "videos", [merge_audio.FINAL_OUTPUT_DIR])
+
+
+# ---------- regression gates ----------
+def flatten(results):
+    s = results["stages"]
+    metrics = {
+        "startup_import_ms": s["startup"]["import_ms"],
+        "startup_first_card_ms": s["startup"]["first_card_ms"],
+        "prepare_customers_per_sec": s["prepare"]["per_sec"],
+        "cards_per_sec": s["cards"]["per_sec"],
+        "ms_per_draw_text_auto_fit": s["cards"]["ms_per_draw_text_auto_fit"],
+        "peak_rss_mb": max(st["peak_rss_mb"] for st in s.values() if "peak_rss_mb" in st),
+        "bytes_per_card": s["cards"]["bytes_written"] / max(1, s["cards"]["items"]),
+    }
+    if "video" in s:
+        metrics["videos_per_sec"] = s["video"]["per_sec"]
+        metrics["bytes_per_video"] = s["video"]["bytes_written"] / max(1, s["video"]["items"])
+    if "merge_audio" in s:
+        metrics["merge_audio_videos_per_sec"] = s["merge_audio"]["per_sec"]
+    return metrics
+
+
+def check(metrics, thresholds, baseline=None):
+    """Violations of absolute limits and of the allowed regression against a baseline run."""
+    problems = []
+    for name, limit in thresholds.get("limits", {}).items():
+        value = metrics.get(name)
+        if value is None:
+            continue
+        if "min" in limit and value < limit["min"]:
+            problems.append(f"{name}={value} below minimum {limit['min']}")
+        if "max" in limit and value > limit["max"]:
+            problems.append(f"{name}={value} above maximum {limit['max']}")
+    if baseline:
+        allowed = thresholds.get("max_regression_pct", 15) / 100
+        for name, direction in thresholds.get("direction", {}).items():
+            old, new = baseline.get("metrics", {}).get(name), metrics.get(name)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if direction == "higher" else change
+            if worse > allowed:
+                problems.append(f"{name} regressed {worse:.0%} vs baseline ({old} → {new})")
+    return problems
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "-C", str(REPO), "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--customers", type=int, default=50, help="synthetic customers per language")
+    ap.add_argument("--video-customers", type=int, default=2, help="customers per language for the video stages")
+    ap.add_argument("--video-seconds", type=int, default=48, help="length of the test base videos")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--startup-runs", type=int, default=5, help="fresh-interpreter runs for the startup probe (median)")
+    ap.add_argument("--skip-video", action="store_true", help="only prepare + cards")
+    ap.add_argument("--baseline", help="earlier results JSON to compare against")
+    ap.add_argument("--out", help="results file (default benchmarks/results/<time>_<commit>.json)")
+    ap.add_argument("--keep", action="store_true", help="keep the sandbox directory")
+    ap.add_argument("--gate", action="store_true", help="exit 1 on any threshold violation")
+    args = ap.parse_args()
+
+    sandbox = Path(tempfile.mkdtemp(prefix="reminders-bench-"))
+    print(f"🧪 Sandbox: {sandbox}")
+    build_sandbox(sandbox, args.customers, args.video_seconds, args.seed)
+
+    cwd = os.getcwd()
+    os.chdir(sandbox)   # stage modules resolve everything relative to the working directory
+    os.environ["REMINDERS_SCRATCH_DIR"] = str(sandbox / "scratch")
+    stages = {}
+    try:
+        print("⏱️ startup (import → first card)"); stages["startup"] = bench_startup(args.startup_runs)
+        print("⏱️ prepare_customer_csv"); stages["prepare"] = bench_prepare()
+        print("⏱️ generate_cards"); stages["cards"] = bench_cards()
+        if not args.skip_video:
+            subset_csv, ids_langs = video_subset(args.video_customers)
+            print("⏱️ complete_video"); stages["video"] = bench_video(subset_csv)
+            tone_clips(sandbox, ids_langs)
+            print("⏱️ merge_audio"); stages["merge_audio"] = bench_merge_audio(ids_langs)
+    finally:
+        os.chdir(cwd)
+        if not args.keep:
+            shutil.rmtree(sandbox, ignore_errors=True)
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "params": vars(args),
+        "stages": stages,
+    }
+    results["metrics"] = flatten(results)
+
+    thresholds = json.loads(THRESHOLDS.read_text()) if THRESHOLDS.exists() else {}
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+    if baseline and any(baseline.get("params", {}).get(k) != getattr(args, k.replace("-", "_"))
+                        for k in ("customers", "video_customers", "video_seconds")):
+        print("⚠️ Baseline was run with different --customers/--video-* settings; comparisons are rough.")
+    problems = check(results["metrics"], thresholds, baseline)
+    results["violations"] = problems
+
+    out = Path(args.out) if args.out else RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}_{results['commit'] or 'nogit'}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=2))
+
+    print("\n📊 Results")
+    for name, value in results["metrics"].items():
+        print(f"   {name:32s} {value}")
+    print(f"💾 {out}")
+    for p in problems:
+        print(f"❌ {p}")
+    if args.gate and problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""Index of the files the stages write: (customer, language, kind) → path, size, mtime.
+
+    python main/artifact_index.py --stats
+    python main/artifact_index.py --rebuild            # re-scan the output tree (after manual changes)
+    python main/artifact_index.py --rebuild --hash     # ... and hash every file
+
+Each stage records what it writes (record / record_many) and finds its inputs
+and finished outputs here (lookup / customers). On a tree with millions of
+files, on NFS especially, the stat()/listdir() calls this replaces were most of
+a resume's cost. A stage skipping a customer still stats the recorded path
+(present), so a file removed by hand is rendered again; --rebuild drops such
+records in bulk. A new, empty index is filled from the tree the first time it
+is opened. REMINDERS_ARTIFACT_HASH=1 also stores each file's SHA-256 (one
+more full read of every output); nothing in the pipeline needs it.
+
+Language-level assets (base videos, static cards) are stored under customer
+id "". The index is SQLite in WAL mode, so several stage processes can write
+at once. It must sit on a local disk (REMINDERS_ARTIFACT_INDEX), not on NFS.
+"""
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# ---------- CONFIG ----------
+ROOT = Path(".")
+INDEX_PATH = Path(os.getenv("REMINDERS_ARTIFACT_INDEX", str(ROOT / "data" / "artifacts.sqlite")))
+HASH_FILES = os.getenv("REMINDERS_ARTIFACT_HASH", "0") == "1"
+LANGUAGE_LEVEL = ""
+
+# Where each kind is written, for --rebuild. Keep in step with the stages' paths.
+# {lang} is matched case-insensitively and stored lower-case; card and audio
+# names are relative to the working directory, like the stages' own paths.
+LAYOUT = {
+    "loan_card": "assets/generated/{id}_loan.png",
+    "emi_card": "assets/generated/{id}_emi.png",
+    "audio1": "output_2clips/{id}_{lang}/01_{lang}.mp3",
+    "audio2": "output_2clips/{id}_{lang}/02_{lang}.mp3",
+    "base_part1": "output/merged_videos/base_{lang}_part1.mp4",
+    "base_part2": "output/merged_videos/base_{lang}_part2.mp4",
+    "merged_video": "output/merged_videos/{id}_{lang}.mp4",
+    "final_video": "output/final_videos/final_{lang}_{id}.mp4",
+    "final_with_cards": "output/final_videos/final_{lang}_with_cards_{id}.mp4",
+    "video": "assets/generated_videos/{lang}_{id}_video.mp4",
+    "video_{name}": "assets/generated_videos/{lang}_{id}_video_{name}.mp4",
+    "video_hls": "assets/generated_videos/{lang}_{id}_video.m3u8",
+    "base_video": "assets/base_videos/{lang}.mp4",
+    "static_card": "assets/static/{lang}_Card_3.jpg",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    customer_id TEXT NOT NULL,
+    language    TEXT NOT NULL,
+    kind        TEXT NOT NULL,
+    path        TEXT NOT NULL,
+    size        INTEGER,
+    sha256      TEXT,
+    mtime       REAL,
+    recorded    REAL,
+    PRIMARY KEY (customer_id, language, kind)
+);
+CREATE INDEX IF NOT EXISTS artifacts_kind ON artifacts (kind, language);
+CREATE INDEX IF NOT EXISTS artifacts_path ON artifacts (path);
+"""
+
+_lock = threading.Lock()
+_conn = None
+_conn_pid = None
+
+
+def _norm(cid, lang):
+    return str(cid).strip(), (lang if isinstance(lang, str) else "").strip().lower()
+
+
+def _connect():
+    """This process's connection (reopened after a fork); fills a brand-new index from the tree."""
+    global _conn, _conn_pid
+    if _conn is not None and _conn_pid == os.getpid():
+        return _conn
+    INDEX_PATH.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(INDEX_PATH, timeout=60, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    new = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'artifacts'").fetchone() is None
+    conn.executescript(SCHEMA)
+    _conn, _conn_pid = conn, os.getpid()
+    if new:
+        n = rebuild(hash_files=False)
+        print(f"Artifact index {INDEX_PATH} created from the existing tree ({n} file(s))")
+    return _conn
+
+
+def sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _row(cid, lang, kind, path, hash_files):
+    cid, lang = _norm(cid, lang)
+    st = os.stat(path)
+    return (cid, lang, kind, str(path), st.st_size, sha256(path) if hash_files else None, st.st_mtime, time.time())
+
+
+def record_many(items, hash_files=HASH_FILES):
+    """Record freshly written files: [(customer id, language, kind, path), ...].
+
+    The writer has just produced each file, so the stat (and the hash, if
+    enabled) reads it back from the page cache rather than the file server.
+    """
+    rows = [_row(cid, lang, kind, path, hash_files) for cid, lang, kind, path in items]
+    if not rows:
+        return 0
+    conn = _connect()
+    with _lock, conn:
+        conn.executemany("INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    return len(rows)
+
+
+def record(cid, lang, kind, path, hash_files=HASH_FILES):
+    record_many([(cid, lang, kind, path)], hash_files)
+
+
+def lookup(cid, lang, kind):
+    """Path of the recorded artifact, or None."""
+    cid, lang = _norm(cid, lang)
+    conn = _connect()
+    with _lock:
+        row = conn.execute("SELECT path FROM artifacts WHERE customer_id = ? AND language = ? AND kind = ?",
+                           (cid, lang, kind)).fetchone()
+    return Path(row[0]) if row else None
+
+
+def present(cid, lang, kind):
+    """Recorded and still on disk: one stat, for the resume checks that skip a customer."""
+    path = lookup(cid, lang, kind)
+    return path is not None and path.exists()
+
+
+def entry(cid, lang, kind):
+    """The full record as a dict (path, size, sha256, mtime, recorded), or None."""
+    cid, lang = _norm(cid, lang)
+    conn = _connect()
+    with _lock:
+        cur = conn.execute("SELECT * FROM artifacts WHERE customer_id = ? AND language = ? AND kind = ?",
+                           (cid, lang, kind))
+        row = cur.fetchone()
+        names = [d[0] for d in cur.description]
+    return dict(zip(names, row)) if row else None
+
+
+def customers(kind, language=None):
+    """{(customer id, language)} that have `kind`, in one query (for whole-stage resume checks)."""
+    conn = _connect()
+    sql, args = "SELECT customer_id, language FROM artifacts WHERE kind = ? AND customer_id != ''", [kind]
+    if language is not None:
+        sql += " AND language = ?"
+        args.append(_norm("", language)[1])
+    with _lock:
+        return set(conn.execute(sql, args).fetchall())
+
+
+def recorded(kinds):
+    """{(customer id, language): newest `recorded` time} over kinds matching any of the GLOB patterns."""
+    conn = _connect()
+    where = " OR ".join("kind GLOB ?" for _ in kinds)
+    with _lock:
+        rows = conn.execute(f"SELECT customer_id, language, MAX(recorded) FROM artifacts "
+                            f"WHERE customer_id != '' AND ({where}) GROUP BY customer_id, language", list(kinds))
+        return {(cid, lang): t for cid, lang, t in rows}
+
+
+def forget(cid, lang, kinds=None):
+    """Drop a customer's records (all kinds, or just `kinds`) after their files are removed."""
+    cid, lang = _norm(cid, lang)
+    conn = _connect()
+    with _lock, conn:
+        if kinds is None:
+            conn.execute("DELETE FROM artifacts WHERE customer_id = ? AND language = ?", (cid, lang))
+        else:
+            conn.executemany("DELETE FROM artifacts WHERE customer_id = ? AND language = ? AND kind = ?",
+                             [(cid, lang, k) for k in kinds])
+
+
+def forget_paths(paths):
+    """Drop the records of files that were moved or deleted."""
+    conn = _connect()
+    with _lock, conn:
+        conn.executemany("DELETE FROM artifacts WHERE path = ?", [(str(p),) for p in paths])
+
+
+def _pattern(template):
+    """Regex for a LAYOUT path; a placeholder used twice must match the same text."""
+    out, seen = "", set()
+    for literal, name in re.findall(r"([^{]*)(?:\{(\w+)\})?", template):
+        out += re.escape(literal)
+        if not name:
+            continue
+        if name in seen:
+            out += f"(?P={name})"
+        else:
+            seen.add(name)
+            out += f"(?P<{name}>[^_/]+)" if name in ("id", "lang") else f"(?P<{name}>[^/]+)"
+    return re.compile(out + "$", re.IGNORECASE)
+
+
+def scan(layout=LAYOUT):
+    """Walk each output directory once: [(id, lang, kind, path), ...] for every file the layout names."""
+    roots = {}
+    for kind, template in layout.items():
+        root = template.split("{", 1)[0].rsplit("/", 1)[0]
+        depth = template[len(root) + 1:].count("/")
+        roots.setdefault(root, []).append((kind, _pattern(template), depth))
+
+    found = []
+    for root, patterns in roots.items():
+        max_depth = max(d for _, _, d in patterns)
+        for dirpath, dirnames, files in os.walk(root):
+            rel_depth = 0 if dirpath == root else os.path.relpath(dirpath, root).count(os.sep) + 1
+            if rel_depth >= max_depth:
+                dirnames[:] = []
+            for name in files:
+                path = Path(dirpath, name).as_posix()
+                for kind, pattern, _ in patterns:
+                    m = pattern.match(path)
+                    if m:
+                        groups = m.groupdict()
+                        found.append((groups.get("id", LANGUAGE_LEVEL), groups.get("lang", ""),
+                                      kind.format(**groups), path))
+                        break
+    return found
+
+
+def _card_languages():
+    """Customer id → language from the master; card file names don't carry the language."""
+    import customer_store
+    try:
+        df = customer_store.read_customers(columns=["id", "language"])
+    except Exception as e:
+        print(f"Could not read the customer master ({e}); cards are not indexed")
+        return {}
+    return dict(zip(df["id"].astype(str), df["language"].fillna("").astype(str)))
+
+
+def rebuild(hash_files=False, layout=LAYOUT):
+    """Replace the index with what is on disk now; returns the number of files indexed."""
+    found = scan(layout)
+    languages = _card_languages() if any(not lang for cid, lang, _, _ in found if cid) else {}
+    rows = []
+    for cid, lang, kind, path in found:
+        if cid and not lang:
+            lang = languages.get(cid)
+            if lang is None:
+                continue          # card of a customer who is no longer in the master
+        try:
+            rows.append(_row(cid, lang, kind, path, hash_files))
+        except FileNotFoundError:
+            continue
+    conn = _connect()
+    with _lock, conn:
+        conn.execute("DELETE FROM artifacts")
+        conn.executemany("INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    return len(rows)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rebuild", action="store_true", help="replace the index with a scan of the output tree")
+    ap.add_argument("--hash", action="store_true", help="with --rebuild: also hash every file")
+    ap.add_argument("--stats", action="store_true", help="files and bytes per kind")
+    args = ap.parse_args()
+
+    if args.rebuild:
+        t0 = time.perf_counter()
+        n = rebuild(hash_files=args.hash)
+        print(f"Indexed {n} file(s) in {time.perf_counter() - t0:.1f}s → {INDEX_PATH}")
+    if args.stats or not args.rebuild:
+        conn = _connect()
+        for kind, n, size in conn.execute("SELECT kind, COUNT(*), SUM(size) FROM artifacts GROUP BY kind ORDER BY kind"):
+            print(f"  {kind:18s} {n:9d}  {(size or 0) / 1024 ** 2:10.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""Pick x264 encoder settings for this host from measurements.
+
+    python main/calibrate_encoder.py                                  # first base video, default grid
+    python main/calibrate_encoder.py --source assets/base_videos/Hindi.mp4 --min-ssim 0.98
+    python main/calibrate_encoder.py --presets veryfast,faster --crfs 20,22 --threads 0,2 --dry-run
+    python main/calibrate_encoder.py --batch 1     # hosts that render one customer per process
+
+A clip of a representative base video (by default the seconds the cards are
+shown over) is decoded once to a lossless reference. That reference is then
+encoded under every preset × CRF × thread count in the grid. Each trial is
+shaped like a production batch: one ffmpeg process decodes the reference once
+and feeds --batch encoders (media_worker.BATCH_SIZE by default), as
+complete_video does. -threads applies to each encoder, so a thread count that
+wins alone can oversubscribe the cores batch-size times over. Speed is
+per-customer throughput. One output per trial is sized and scored against the
+reference with ffmpeg's ssim and psnr filters. The fastest setting that meets
+the quality target and the size target is written to data/encoder_profile.json. The size target is a bitrate cap, or
+by default at most 1.5x the smallest output that met the quality target, so
+the ultrafast presets can't win on speed alone by doubling the file size.
+
+complete_video, join_cards, merge_audio and the concat stage use that preset
+and thread count in place of their built-in defaults. The CRF is measured for
+complete_video's default (media_worker.PROFILE_REFERENCE_CRF) and stored as an
+offset from it. Each stage applies the offset to its own default CRF, so
+join_cards' intermediate, which is encoded a second time, keeps its higher
+quality (see media_worker.x264_args).
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import media_worker
+
+# ---------- CONFIG ----------
+ROOT = Path(".")
+BASE_VIDEOS_DIR = ROOT / "assets" / "base_videos"
+PROFILE_PATH = Path(media_worker.ENCODER_PROFILE)
+PRESETS = "ultrafast,superfast,veryfast,faster,fast,medium"
+CRFS = "18,20,22,24"
+CLIP_START = 6.0      # c1 in complete_video.TSPEC: the first card appears here
+CLIP_SECONDS = 10.0
+MIN_SSIM = float(os.getenv("ENCODER_MIN_SSIM", "0.97"))
+MAX_KBPS = float(os.getenv("ENCODER_MAX_KBPS", "0"))   # 0 = no absolute cap
+MAX_SIZE_RATIO = float(os.getenv("ENCODER_MAX_SIZE_RATIO", "1.5"))   # vs the smallest passing output; 0 = off
+
+_SSIM = re.compile(r"SSIM .*All:([\d.]+)")
+_PSNR = re.compile(r"PSNR .*average:([\d.]+|inf)")
+
+
+def default_threads():
+    """Auto (0), one thread per encoder, and every core (per encoder, so x batch size in total)."""
+    cores = os.cpu_count() or 1
+    return ",".join(str(t) for t in dict.fromkeys([0, 1, cores]))
+
+
+def make_reference(source, start, seconds, out):
+    """Lossless (FFV1) copy of the clip, so every trial encodes and is scored on identical frames."""
+    code, err = media_worker.run_ffmpeg([
+        "ffmpeg", "-y", "-ss", str(start), "-t", str(seconds), "-i", str(source),
+        "-an", "-c:v", "ffv1", "-pix_fmt", "yuv420p", str(out),
+    ])
+    if code != 0:
+        raise RuntimeError(f"could not cut the reference clip:\n{err[-1000:]}")
+
+
+def encode(reference, preset, crf, threads, outs):
+    """Encode the reference to every path in `outs` from one process, the way a render batch does."""
+    args = ["-an", "-c:v", "libx264", "-preset", preset, "-crf", str(crf), "-pix_fmt", "yuv420p"]
+    if threads:
+        args += ["-threads", str(threads)]
+    jobs = [{"id": n, "overlays": [], "outputs": [{"file": out, "args": args}]} for n, out in enumerate(outs)]
+    t0 = time.perf_counter()
+    code, err = media_worker.run_ffmpeg(media_worker.build_batch_command(reference, (0, 0), jobs))
+    if code != 0:
+        raise RuntimeError(err[-1000:])
+    return time.perf_counter() - t0
+
+
+def quality(encoded, reference):
+    """(SSIM, PSNR dB) of an encode against the reference."""
+    code, err = media_worker.run_ffmpeg([
+        "ffmpeg", "-i", str(encoded), "-i", str(reference),
+        "-lavfi", "[0:v]split[e1][e2];[1:v]split[r1][r2];[e1][r1]ssim;[e2][r2]psnr",
+        "-f", "null", "-",
+    ])
+    ssim, psnr = _SSIM.search(err), _PSNR.search(err)
+    if code != 0 or not ssim or not psnr:
+        raise RuntimeError(f"quality measurement failed:\n{err[-1000:]}")
+    return float(ssim.group(1)), float(psnr.group(1))
+
+
+def calibrate(source, presets, crfs, threads, start=CLIP_START, seconds=CLIP_SECONDS, batch=media_worker.BATCH_SIZE):
+    seconds = min(seconds, max(1.0, media_worker.duration(source) - start))
+    work = Path(tempfile.mkdtemp(prefix="encoder-calibration-"))
+    results = []
+    try:
+        reference = work / "reference.mkv"
+        make_reference(source, start, seconds, reference)
+        total = len(presets) * len(crfs) * len(threads)
+        for preset in presets:
+            for crf in crfs:
+                for t in threads:
+                    outs = [work / f"{preset}_{crf}_{t}_{n}.mp4" for n in range(batch)]
+                    wall = encode(reference, preset, crf, t, outs)
+                    ssim, psnr = quality(outs[0], reference)
+                    row = {
+                        "preset": preset, "crf": crf, "threads": t, "batch": batch,
+                        "seconds": round(wall / batch, 3),             # per customer
+                        "speed": round(seconds * batch / wall, 3),     # x realtime, per customer
+                        "kbps": round(outs[0].stat().st_size * 8 / seconds / 1000, 1),
+                        "ssim": round(ssim, 5), "psnr": round(psnr, 2),
+                    }
+                    results.append(row)
+                    for out in outs:
+                        out.unlink()
+                    print(f"  [{len(results)}/{total}] preset={preset:9s} crf={crf:>2} threads={t:<2} "
+                          f"{row['speed']:6.2f}x  {row['kbps']:8.1f} kb/s  SSIM {row['ssim']:.4f}  PSNR {row['psnr']:.2f}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return results, seconds
+
+
+def select(results, min_ssim=MIN_SSIM, max_kbps=MAX_KBPS, max_size_ratio=MAX_SIZE_RATIO):
+    """Fastest setting meeting the targets (smaller output breaks ties); None if nothing does."""
+    ok = [r for r in results if r["ssim"] >= min_ssim and (not max_kbps or r["kbps"] <= max_kbps)]
+    if ok and max_size_ratio:
+        smallest = min(r["kbps"] for r in ok)
+        ok = [r for r in ok if r["kbps"] <= smallest * max_size_ratio]
+    return max(ok, key=lambda r: (r["speed"], -r["kbps"]), default=None)
+
+
+def write_profile(path, selected, results, params):
+    profile = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "host": {"platform": platform.platform(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "params": params,
+        "selected": {**{k: selected[k] for k in ("preset", "crf", "threads")},
+                     "reference_crf": media_worker.PROFILE_REFERENCE_CRF,
+                     "crf_offset": selected["crf"] - media_worker.PROFILE_REFERENCE_CRF},
+        "measured": selected,
+        "results": results,
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(profile, indent=2))
+    os.replace(tmp, path)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--source", help="base video to calibrate on (default: first in assets/base_videos)")
+    ap.add_argument("--start", type=float, default=CLIP_START, help="clip start in seconds")
+    ap.add_argument("--seconds", type=float, default=CLIP_SECONDS, help="clip length in seconds")
+    ap.add_argument("--presets", default=PRESETS)
+    ap.add_argument("--crfs", default=CRFS)
+    ap.add_argument("--threads", default=default_threads(), help="x264 thread counts per encoder (0 = auto)")
+    ap.add_argument("--batch", type=int, default=media_worker.BATCH_SIZE,
+                    help="encoders per ffmpeg process in each trial (default: MEDIA_BATCH_SIZE)")
+    ap.add_argument("--min-ssim", type=float, default=MIN_SSIM, help="quality target")
+    ap.add_argument("--max-kbps", type=float, default=MAX_KBPS, help="bitrate cap (0 = none)")
+    ap.add_argument("--max-size-ratio", type=float, default=MAX_SIZE_RATIO,
+                    help="max size vs the smallest output meeting --min-ssim (0 = off)")
+    ap.add_argument("--out", default=str(PROFILE_PATH))
+    ap.add_argument("--dry-run", action="store_true", help="measure and report, don't write the profile")
+    args = ap.parse_args()
+
+    source = Path(args.source) if args.source else next(iter(sorted(BASE_VIDEOS_DIR.glob("*.mp4"))), None)
+    if source is None or not source.exists():
+        raise SystemExit(f"No source video (looked in {BASE_VIDEOS_DIR}); pass --source")
+    presets = [p.strip() for p in args.presets.split(",") if p.strip()]
+    crfs = [int(c) for c in args.crfs.split(",") if c.strip()]
+    threads = [int(t) for t in args.threads.split(",") if t.strip()]
+
+    batch = max(1, args.batch)
+    print(f"Calibrating on {source} ({args.seconds:g}s from {args.start:g}s), "
+          f"{len(presets) * len(crfs) * len(threads)} trials of {batch} encoder(s)")
+    results, seconds = calibrate(source, presets, crfs, threads, args.start, args.seconds, batch)
+    selected = select(results, args.min_ssim, args.max_kbps, args.max_size_ratio)
+    if selected is None:
+        raise SystemExit(f"No setting reached SSIM >= {args.min_ssim}"
+                         + (f" within {args.max_kbps:g} kb/s" if args.max_kbps else "")
+                         + "; widen the grid or relax the targets. Profile not written.")
+
+    offset = selected["crf"] - media_worker.PROFILE_REFERENCE_CRF
+    print(f"\nSelected: preset={selected['preset']} crf={selected['crf']} threads={selected['threads'] or 'auto'} "
+          f"({selected['speed']}x realtime, {selected['kbps']} kb/s, SSIM {selected['ssim']})")
+    print(f"Each stage's default CRF moves by {offset:+d} (complete_video {media_worker.PROFILE_REFERENCE_CRF} → "
+          f"{selected['crf']}, join_cards 18 → {18 + offset})")
+    if args.dry_run:
+        return
+    params = {"source": str(source), "start": args.start, "seconds": seconds, "batch": batch,
+              "min_ssim": args.min_ssim, "max_kbps": args.max_kbps, "max_size_ratio": args.max_size_ratio}
+    write_profile(Path(args.out), selected, results, params)
+    print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
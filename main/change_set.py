@@ -0,0 +1,240 @@
+import os
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import artifact_index
+import display_fields
+
+# ---------- CONFIG ----------
+ROOT = Path(".")
+CHANGE_SET_CSV = ROOT / "data" / "change_set.csv"
+ID_HIGH_WATER = ROOT / "data" / "customer_id_high_water"   # highest id ever issued, across runs
+
+# Columns that decide whether a customer's personalised content changed.
+# due_date is tracked separately: it moves for everyone every month, but only
+# the EMI card / second audio sentence / final video actually show it.
+PROFILE_COLUMNS = [
+    "name", "language", "loan_account_number",
+    "loan_amount", "emi_amount", "ifsc", "account_last4",
+]
+
+# The last artifacts of each pipeline (main/complete_video.py, scripts/join_cards.py).
+# A change carried over from an earlier run is dropped once one of these was
+# recorded after the change was detected: every stage before it has re-rendered.
+FINAL_KINDS = ["video*", "final_with_cards"]
+
+# Set REMINDERS_FULL_RUN=1 to make every stage ignore the change set and redo everyone.
+FULL_RUN = os.getenv("REMINDERS_FULL_RUN", "") not in ("", "0")
+
+
+def _profile_hash(df: pd.DataFrame) -> pd.Series:
+    cols = pd.DataFrame({c: (df[c] if c in df.columns else "") for c in PROFILE_COLUMNS}, index=df.index)
+    cols = cols.fillna("").astype(str).apply(lambda s: s.str.strip())
+    # the saved master holds the zero-padded value; the raw language CSVs may not
+    cols["account_last4"] = display_fields.normalize_last4(cols["account_last4"])
+    return pd.util.hash_pandas_object(cols, index=False)
+
+
+def read_high_water(path=ID_HIGH_WATER) -> int:
+    try:
+        return int(Path(path).read_text().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def write_high_water(ids, path=ID_HIGH_WATER):
+    """Remember the highest id issued so far (never lowered)."""
+    ids = pd.to_numeric(pd.Series(ids), errors="coerce")
+    top = max(read_high_water(path), int(ids.max()) if ids.notna().any() else 0)
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    Path(path).write_text(f"{top}\n")
+    return top
+
+
+def diff_masters(new_df: pd.DataFrame, prev_df, high_water=0) -> tuple:
+    """Hash-join the new master against the previous one on loan_account_number.
+
+    Returns (new_df with a stable `id` column inserted first, change set DataFrame).
+    Matched customers keep their previous id, so their cards/audio/videos stay
+    addressable; new customers get ids after the highest id ever issued: the
+    previous master's or `high_water` (read_high_water), whichever is higher, so
+    the id of a customer who dropped out is never handed to someone else.
+    A customer whose language changed is "changed" under the new language and
+    "removed" under the old one, so the old-language outputs are cleared.
+    """
+    new = new_df.drop(columns=["id"], errors="ignore").reset_index(drop=True)
+    keys = new["loan_account_number"].astype(str).str.strip()
+
+    if prev_df is None or prev_df.empty or "loan_account_number" not in prev_df.columns:
+        ids = np.arange(high_water + 1, high_water + len(new) + 1)
+        status = np.full(len(new), "new", dtype=object)
+        due_changed = np.ones(len(new), dtype=bool)
+        removed = pd.DataFrame(columns=["id", "loan_account_number", "language"])
+    else:
+        prev = prev_df.copy()
+        prev["loan_account_number"] = prev["loan_account_number"].astype(str).str.strip()
+        prev = prev.drop_duplicates("loan_account_number", keep="first")
+        prev_ids = pd.to_numeric(prev["id"], errors="coerce")
+        lookup = pd.DataFrame({
+            "loan_account_number": prev["loan_account_number"].to_numpy(),
+            "prev_id": prev_ids.to_numpy(),
+            "prev_hash": _profile_hash(prev).to_numpy(),
+            "prev_due": prev.get("due_date", pd.Series("", index=prev.index)).astype(str).to_numpy(),
+            "prev_language": prev.get("language", pd.Series("", index=prev.index)).astype(str).to_numpy(),
+        })
+        joined = pd.DataFrame({
+            "loan_account_number": keys,
+            "hash": _profile_hash(new).to_numpy(),
+        }).merge(lookup, on="loan_account_number", how="left")
+
+        is_new = joined["prev_id"].isna().to_numpy()
+        status = np.select(
+            [is_new, (joined["hash"] != joined["prev_hash"]).to_numpy()],
+            ["new", "changed"],
+            default="unchanged",
+        ).astype(object)
+        due_now = new.get("due_date", pd.Series("", index=new.index)).astype(str).to_numpy()
+        due_changed = is_new | (joined["prev_due"].astype(str).to_numpy() != due_now)
+
+        next_id = max(int(prev_ids.max()) if prev_ids.notna().any() else 0, high_water) + 1
+        ids = joined["prev_id"].to_numpy(copy=True)
+        ids[is_new] = np.arange(next_id, next_id + int(is_new.sum()))
+        ids = ids.astype("int64")
+
+        gone = ~prev["loan_account_number"].isin(set(keys))
+        removed = prev.loc[gone, ["id", "loan_account_number"]].assign(
+            language=prev.loc[gone].get("language", "")
+        )
+        new_lang = new.get("language", pd.Series("", index=new.index)).astype(str).str.strip().str.lower()
+        moved = ~is_new & (joined["prev_language"].astype(str).str.strip().str.lower().to_numpy() != new_lang.to_numpy())
+        removed = pd.concat([removed, pd.DataFrame({
+            "id": ids[moved],
+            "loan_account_number": keys[moved].to_numpy(),
+            "language": joined.loc[moved, "prev_language"].to_numpy(),
+        })], ignore_index=True)
+
+    new.insert(0, "id", ids)
+    now = time.time()
+    changes = pd.concat([
+        pd.DataFrame({
+            "id": ids.astype(str),
+            "loan_account_number": keys,
+            "language": new.get("language", ""),
+            "status": status,
+            "due_date_changed": due_changed,
+            "detected": np.where((status != "unchanged") | due_changed, now, np.nan),
+        }),
+        pd.DataFrame({
+            "id": removed["id"].astype(str),
+            "loan_account_number": removed["loan_account_number"],
+            "language": removed["language"],
+            "status": "removed",
+            "due_date_changed": False,
+            "detected": now,
+        }),
+    ], ignore_index=True)
+    return new, changes
+
+
+def _key(ids, languages):
+    return list(zip(pd.Series(ids).astype(str), pd.Series(languages).fillna("").astype(str).str.strip().str.lower()))
+
+
+def carry_forward(changes: pd.DataFrame, previous, final_kinds=FINAL_KINDS) -> tuple:
+    """Keep what the previous change set asked for that the stages haven't finished.
+
+    diff_masters compares against the previous master, not against what was
+    rendered, so preparing twice would otherwise turn a pending customer into
+    "unchanged". A pending row is carried (with its detection time) until one of
+    `final_kinds` was recorded for the customer after that time; a removal until
+    the index holds nothing for that (id, language). Returns (changes, rows carried).
+    """
+    if previous is None or previous.empty:
+        return changes, 0
+    changes = changes.copy()
+    previous = previous.copy()
+    previous["detected"] = previous["detected"].fillna(0.0)
+    changes_keys = _key(changes["id"], changes["language"])
+    row_of = {k: i for i, k in enumerate(changes_keys) if changes.at[i, "status"] != "removed"}
+    carried = 0
+
+    finished = artifact_index.recorded(final_kinds)
+    prev_todo = previous[previous["status"].isin(["new", "changed"]) | previous["due_date_changed"]]
+    for key, (_, prev) in zip(_key(prev_todo["id"], prev_todo["language"]), prev_todo.iterrows()):
+        i = row_of.get(key)
+        if i is None or finished.get(key, -np.inf) >= prev["detected"]:
+            continue                # gone (or moved language), or finished since
+        fresh = changes.at[i, "status"] != "unchanged" or changes.at[i, "due_date_changed"]
+        if changes.at[i, "status"] == "unchanged":
+            changes.at[i, "status"] = prev["status"]
+        changes.at[i, "due_date_changed"] = bool(changes.at[i, "due_date_changed"] or prev["due_date_changed"])
+        if not fresh:
+            changes.at[i, "detected"] = prev["detected"]
+        carried += 1
+
+    held = artifact_index.recorded(["*"])
+    removing = set(k for k, st in zip(changes_keys, changes["status"]) if st == "removed")
+    prev_gone = previous[previous["status"] == "removed"]
+    keep = [k not in row_of and k not in removing and k in held
+            for k in _key(prev_gone["id"], prev_gone["language"])]
+    if any(keep):
+        changes = pd.concat([changes, prev_gone[keep][changes.columns]], ignore_index=True)
+        carried += sum(keep)
+    return changes, carried
+
+
+def write_change_set(changes: pd.DataFrame, path=CHANGE_SET_CSV):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    changes.to_csv(path, index=False)
+
+
+def load_change_set(path=CHANGE_SET_CSV):
+    """The latest change set, or None when stages should process everyone."""
+    if FULL_RUN:
+        return None
+    return read_change_set(path)
+
+
+def read_change_set(path=CHANGE_SET_CSV):
+    """The change set file as written, or None when there is none."""
+    if not Path(path).exists():
+        return None
+    df = pd.read_csv(path, dtype=str).fillna("")
+    df["due_date_changed"] = df["due_date_changed"].str.lower() == "true"
+    df["detected"] = pd.to_numeric(df["detected"], errors="coerce") if "detected" in df.columns else np.nan
+    return df
+
+
+def pending_ids(changes, uses_due_date=True, kinds=None):
+    """Ids whose artifact must be re-rendered, or None meaning 'everyone'.
+
+    uses_due_date: the artifact shows the due date (EMI card, 2nd audio clip, final video).
+    kinds: the stage's output kinds (artifact_index GLOB patterns); a customer
+    with one of them recorded since the change was detected is done already.
+    """
+    if changes is None:
+        return None
+    todo = changes["status"].isin(["new", "changed"])
+    if uses_due_date:
+        todo |= (changes["status"] == "unchanged") & changes["due_date_changed"]
+    rows = changes.loc[todo]
+    if not kinds:
+        return set(rows["id"])
+    finished = artifact_index.recorded(kinds)
+    detected = pd.to_numeric(rows.get("detected"), errors="coerce").fillna(np.inf)
+    return {key[0] for key, since in zip(_key(rows["id"], rows["language"]), detected)
+            if finished.get(key, -np.inf) < since}
+
+
+def removed_customers(changes):
+    """[(id, language)] of customers that disappeared from the master since the last run."""
+    if changes is None:
+        return []
+    gone = changes[changes["status"] == "removed"]
+    return list(zip(gone["id"], gone["language"]))
+
+
+def summary(changes) -> str:
+    counts = changes["status"].value_counts()
+    return ", ".join(f"{k}={int(counts.get(k, 0))}" for k in ["new", "changed", "unchanged", "removed"])
@@ -1,28 +1,52 @@
-import subprocess
 from pathlib import Path
-import pandas as pd
+import os
 import re
 import sys
-import json
-from collections import defaultdict
+import shutil
+import artifact_index
+import customer_store
+import change_set
+import hls_output
+import media_worker
+import scheduler
+import instrumentation
+import profiling
+import verify_videos
 
 # ---------- CONFIG ----------
 ROOT = Path(".")
-DATA_CSV = ROOT / "data" / "customers_master.csv"
+DATA_CSV = customer_store.MASTER_CSV
 GENERATED = ROOT / "assets" / "generated"
 BASE_VIDEOS_DIR = ROOT / "assets" / "base_videos"
 STATIC_DIR = ROOT / "assets" / "static"
 OUTPUT_DIR = ROOT / "assets" / "generated_videos"
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+SHARED_DIR = OUTPUT_DIR / "shared"       # hls mode: base-video segments, once per language
+PERSONAL_DIR = OUTPUT_DIR / "personal"   # hls mode: each customer's overlay segments
 
 TSPEC = "c1=0:06-0:12, c2=0:12-0:21 , c3=0:23-0:47"
 
 FF_VCODEC = "libx264"
 FF_CRf = "20"
 FF_PRESET = "veryfast"
+# data/encoder_profile.json (main/calibrate_encoder.py) replaces the preset and moves the CRF by its offset
 FF_AUDIO_CODEC = "aac"
 FF_AUDIO_BITRATE = "128k"
 
+# Rendition ladder: "name=height:crf[:maxrate]" entries, e.g.
+#   VIDEO_RENDITIONS="720p=720:20, 360p=360:28:500k"
+# Each customer is composited once and split to one encoder per rendition,
+# written as {lang}_{id}_video_{name}.mp4. Empty = one full-size output as before.
+RENDITIONS_SPEC = os.getenv("VIDEO_RENDITIONS", "")
+
+# "mp4": one standalone file per customer.
+# "hls": {lang}_{id}_video.m3u8 playing the shared base segments, with only the
+#        segments under an overlay re-encoded per customer (single rendition).
+OUTPUT_MODE = os.getenv("VIDEO_OUTPUT_MODE", "mp4").lower()
+
+# "1": sample-check every batch right after it is rendered (see verify_videos.py);
+# failed outputs are moved to OUTPUT_DIR/rejected and not counted as done.
+VERIFY = os.getenv("VIDEO_VERIFY", "") == "1"
+
 # ---------- helpers ----------
 def parse_time_token(t):
     if not t:
@@ -64,163 +88,383 @@ def parse_tspec(spec):
     return out
 
 def get_video_dimensions(video_path: Path):
-    cmd = [
-        "ffprobe", "-v", "error",
-        "-select_streams", "v:0",
-        "-show_entries", "stream=width,height",
-        "-of", "json",
-        str(video_path)
-    ]
-    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    if proc.returncode != 0:
-        raise RuntimeError(proc.stderr.decode())
-    info = json.loads(proc.stdout.decode())
-    streams = info.get("streams") or []
-    if not streams:
-        raise RuntimeError("No video streams found")
-    w = int(streams[0]["width"])
-    h = int(streams[0]["height"])
-    return w, h
+    return media_worker.video_dimensions(video_path)
+
+def parse_renditions(spec):
+    out = []
+    for part in re.split(r'[,\n]+', spec):
+        if not part.strip() or '=' not in part:
+            continue
+        name, rest = part.split('=', 1)
+        fields = [f.strip() for f in rest.split(':')]
+        out.append({
+            "name": name.strip(),
+            "height": int(fields[0]) if fields[0] else None,
+            "crf": fields[1] if len(fields) > 1 and fields[1] else None,
+            "maxrate": fields[2] if len(fields) > 2 and fields[2] else None,
+        })
+    return out
 
 # ---------- parse tspec ----------
 slots = parse_tspec(TSPEC)
 c1_start, c1_end = slots.get("c1", (None, None))
 c2_start, c2_end = slots.get("c2", (None, None))
 c3_start, c3_end = slots.get("c3", (None, None))
+renditions = parse_renditions(RENDITIONS_SPEC)
 
-print(f"Using slots: c1={c1_start}-{c1_end}, c2={c2_start}-{c2_end}, c3={c3_start}-{c3_end}")
 
-# ---------- load customers ----------
-df = pd.read_csv(DATA_CSV, dtype=str).fillna("")
-rows = df.to_dict(orient="records")
-if not rows:
-    sys.exit("No rows found in CSV")
+def find_language_asset(directory: Path, lang: str, suffix: str, kind=None):
+    """Locate a language-level asset: from the artifact index when `kind` is given,
+    else (and on a miss, then recording it) by trying common casings of the language name."""
+    if kind:
+        found = artifact_index.lookup(artifact_index.LANGUAGE_LEVEL, lang, kind)
+        if found is not None:
+            return found
+    candidates = [
+        directory / f"{lang}{suffix}",
+        directory / f"{lang.capitalize()}{suffix}",
+        directory / f"{lang.lower()}{suffix}",
+        directory / f"{lang.upper()}{suffix}",
+    ]
+    found = next((c for c in candidates if c.exists()), None)
+    if kind and found is not None:
+        artifact_index.record(artifact_index.LANGUAGE_LEVEL, lang, kind, found)
+    return found
 
-# group by language (so we can reuse base video/static per language)
-by_lang = defaultdict(list)
-for r in rows:
-    lang = (r.get("language") or "english").strip()
-    by_lang[lang].append(r)
 
-# ---------- process each language group ----------
-for lang, recs in by_lang.items():
-    print(f"\nLanguage group: '{lang}' ({len(recs)} customers)")
+class MissingCards(RuntimeError):
+    """A customer's loan/EMI card is neither in the artifact index nor on disk."""
 
-    # locate base video (try common casings)
-    candidates = [
-        BASE_VIDEOS_DIR / f"{lang}.mp4",
-        BASE_VIDEOS_DIR / f"{lang.capitalize()}.mp4",
-        BASE_VIDEOS_DIR / f"{lang.lower()}.mp4",
-        BASE_VIDEOS_DIR / f"{lang.upper()}.mp4",
+
+def customer_card(id_, lang, part):
+    """Path of a customer's card from the index; on a miss, stat the path generate_cards writes
+    (cards written by a process that didn't record them, stale index) and record it."""
+    found = artifact_index.lookup(id_, lang, f"{part}_card")
+    if found is not None:
+        return found
+    path = GENERATED / f"{id_}_{part}.png"
+    if not path.exists():
+        return None
+    artifact_index.record(id_, lang, f"{part}_card", path)
+    return path
+
+
+def plan_customer(r, lang, static_card, pending=None):
+    """Work out one customer's output file and overlays; None when there is nothing to do.
+
+    Raises MissingCards when a card the slots need doesn't exist: a video
+    without the customer's cards is not a finished output.
+    """
+    id_raw = r.get("id") or ""
+    id_ = str(id_raw).strip()
+    if not id_:
+        print("  Skipping a row with empty id")
+        return None
+
+    # output file(s) per customer
+    outputs = output_specs(lang, id_)
+    if pending is not None and id_ not in pending and all(artifact_index.present(id_, lang, o["kind"]) for o in outputs):
+        print(f"  Customer id={id_} unchanged since last run; keeping {outputs[0]['file']}")
+        return None
+
+    # customer-specific overlays
+    overlays = []
+    loan_img = customer_card(id_, lang, "loan") if c1_start is not None else None
+    emi_img = customer_card(id_, lang, "emi") if c2_start is not None else None
+    missing = [part for part, img, start in (("loan", loan_img, c1_start), ("emi", emi_img, c2_start))
+               if start is not None and img is None]
+    if missing:
+        raise MissingCards(f"no {' or '.join(missing)} card for id={id_} ({lang}); run generate_cards.py first")
+
+    print(f"  Customer id={id_} ...")
+
+    if loan_img and c1_start is not None:
+        overlays.append({"img": str(loan_img), "start": c1_start, "end": c1_end})
+        print("    found loan overlay")
+    if emi_img and c2_start is not None:
+        overlays.append({"img": str(emi_img), "start": c2_start, "end": c2_end})
+        print("    found emi overlay")
+
+    # add language-level static c3 if present
+    if static_card and c3_start is not None:
+        overlays.append({"img": str(static_card), "start": c3_start, "end": c3_end})
+        print("    added static c3 card")
+
+    return {"id": id_, "overlays": overlays, "outputs": outputs, "send_by": r.get("send_by")}
+
+
+def copy_base_video(job, base_vid):
+    # If no overlays, the output is the base video itself: hard-link it, and only
+    # fall back to a stream copy when linking isn't possible (other filesystem)
+    out_file = job["outputs"][0]["file"]
+    out_file.unlink(missing_ok=True)
+    try:
+        os.link(base_vid, out_file)
+        print(f"    id={job['id']}: no overlays; linked base video: {out_file}")
+        return True
+    except OSError:
+        pass
+    print(f"    id={job['id']}: no overlays; copying base video to output (fast).")
+    cmd = ["ffmpeg", "-y", "-i", str(base_vid), "-c", "copy", str(out_file)]
+    code, err = media_worker.run_ffmpeg(cmd)
+    if code != 0:
+        print(f"    Failed to copy base video for id={job['id']}:")
+        print(err[:1000])
+        return False
+    print(f"    Wrote (copy): {out_file}")
+    return True
+
+
+def output_args(crf=None, maxrate=None):
+    """Encoder args; crf=None uses the calibrated/default CRF, a ladder rung passes its own."""
+    args = ["-c:v", FF_VCODEC] + media_worker.x264_args(FF_PRESET, FF_CRf)
+    if crf is not None:
+        args[args.index("-crf") + 1] = crf
+    if maxrate:
+        # capped CRF: quality target with a ceiling for small/mobile renditions
+        args += ["-maxrate", maxrate, "-bufsize", maxrate]
+    return args + [
+        "-c:a", FF_AUDIO_CODEC,
+        "-b:a", FF_AUDIO_BITRATE,
+    ]
+
+
+def output_specs(lang, id_):
+    if OUTPUT_MODE == "hls":
+        return [{"file": OUTPUT_DIR / f"{lang.lower()}_{id_}_video.m3u8", "height": None, "args": [],
+                 "kind": "video_hls"}]
+    if not renditions:
+        return [{"file": OUTPUT_DIR / f"{lang.lower()}_{id_}_video.mp4", "height": None, "args": output_args(),
+                 "kind": "video"}]
+    return [
+        {"file": OUTPUT_DIR / f"{lang.lower()}_{id_}_video_{r['name']}.mp4",
+         "height": r["height"], "args": output_args(r["crf"], r["maxrate"]), "kind": f"video_{r['name']}"}
+        for r in renditions
     ]
-    base_vid = next((c for c in candidates if c.exists()), None)
+
+
+def render_jobs(jobs, base_vid, vid_w, vid_h):
+    """Composite customers in batches: one ffmpeg process (one base decode) per batch.
+    Returns the ids whose output was written."""
+    # stream-copy only works for a single full-size output; a ladder still needs scaling
+    done = []
+    copy_jobs = [j for j in jobs if not j["overlays"] and not renditions]
+    for job in copy_jobs:
+        if copy_base_video(job, base_vid):
+            done.append(job["id"])
+
+    encode_jobs = [j for j in jobs if j not in copy_jobs]
+    for job in encode_jobs:
+        # an earlier no-overlay output may be a hard link to the base video;
+        # unlink so ffmpeg can't truncate the base through it
+        for out in job["outputs"]:
+            out["file"].unlink(missing_ok=True)
+    by_id = {j["id"]: j for j in encode_jobs}
+    for batch in media_worker.batches(encode_jobs):
+        results = media_worker.composite_batch(base_vid, (vid_w, vid_h), batch)
+        for id_, error in results.items():
+            if error:
+                print(f"    FFMPEG FAILED for id={id_}:")
+                # show a snippet of stderr for debugging
+                print(error)
+            else:
+                for out in by_id[id_]["outputs"]:
+                    print(f"    Wrote: {out['file']}")
+                done.append(id_)
+    return done
+
+
+def render_hls_jobs(jobs, lang, base_vid, vid_w, vid_h, shared):
+    """hls mode: encode only each customer's overlay span, then write their playlist."""
+    shared_uri = f"{SHARED_DIR.name}/{lang.lower()}"
+    boundaries = [s for _, s, _ in shared]
+    spans = {}
+    done = []
+    for job in jobs:
+        playlist = job["outputs"][0]["file"]
+        personal_dir = PERSONAL_DIR / f"{lang.lower()}_{job['id']}"
+        shutil.rmtree(personal_dir, ignore_errors=True)
+        span = hls_output.personal_span(shared, job["overlays"])
+        if span is None:
+            # nothing personal: the playlist is all shared segments
+            hls_output.write_playlist(playlist, [(f"{shared_uri}/init.mp4", f"{shared_uri}/{n}", d) for n, _, d in shared])
+            print(f"    id={job['id']}: no overlays; wrote shared-only playlist: {playlist}")
+            done.append(job["id"])
+            continue
+        personal_dir.mkdir(parents=True)
+        start = span[0]
+        spans.setdefault(span, []).append({
+            "id": job["id"],
+            "playlist": playlist,
+            "dir": personal_dir,
+            "windows": [(ov["start"], ov["end"]) for ov in job["overlays"]],
+            "overlays": [{"img": ov["img"], "start": max(0.0, ov["start"] - start), "end": ov["end"] - start}
+                         for ov in job["overlays"]],
+            "outputs": [{"file": personal_dir / "index.m3u8", "height": None,
+                         "args": output_args() + hls_output.hls_args(personal_dir, boundaries, start)}],
+        })
+
+    for (start, end), span_jobs in spans.items():
+        input_args = ["-ss", f"{start:.3f}", "-t", f"{end - start:.3f}"]
+        by_id = {j["id"]: j for j in span_jobs}
+        for batch in media_worker.batches(span_jobs):
+            results = media_worker.composite_batch(base_vid, (vid_w, vid_h), batch, input_args)
+            for id_, error in results.items():
+                if error:
+                    print(f"    FFMPEG FAILED for id={id_}:")
+                    print(error)
+                    continue
+                job = by_id[id_]
+                personal = hls_output.read_playlist(job["dir"] / "index.m3u8", offset=start)
+                personal_uri = f"{PERSONAL_DIR.name}/{job['dir'].name}"
+                pieces = hls_output.customer_pieces(shared, shared_uri, personal, personal_uri, job["windows"])
+                hls_output.write_playlist(job["playlist"], pieces)
+                hls_output.prune_personal(job["dir"], pieces)
+                print(f"    Wrote: {job['playlist']}")
+                done.append(id_)
+    return done
+
+
+def language_context(lang):
+    """Everything a language's customers share: base video, its size, static c3 card and,
+    in hls mode, the shared segments. None when the language can't be rendered."""
+    base_vid = find_language_asset(BASE_VIDEOS_DIR, lang, ".mp4", "base_video")
     if base_vid is None:
         print(f"  No base video found for language '{lang}', skipping all customers in this language.")
-        continue
+        return None
 
     try:
         vid_w, vid_h = get_video_dimensions(base_vid)
     except Exception as e:
         print(f"  Failed to probe base video: {e}")
-        continue
+        return None
 
     # static c3 card (language-level)
-    static_candidates = [
-        STATIC_DIR / f"{lang}_Card_3.jpg",
-        STATIC_DIR / f"{lang.capitalize()}_Card_3.jpg",
-        STATIC_DIR / f"{lang.lower()}_Card_3.jpg",
-        STATIC_DIR / f"{lang.upper()}_Card_3.jpg",
-    ]
-    static_card = next((c for c in static_candidates if c.exists()), None)
+    static_card = find_language_asset(STATIC_DIR, lang, "_Card_3.jpg", "static_card")
     if static_card:
         print(f"  Found static c3 card: {static_card}")
 
-    # ---------- per-customer processing ----------
-    for r in recs:
-        id_raw = r.get("id") or ""
-        id_ = str(id_raw).strip()
-        if not id_:
-            print("  Skipping a row with empty id")
+    shared, rebuilt = None, False
+    if OUTPUT_MODE == "hls":
+        windows = [w for w in slots.values() if w[0] is not None]
+        boundaries = hls_output.segment_boundaries(windows, media_worker.duration(base_vid))
+        try:
+            shared, rebuilt = hls_output.ensure_shared(base_vid, SHARED_DIR / lang.lower(), boundaries, output_args())
+        except RuntimeError as e:
+            print(f"  Failed to segment base video: {e}")
+            return None
+        # personal segments must line up with the shared ones, so a re-encode means re-rendering everyone
+        print(f"  Shared segments: {len(shared)} in {SHARED_DIR / lang.lower()}" + (" (re-encoded)" if rebuilt else ""))
+
+    return {"base_vid": base_vid, "size": (vid_w, vid_h), "static_card": static_card,
+            "shared": shared, "rebuilt": rebuilt}
+
+
+def render_for_language(jobs, lang, ctx):
+    vid_w, vid_h = ctx["size"]
+    if OUTPUT_MODE == "hls":
+        return render_hls_jobs(jobs, lang, ctx["base_vid"], vid_w, vid_h, ctx["shared"])
+    return render_jobs(jobs, ctx["base_vid"], vid_w, vid_h)
+
+
+def verify_batch(jobs, done, lang, ctx):
+    """The ids in `done` whose outputs pass the sampled check."""
+    if "reference" not in ctx:
+        ctx["reference"] = verify_videos.Reference(ctx["base_vid"], ctx["static_card"], slots)
+    passed = []
+    for job in jobs:
+        if job["id"] not in done:
             continue
+        failures = {path: problems for path, problems
+                    in verify_videos.verify_outputs(job["id"], job["outputs"], ctx["reference"], GENERATED).items()
+                    if problems}
+        for path, problems in failures.items():
+            print(f"    VERIFY FAILED for id={job['id']} ({path.name}): " + "; ".join(problems))
+            if path.exists():
+                verify_videos.reject(path, OUTPUT_DIR / "rejected")
+        instrumentation.count("verify_total", result="failed" if failures else "ok")
+        if not failures:
+            passed.append(job["id"])
+    return passed
 
-        print(f"  Customer id={id_} ...")
-
-        # customer-specific overlays
-        overlays = []
-        loan_img = GENERATED / f"{id_}_loan.png"
-        emi_img = GENERATED / f"{id_}_emi.png"
-
-        if loan_img.exists() and c1_start is not None:
-            overlays.append({"img": str(loan_img), "start": c1_start, "end": c1_end})
-            print("    found loan overlay")
-        if emi_img.exists() and c2_start is not None:
-            overlays.append({"img": str(emi_img), "start": c2_start, "end": c2_end})
-            print("    found emi overlay")
-
-        # add language-level static c3 if present
-        if static_card and c3_start is not None:
-            overlays.append({"img": str(static_card), "start": c3_start, "end": c3_end})
-            print("    added static c3 card")
-
-        # output file per customer
-        out_file = OUTPUT_DIR / f"{lang.lower()}_{id_}_video.mp4"
-
-        # If no overlays, just fast-copy the base video so every customer gets a file
-        if not overlays:
-            print("    No overlays for this customer; copying base video to output (fast).")
-            cmd = ["ffmpeg", "-y", "-i", str(base_vid), "-c", "copy", str(out_file)]
-            proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            if proc.returncode != 0:
-                print(f"    Failed to copy base video for id={id_}:")
-                print(proc.stderr.decode()[:1000])
-            else:
-                print(f"    Wrote (copy): {out_file}")
+
+def main():
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    print(f"Using slots: c1={c1_start}-{c1_end}, c2={c2_start}-{c2_end}, c3={c3_start}-{c3_end}")
+
+    # the video shows the EMI card, so a due-date change alone means a re-render
+    changes = change_set.load_change_set()
+    pending = change_set.pending_ids(changes, uses_due_date=True, kinds=["video*"])
+    for cid, lang in change_set.removed_customers(changes):
+        outputs = output_specs(lang, cid)
+        for out in outputs:
+            out["file"].unlink(missing_ok=True)
+        artifact_index.forget(cid, lang, [out["kind"] for out in outputs])
+        shutil.rmtree(PERSONAL_DIR / f"{lang.lower()}_{cid}", ignore_errors=True)
+    if OUTPUT_MODE == "hls" and renditions:
+        print("Rendition ladder is not used in hls mode; writing one full-size rendition.")
+
+    # ---------- load customers, one language partition at a time ----------
+    # (so we can reuse base video/static per language without regrouping every row)
+    seen_any = False
+    contexts, jobs_by_lang = {}, {}
+    for lang, df in customer_store.iter_language_groups(columns=["id", "due_on", "due_date"], csv_path=DATA_CSV):
+        if df.empty:
             continue
+        seen_any = True
+        recs = scheduler.prioritize(df).to_dict(orient="records")
+        lang = (lang or "english").strip()
+        print(f"\nLanguage group: '{lang}' ({len(recs)} customers)")
+
+        ctx = language_context(lang)
+        if ctx is None:
+            continue
+        lang_pending = None if ctx["rebuilt"] else pending   # new shared segments: re-render all
+
+        contexts[lang] = ctx
+        jobs, no_cards = [], 0
+        for r in recs:
+            try:
+                job = plan_customer(r, lang, ctx["static_card"], lang_pending)
+            except MissingCards as e:
+                print(f"  Skipping: {e}")
+                no_cards += 1
+                continue
+            if job:
+                jobs.append(job)
+        jobs_by_lang[lang] = jobs
+        instrumentation.count("skipped_total", len(recs) - len(jobs) - no_cards, reason="unchanged")
+        if no_cards:
+            instrumentation.count("skipped_total", no_cards, reason="no_cards")
+            print(f"⚠️ {no_cards} '{lang}' customer(s) skipped: cards missing")
+
+    # ---------- render, earliest send deadline first ----------
+    # each batch stays within one language (one base decode); batches from
+    # different languages are interleaved by their most urgent customer
+    all_jobs = [j for jobs in jobs_by_lang.values() for j in jobs]
+    tracker = scheduler.DeadlineTracker("video", [j["id"] for j in all_jobs], [j["send_by"] for j in all_jobs])
+    print(f"\n{tracker.forecast_summary()}")
+    for lang, batch in scheduler.interleave(jobs_by_lang, media_worker.BATCH_SIZE):
+        print(f"\nRendering {len(batch)} '{lang}' customer(s)")
+        with instrumentation.span("video.batch", language=lang, ids=[j["id"] for j in batch]) as sp, \
+                profiling.customer(f"{lang}-{batch[0]['id']}+{len(batch) - 1}"):
+            done = render_for_language(batch, lang, contexts[lang])
+            if VERIFY and done:
+                done = verify_batch(batch, done, lang, contexts[lang])
+            sp["done"] = len(done)
+        by_id = {j["id"]: j for j in batch}
+        artifact_index.record_many([(id_, lang, out["kind"], out["file"]) for id_ in done for out in by_id[id_]["outputs"]])
+        for id_ in done:
+            tracker.done(id_)
+    print(f"\nDeadlines: {tracker.summary()}")
+
+    if not seen_any:
+        sys.exit("No rows found in CSV")
+
+    print("\nAll done.")
+
 
-        # Build ffmpeg inputs: base video + per-overlay inputs
-        ff_inputs = [str(base_vid)] + [ov["img"] for ov in overlays]
-
-        # Build filter_complex; we will scale each overlay to video dims and overlay sequentially
-        filter_parts = []
-        last = "[0:v]"
-        tmp_idx = 0
-        input_idx = 1
-
-        for ov in overlays:
-            img_label = f"[{input_idx}:v]"
-            enable = f"between(t,{ov['start']},{ov['end']})"
-            filter_parts.append(f"{img_label}scale={vid_w}:{vid_h}[fg{tmp_idx}]")
-            filter_parts.append(f"{last}[fg{tmp_idx}]overlay=0:0:enable='{enable}'[tmp{tmp_idx}]")
-            last = f"[tmp{tmp_idx}]"
-            tmp_idx += 1
-            input_idx += 1
-
-        filter_complex = ";".join(filter_parts)
-
-        # Build ffmpeg command
-        cmd = ["ffmpeg", "-y"]
-        for inp in ff_inputs:
-            cmd += ["-i", inp]
-
-        cmd += [
-            "-filter_complex", filter_complex,
-            "-map", last,
-            "-map", "0:a?",
-            "-c:v", FF_VCODEC,
-            "-crf", FF_CRf,
-            "-preset", FF_PRESET,
-            "-c:a", FF_AUDIO_CODEC,
-            "-b:a", FF_AUDIO_BITRATE,
-            str(out_file)
-        ]
-
-        # run
-        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        if proc.returncode != 0:
-            print(f"    FFMPEG FAILED for id={id_}:")
-            # show a snippet of stderr for debugging
-            print(proc.stderr.decode()[:2000])
-        else:
-            print(f"    Wrote: {out_file}")
-
-print("\nAll done.")
+if __name__ == "__main__":
+    instrumentation.init("video")
+    with instrumentation.span("stage.video"), profiling.stage("video", focus="render_for_language"):
+        main()
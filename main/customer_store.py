@@ -0,0 +1,167 @@
+import json
+from pathlib import Path
+import pandas as pd
+import display_fields
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # columnar store is optional; everything falls back to the CSV
+    pa = None
+    pq = None
+
+# ---------- CONFIG ----------
+ROOT = Path(".")
+MASTER_CSV = ROOT / "data" / "customers_master.csv"
+
+# Typed columns stored in the columnar master. Anything not listed stays a string.
+INT_COLUMNS = ["id"]
+FLOAT_COLUMNS = ["loan_amount", "emi_amount"]   # sanctioned amounts can carry paise
+DATE_COLUMNS = ["due_on"]
+
+
+def dataset_dir(csv_path=MASTER_CSV) -> Path:
+    """Columnar copy of a master CSV lives next to it: data/customers_master/<Language>.parquet"""
+    csv_path = Path(csv_path)
+    return csv_path.with_suffix("")
+
+
+def _stamp_path(csv_path=MASTER_CSV) -> Path:
+    """Size and mtime of the CSV the partitions were written from."""
+    return dataset_dir(csv_path) / "_source.json"
+
+
+def _csv_stamp(csv_path):
+    st = Path(csv_path).stat()
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def has_dataset(csv_path=MASTER_CSV) -> bool:
+    """True when the parquet partitions exist and were written from the CSV as it is now.
+
+    A CSV edited or regenerated after the partitions (by hand, or with pyarrow
+    missing) no longer matches the stamp, and readers fall back to it.
+    """
+    if pq is None or not dataset_dir(csv_path).is_dir() or not any(dataset_dir(csv_path).glob("*.parquet")):
+        return False
+    if not Path(csv_path).exists():
+        return True
+    try:
+        return json.loads(_stamp_path(csv_path).read_text()) == _csv_stamp(csv_path)
+    except (OSError, ValueError):
+        return False
+
+
+def _typed(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    for col in INT_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int64")
+    for col in FLOAT_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+    if "due_date" in df.columns and "due_on" not in df.columns:
+        df["due_on"] = pd.to_datetime(df["due_date"], format="%d-%b-%Y", errors="coerce").dt.date
+    if "account_last4" in df.columns:
+        df["account_last4"] = display_fields.normalize_last4(df["account_last4"])
+    for col in df.columns:
+        if col not in INT_COLUMNS + FLOAT_COLUMNS + DATE_COLUMNS:
+            df[col] = df[col].fillna("").astype(str)
+    return df
+
+
+def write_master_dataset(df: pd.DataFrame, csv_path=MASTER_CSV) -> Path:
+    """Write the master as one parquet file per language with typed columns.
+
+    Call it after the CSV is saved: the partitions are stamped with its size and mtime.
+    """
+    if pq is None:
+        raise RuntimeError("pyarrow is not installed; cannot write the columnar master")
+    out_dir = dataset_dir(csv_path)
+    typed = _typed(df)      # before removing the old partitions, so a bad value leaves them in place
+    out_dir.mkdir(parents=True, exist_ok=True)
+    remove_master_dataset(csv_path)
+
+    for lang, group in typed.groupby("language", sort=False):
+        table = pa.Table.from_pandas(group.reset_index(drop=True), preserve_index=False)
+        pq.write_table(table, out_dir / f"{lang}.parquet")
+    if Path(csv_path).exists():
+        _stamp_path(csv_path).write_text(json.dumps(_csv_stamp(csv_path)))
+    return out_dir
+
+
+def remove_master_dataset(csv_path=MASTER_CSV):
+    out_dir = dataset_dir(csv_path)
+    if out_dir.is_dir():
+        _stamp_path(csv_path).unlink(missing_ok=True)
+        for old in out_dir.glob("*.parquet"):
+            old.unlink()
+
+
+def languages(csv_path=MASTER_CSV):
+    """Languages present in the master, without reading any rows when the columnar copy exists."""
+    if has_dataset(csv_path):
+        return sorted(p.stem for p in dataset_dir(csv_path).glob("*.parquet"))
+    df = pd.read_csv(csv_path, dtype=str, usecols=["language"]).fillna("")
+    return list(dict.fromkeys(df["language"].str.strip()))
+
+
+def _read_partition(path: Path, columns=None) -> pd.DataFrame:
+    if columns is not None:
+        available = set(pq.read_schema(path).names)
+        columns = [c for c in columns if c in available]
+    table = pq.read_table(path, columns=columns, memory_map=True)
+    df = table.to_pandas()
+    for col in df.columns:
+        if df[col].dtype == object and col not in DATE_COLUMNS:
+            df[col] = df[col].fillna("")
+    return df
+
+
+def _read_csv(csv_path) -> pd.DataFrame:
+    df = pd.read_csv(csv_path, dtype=str).fillna("")
+    if not display_fields.has_display_columns(df):
+        # older masters: fill the display strings once here rather than per row downstream
+        df = display_fields.add_display_columns(df)
+    return df
+
+
+def read_customers(language=None, columns=None, csv_path=MASTER_CSV) -> pd.DataFrame:
+    """Load customers, optionally a single language and a subset of columns.
+
+    Reads the memory-mapped parquet partition when present, otherwise parses the CSV.
+    """
+    if has_dataset(csv_path):
+        parts = dataset_dir(csv_path)
+        if language is not None:
+            path = parts / f"{language}.parquet"
+            if not path.exists():
+                matches = [p for p in parts.glob("*.parquet") if p.stem.lower() == str(language).lower()]
+                if not matches:
+                    return pd.DataFrame(columns=columns or [])
+                path = matches[0]
+            return _read_partition(path, columns)
+        frames = [_read_partition(p, columns) for p in sorted(parts.glob("*.parquet"))]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns or [])
+
+    df = _read_csv(csv_path)
+    if language is not None:
+        df = df[df["language"].str.strip().str.lower() == str(language).lower()]
+    if columns is not None:
+        df = df[[c for c in columns if c in df.columns]]
+    return df.reset_index(drop=True)
+
+
+def iter_language_groups(columns=None, csv_path=MASTER_CSV):
+    """Yield (language, DataFrame) per language, reading one partition at a time."""
+    if has_dataset(csv_path):
+        for lang in languages(csv_path):
+            yield lang, read_customers(lang, columns, csv_path)
+        return
+
+    df = _read_csv(csv_path)
+    langs = df["language"].str.strip().replace("", "english")
+    if columns is not None:
+        df = df[[c for c in columns if c in df.columns]]
+    for lang, group in df.groupby(langs, sort=False):
+        yield lang, group.reset_index(drop=True)
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+
+# Display-ready columns are computed once per batch here, column at a time,
+# so card and audio renderers only ever read finished strings.
+DISPLAY_COLUMNS = [
+    "loan_amount_fmt", "emi_amount_fmt",    # cards: '₹3,000,000'
+    "loan_amount_num", "emi_amount_num",    # speech: '3,000,000' (templates say "rupees" themselves)
+    "due_date_local", "account_last4",
+]
+
+MONTH_NAMES = {
+    "english": ["January", "February", "March", "April", "May", "June",
+                "July", "August", "September", "October", "November", "December"],
+    "hindi":   ["जनवरी", "फ़रवरी", "मार्च", "अप्रैल", "मई", "जून",
+                "जुलाई", "अगस्त", "सितम्बर", "अक्टूबर", "नवम्बर", "दिसम्बर"],
+    "tamil":   ["ஜனவரி", "பிப்ரவரி", "மார்ச்", "ஏப்ரல்", "மே", "ஜூன்",
+                "ஜூலை", "ஆகஸ்ட்", "செப்டம்பர்", "அக்டோபர்", "நவம்பர்", "டிசம்பர்"],
+    "telugu":  ["జనవరి", "ఫిబ్రవరి", "మార్చి", "ఏప్రిల్", "మే", "జూన్",
+                "జూలై", "ఆగస్టు", "సెప్టెంబర్", "అక్టోబర్", "నవంబర్", "డిసెంబర్"],
+    "kannada": ["ಜನವರಿ", "ಫೆಬ್ರವರಿ", "ಮಾರ್ಚ್", "ಏಪ್ರಿಲ್", "ಮೇ", "ಜೂನ್",
+                "ಜುಲೈ", "ಆಗಸ್ಟ್", "ಸೆಪ್ಟೆಂಬರ್", "ಅಕ್ಟೋಬರ್", "ನವೆಂಬರ್", "ಡಿಸೆಂಬರ್"],
+}
+
+
+def format_rupees(values: pd.Series, symbol: str = "₹") -> pd.Series:
+    """'3000000' / '54061.00' -> '₹3,000,000' / '₹54,061' (truncated, comma-grouped).
+
+    Values that are not numbers are passed through unchanged (empty stays empty).
+    """
+    raw = values.fillna("").astype(str)
+    nums = pd.to_numeric(raw.str.strip(), errors="coerce")
+    ok = nums.notna() & np.isfinite(nums)
+    ints = np.trunc(nums[ok]).astype("int64").astype(str)
+    grouped = symbol + ints.str.replace(r"\B(?=(\d{3})+(?!\d))", ",", regex=True)
+    out = raw.copy()
+    out[ok] = grouped
+    return out
+
+
+def localize_due_date(due_dates: pd.Series, languages: pd.Series) -> pd.Series:
+    """'05-Dec-2025' -> '05 दिसम्बर 2025' using each row's language (English for unknown ones)."""
+    parsed = pd.to_datetime(due_dates, format="%d-%b-%Y", errors="coerce")
+    day = parsed.dt.strftime("%d")
+    year = parsed.dt.strftime("%Y")
+    month_idx = parsed.dt.month.fillna(1).astype("int64").to_numpy() - 1
+    langs = languages.fillna("").astype(str).str.strip().str.lower()
+
+    out = due_dates.fillna("").astype(str).copy()
+    for lang in langs.unique():
+        names = np.asarray(MONTH_NAMES.get(lang, MONTH_NAMES["english"]), dtype=object)
+        mask = ((langs == lang) & parsed.notna()).to_numpy()
+        out[mask] = day[mask] + " " + names[month_idx[mask]] + " " + year[mask]
+    return out
+
+
+def normalize_last4(values: pd.Series) -> pd.Series:
+    """Account digits as a 4-character string; CSV parsing turns '0123' into 123 or '123.0'."""
+    digits = values.fillna("").astype(str).str.strip().str.replace(r"\.0$", "", regex=True)
+    return digits.where(digits == "", digits.str.zfill(4))
+
+
+def add_display_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Return a copy of df with the DISPLAY_COLUMNS filled in."""
+    df = df.copy()
+    empty = pd.Series("", index=df.index)
+    loan = df["loan_amount"] if "loan_amount" in df.columns else empty
+    emi = df["emi_amount"] if "emi_amount" in df.columns else empty
+    emi = emi.where(emi.fillna("").astype(str).str.strip() != "", loan)
+
+    df["loan_amount_fmt"] = format_rupees(loan)
+    df["emi_amount_fmt"] = format_rupees(emi)
+    df["loan_amount_num"] = format_rupees(loan, symbol="")
+    df["emi_amount_num"] = format_rupees(emi, symbol="")
+    if "due_date" in df.columns:
+        df["due_date_local"] = localize_due_date(df["due_date"], df.get("language", empty))
+    else:
+        df["due_date_local"] = ""
+    if "account_last4" in df.columns:
+        df["account_last4"] = normalize_last4(df["account_last4"])
+    return df
+
+
+def has_display_columns(df: pd.DataFrame) -> bool:
+    return all(c in df.columns for c in DISPLAY_COLUMNS)
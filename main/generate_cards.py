@@ -1,65 +1,187 @@
-import pandas as pd
+from __future__ import annotations
+
 from pathlib import Path
-from PIL import Image, ImageDraw, ImageFont
-import requests, logging, sys, traceback
+import logging, sys, traceback, os, atexit, zlib, json, hashlib
+import logging.handlers
+import multiprocessing
+import queue
+from functools import lru_cache
+import artifact_index
+import instrumentation
+import profiling
+
+# Importing this module is kept cheap (workers, the render service and one-off
+# invocations all pay for it): no network, no directories or log files created,
+# and PIL / pandas / requests are imported where they are first used.
 
 ROOT = Path(".")
 ASSETS = ROOT / "assets"
 TEMPLATES = ASSETS / "templates"
 GENERATED = ASSETS / "generated"
 FONTS = ASSETS / "fonts"
+FONT_MANIFEST = FONTS / "manifest.json"   # {lang: {"file", "sha256", "url"}}
 LOG_PATH = ROOT / "logs" / "card_generation.log"
+LOG_LEVEL = os.getenv("CARDS_LOG_LEVEL", "INFO").upper()
+# Per-customer INFO lines ("Processing", "Wrote final ... image") are kept for
+# 1 in CARDS_LOG_SAMPLE customers (0 = none). Warnings, errors and run summaries
+# are never sampled out.
+LOG_SAMPLE = int(os.getenv("CARDS_LOG_SAMPLE", "1"))
+# >1 renders cards in that many worker processes; their log records travel
+# over one multiprocessing queue to the single writer in the parent.
+WORKERS = int(os.getenv("CARD_WORKERS", "1"))
+# Customers per block for the batched NumPy compositor (see composite_cards);
+# 1 draws every card on its own with ImageDraw.
+BATCH_SIZE = int(os.getenv("CARD_BATCH_SIZE", "64"))
 
+logger = logging.getLogger("cards")
+_listener = None
 
-for d in [TEMPLATES, GENERATED, FONTS, LOG_PATH.parent]:
-    d.mkdir(parents=True, exist_ok=True)
 
-logging.basicConfig(filename=LOG_PATH, level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
-logger = logging.getLogger("cards")
-console = logging.StreamHandler(sys.stdout)
-console.setLevel(logging.INFO)
-logger.addHandler(console)
-
-FONT_URLS = {
-    "english": ("NotoSans-Regular.ttf", "https://github.com/googlefonts/noto-fonts/raw/main/hinted/ttf/NotoSans/NotoSans-Regular.ttf"),
-    "hindi":   ("NotoSansDevanagari-Regular.ttf", "https://github.com/googlefonts/noto-fonts/raw/main/hinted/ttf/NotoSansDevanagari/NotoSansDevanagari-Regular.ttf"),
-    "tamil":   ("NotoSansTamil-Regular.ttf", "https://github.com/googlefonts/noto-fonts/raw/main/hinted/ttf/NotoSansTamil/NotoSansTamil-Regular.ttf"),
-    "telugu":  ("NotoSansTelugu-Regular.ttf", "https://github.com/googlefonts/noto-fonts/raw/main/hinted/ttf/NotoSansTelugu/NotoSansTelugu-Regular.ttf"),
-    "kannada": ("NotoSansKannada-Regular.ttf", "https://github.com/googlefonts/noto-fonts/raw/main/hinted/ttf/NotoSansKannada/NotoSansKannada-Regular.ttf"),
-}
+class CustomerSampler(logging.Filter):
+    """Keep per-customer records (those logged with extra={"customer": id}) for 1 in `every`
+    customers, chosen by id so a kept customer keeps all of its lines. Anything at WARNING
+    or above, and any record without a customer, always passes."""
+
+    def __init__(self, every=LOG_SAMPLE):
+        super().__init__()
+        self.every = every
+
+    def filter(self, record):
+        cid = getattr(record, "customer", None)
+        if cid is None or record.levelno >= logging.WARNING:
+            return True
+        if self.every <= 0:
+            return False
+        return self.every == 1 or zlib.crc32(str(cid).encode()) % self.every == 0
+
+
+def _init_worker(log_queue):
+    """Pool worker start-up: queued logging, and no copy of the parent's metric totals."""
+    _queue_logging(log_queue)
+    instrumentation.drain()
+
+
+def _queue_logging(log_queue):
+    """Route the cards logger through a QueueHandler: callers only enqueue, never write."""
+    handler = logging.handlers.QueueHandler(log_queue)
+    handler.addFilter(CustomerSampler())
+    logger.handlers = [handler]
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+
+def _stop_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
 
-def download_font(fname, url):
-    p = FONTS / fname
-    if p.exists():
-        logger.debug(f"Font exists: {p}")
-        return p
+def setup_logging(log_queue=None):
+    """Start the background writer (file + stdout) and point the cards logger at its queue.
+
+    Pass a multiprocessing queue when worker processes log too; a previous
+    listener is drained and stopped first, so records are written exactly once.
+    """
+    global _listener
+    _stop_logging()
+    LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+    fmt = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
+    file_handler = logging.FileHandler(LOG_PATH, encoding="utf-8")
+    file_handler.setFormatter(fmt)
+    console = logging.StreamHandler(sys.stdout)
+
+    log_queue = log_queue if log_queue is not None else queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, console)
+    _listener.start()
+    _queue_logging(log_queue)
+
+
+atexit.register(_stop_logging)
+
+
+def init():
+    """Process setup for a run: output/log directories and the logging pipeline."""
+    for d in [TEMPLATES, GENERATED, FONTS, LOG_PATH.parent]:
+        d.mkdir(parents=True, exist_ok=True)
+    setup_logging()
+
+
+@lru_cache(maxsize=1)
+def font_manifest():
     try:
-        logger.info(f"Downloading font {fname} ...")
-        r = requests.get(url, timeout=30); r.raise_for_status()
-        p.write_bytes(r.content)
-        logger.info(f"Saved font to {p}")
-        return p
-    except Exception as e:
-        logger.exception(f"Failed to download {fname}: {e}")
+        return json.loads(FONT_MANIFEST.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        logger.error(f"Cannot read font manifest {FONT_MANIFEST}: {e}; using PIL's default font")
+        return {}
+
+def _sha256(path: Path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def verified_font(key: str):
+    """Local font file for a manifest entry, or None if it is missing or fails its checksum."""
+    entry = font_manifest().get(key)
+    if not entry:
+        return None
+    p = FONTS / entry["file"]
+    if not p.exists():
+        logger.warning(f"Font {p} ({key}) is missing; run generate_cards.py --fetch-fonts")
         return None
+    if _sha256(p) != entry["sha256"]:
+        logger.warning(f"Font {p} ({key}) does not match its manifest checksum; not using it")
+        return None
+    return p
 
-FONT_PATHS = {}
-for key,(fname,url) in FONT_URLS.items():
-    FONT_PATHS[key] = download_font(fname, url)
+@lru_cache(maxsize=None)
+def font_path(lang: str):
+    """Resolved on first use (once per language): the language's font, else the English one."""
+    key = (lang or "english").lower()
+    return verified_font(key) or (verified_font("english") if key != "english" else None)
+
+def fetch_fonts():
+    """Download fonts from the manifest that are missing or damaged; the only network access here."""
+    import requests
+
+    ok = True
+    for key, entry in font_manifest().items():
+        p = FONTS / entry["file"]
+        if p.exists() and _sha256(p) == entry["sha256"]:
+            logger.debug(f"Font exists: {p}")
+            continue
+        try:
+            logger.info(f"Downloading font {entry['file']} ...")
+            r = requests.get(entry["url"], timeout=30); r.raise_for_status()
+            if hashlib.sha256(r.content).hexdigest() != entry["sha256"]:
+                raise ValueError("downloaded file does not match the manifest checksum")
+            part = p.with_suffix(p.suffix + ".part")
+            part.write_bytes(r.content)
+            os.replace(part, p)
+            logger.info(f"Saved font to {p}")
+        except Exception as e:
+            ok = False
+            logger.error(f"Failed to fetch font {entry['file']} for {key}: {e}")
+    return ok
 
 def load_truetype(path: Path, size: int):
+    from PIL import ImageFont
+
+    if path is None:   # already reported by verified_font
+        return ImageFont.load_default()
     try:
-        if path is None:
-            raise RuntimeError("font path is None")
         return ImageFont.truetype(str(path), size)
     except Exception:
         logger.exception(f"Could not load TTF {path} at size {size}; falling back to default font")
         return ImageFont.load_default()
 
+@lru_cache(maxsize=None)
 def get_font_for_lang(lang: str, size: int):
-    key = (lang or "english").lower()
-    path = FONT_PATHS.get(key) or FONT_PATHS.get("english")
-    return load_truetype(path, size)
+    return load_truetype(font_path(lang), size)
 
 TEMPLATE_MAP = {
     "hindi":   ["Hindi_Card_1.jpg", "Hindi_Card_2.jpg"],
@@ -69,11 +191,16 @@ TEMPLATE_MAP = {
     "english": ["English_Card_1.jpg", "English_Card_2.jpg"],
 }
 
-def fmt_cur(v):
-    try:
-        return f"₹{int(float(v)):,}"
-    except Exception:
-        return str(v or "")
+@lru_cache(maxsize=16)
+def _decoded_template(path: Path, mtime: float):
+    from PIL import Image
+
+    return Image.open(path).convert("RGBA")
+
+def load_template(name: str):
+    """Decoded RGBA template, read from disk once; callers draw on their own copy."""
+    p = TEMPLATES / name
+    return _decoded_template(p, p.stat().st_mtime).copy()
 
 def draw_text_with_outline(draw: ImageDraw.Draw, xy, text, font, fill, stroke_width=1, stroke_fill=(0,0,0)):
     try:
@@ -83,71 +210,56 @@ def draw_text_with_outline(draw: ImageDraw.Draw, xy, text, font, fill, stroke_wi
             draw.text((xy[0]+dx, xy[1]+dy), text, font=font, fill=stroke_fill)
         draw.text(xy, text, font=font, fill=fill)
 
-def draw_text_auto_fit(draw: ImageDraw.Draw, text, x, y, max_width, size=34, anchor="lt", fill=(0,0,153)):
-    text = str(text or "").strip()
-    if not text:
-        return None, None
+@lru_cache(maxsize=8192)
+def fit_text(text: str, size: int, max_width: int, anchor="lt"):
+    """(font size, text) that fits max_width: shrink by 2 down to 10, then truncate with an ellipsis.
+
+    Depends only on the text and the box, so repeated values (dates, IFSC
+    codes, common amounts) are fitted once per process.
+    """
+    def width(s, font):
+        bbox = font.getbbox(s, "L", anchor=anchor)   # what ImageDraw.textbbox measures on RGBA
+        return bbox[2] - bbox[0]
 
     current_size = size
     while True:
         font = get_font_for_lang("english", current_size)  # force english font for dynamic fields
-        bbox = draw.textbbox((x,y), text, font=font, anchor=anchor)
-        width = bbox[2] - bbox[0]
-        if width <= max_width or current_size <= 10:
+        if width(text, font) <= max_width or current_size <= 10:
             break
         current_size -= 2
 
-    font = get_font_for_lang("english", current_size)
-    bbox = draw.textbbox((x,y), text, font=font, anchor=anchor)
-    if bbox[2] - bbox[0] > max_width:
+    if width(text, font) > max_width:
         lo, hi = 0, len(text)
         fit = text
         while lo <= hi:
             mid = (lo + hi) // 2
             cand = text[:mid] + ("…" if mid < len(text) else "")
-            bbox = draw.textbbox((x,y), cand, font=font, anchor=anchor)
-            if bbox[2] - bbox[0] <= max_width:
+            if width(cand, font) <= max_width:
                 fit = cand
                 lo = mid + 1
             else:
                 hi = mid - 1
         text = fit
+    return current_size, text
 
+def draw_text_auto_fit(draw: ImageDraw.Draw, text, x, y, max_width, size=34, anchor="lt", fill=(0,0,153)):
+    text = str(text or "").strip()
+    if not text:
+        return None, None
+
+    font_size, text = fit_text(text, size, max_width, anchor)
+    font = get_font_for_lang("english", font_size)
     draw_text_with_outline(draw, (x,y), text, font=font, fill=fill, stroke_width=1, stroke_fill=(0,0,0))
     return font, text
 
-def generate_for_row(row):
-    cid = row.get("id", "unknown")
-    lang = (row.get("language") or "hindi").lower().strip()
-    logger.info(f"Processing id={cid} lang={lang}")
-
-    templates = TEMPLATE_MAP.get(lang) or TEMPLATE_MAP.get("english")
-    if not templates or len(templates) < 2:
-        logger.error(f"Templates for {lang} not defined correctly in TEMPLATE_MAP")
-        return
-
-    for t in templates[:2]:
-        p = TEMPLATES / t
-        if not p.exists():
-            logger.error(f"Missing template {p} for id={cid}; SKIPPING this row")
-            return
-
-    name = row.get("name") or ""
-    loan_account = row.get("loan_account_number") or ""
-    loan_amount = fmt_cur(row.get("loan_amount") or "")
-    emi_amount_raw = row.get("emi_amount") or row.get("loan_amount") or ""
-    emi_amount = fmt_cur(emi_amount_raw)
-    due_date = row.get("due_date") or ""
-    ifsc = row.get("ifsc") or ""
-    account_last4 = row.get("account_last4") or ""
-
-    try:
-        img = Image.open(TEMPLATES / templates[0]).convert("RGBA")
-    except Exception as e:
-        return
-    w, h = img.size
-    draw = ImageDraw.Draw(img, "RGBA")
+# ---------- card layouts ----------
+# One entry per dynamic field: (text, x, y, max_width, start size). Boxes are
+# fractions of the template size, so every language's template shares them.
+CARD_FILL = {"loan": (0,0,151), "emi": (0,0,153)}
+CARD_TEMPLATE_INDEX = {"loan": 0, "emi": 1}
+STROKE_FILL = (0,0,0)
 
+def loan_fields(row, w, h):
     name_box_w = int(w * 0.60)
     name_box_h = int(h * 0.52)
     name_box_left = int(w * 0.15)
@@ -155,7 +267,6 @@ def generate_for_row(row):
 
     acct_box_left = int(w * 0.43)
     acct_box_top = int(h * 0.62)
-    acct_box_w = int(w * 0.30)
 
     loan_box_left = acct_box_left
     loan_box_top = int(h * 0.75)
@@ -163,80 +274,309 @@ def generate_for_row(row):
 
     cx = name_box_left + name_box_w // 2
     cy = name_box_top + name_box_h // 2
-    draw_text_auto_fit(draw, name, cx, cy, max_width=name_box_w,
-                       size=max(20, int(h*0.07)), anchor="lt", fill=(0,0,151))
-
-    draw_text_auto_fit(
-    draw,
-    loan_account,
-    acct_box_left + 6,
-    acct_box_top ,
-    max_width=name_box_w,
-    size=max(20, int(h * 0.02)), 
-    anchor="lt",
-    fill=(0,0,151)
-)
-    draw_text_auto_fit(draw, loan_amount, loan_box_left + 6, loan_box_top + 6,
-                       max_width=loan_box_w - 12, size=max(16, int(h*0.08)), anchor="lt", fill=(0,0,151))
-
-    loan_path = GENERATED / f"{cid}_loan.png"
-    img.save(loan_path)
-    logger.info(f"Wrote final loan image: {loan_path}")
-
-    try:
-        img2 = Image.open(TEMPLATES / templates[1]).convert("RGBA")
-    except Exception as e:
-        logger.exception(f"Failed to open template {templates[1]}: {e}")
-        return
-    w2, h2 = img2.size
-    draw2 = ImageDraw.Draw(img2, "RGBA")
-
+    return [
+        (row.get("name") or "", cx, cy, name_box_w, max(20, int(h*0.07))),
+        (row.get("loan_account_number") or "", acct_box_left + 6, acct_box_top, name_box_w, max(20, int(h * 0.02))),
+        # amounts arrive pre-formatted from display_fields (₹ + grouping, EMI falls back to loan amount)
+        (row.get("loan_amount_fmt") or "", loan_box_left + 6, loan_box_top + 6, loan_box_w - 12, max(16, int(h*0.08))),
+    ]
+
+def emi_fields(row, w2, h2):
     emi_box_left = int(w2 * 0.45)
     emi_box_top = int(h2 * 0.38)
     emi_box_w = int(w2 * 0.30)
-    emi_box_h = max(28, int(h2 * 0.20))
 
-    due_box_left = emi_box_left
     due_box_top = int(h2 * 0.52)
-    due_box_w = emi_box_w
-    due_box_h = max(20, int(h2 * 0.12))
-
-    ifsc_box_left = emi_box_left
     ifsc_box_top = int(h2 * 0.68)
-    ifsc_box_w = emi_box_w
-    ifsc_box_h = max(20, int(h2 * 0.12))
-
-    acc4_box_left = emi_box_left
     acc4_box_top = int(h2 * 0.79)
     acc4_box_w = int(w2 * 0.48)
-    acc4_box_h = max(20, int(h2 * 0.12))
 
-    draw_text_auto_fit(draw2, emi_amount, emi_box_left + 8, emi_box_top + 8,
-                       max_width=emi_box_w - 16, size=max(12,int(h2*0.08)), anchor="lt", fill=(0,0,153))
-    draw_text_auto_fit(draw2, due_date, due_box_left + 8, due_box_top + 6,
-                       max_width=due_box_w - 16, size=max(12,int(h2*0.08)), anchor="lt", fill=(0,0,153))
-    draw_text_auto_fit(draw2, ifsc, ifsc_box_left + 8, ifsc_box_top + 6,
-                       max_width=ifsc_box_w - 16, size=max(12,int(h2*0.08)), anchor="lt", fill=(0,0,153))
-    draw_text_auto_fit(draw2, account_last4, acc4_box_left + 8, acc4_box_top + 6,
-                       max_width=acc4_box_w - 12, size=max(12,int(h2*0.08)), anchor="lt", fill=(0,0,153))
+    size = max(12, int(h2*0.08))
+    return [
+        (row.get("emi_amount_fmt") or "", emi_box_left + 8, emi_box_top + 8, emi_box_w - 16, size),
+        (row.get("due_date") or "", emi_box_left + 8, due_box_top + 6, emi_box_w - 16, size),
+        (row.get("ifsc") or "", emi_box_left + 8, ifsc_box_top + 6, emi_box_w - 16, size),
+        (row.get("account_last4") or "", emi_box_left + 8, acc4_box_top + 6, acc4_box_w - 12, size),
+    ]
+
+CARD_FIELDS = {"loan": loan_fields, "emi": emi_fields}
+
+def card_templates(cid, lang):
+    """The language's [loan, emi] template names, or None (logged) when they can't be used."""
+    templates = TEMPLATE_MAP.get(lang) or TEMPLATE_MAP.get("english")
+    if not templates or len(templates) < 2:
+        logger.error(f"Templates for {lang} not defined correctly in TEMPLATE_MAP")
+        return None
+
+    for t in templates[:2]:
+        p = TEMPLATES / t
+        if not p.exists():
+            logger.error(f"Missing template {p} for id={cid}; SKIPPING this row")
+            return None
+    return templates
+
+def generate_for_row(row, parts=("loan", "emi")):
+    """Draw the requested cards for one customer; returns {part: path} of what was written."""
+    from PIL import ImageDraw
+
+    written = {}
+    cid = row.get("id", "unknown")
+    lang = (row.get("language") or "hindi").lower().strip()
+    logger.info(f"Processing id={cid} lang={lang}", extra={"customer": cid})
+
+    templates = card_templates(cid, lang)
+    if templates is None:
+        return written
+
+    for part in ("loan", "emi"):
+        if part not in parts:
+            continue
+        template = templates[CARD_TEMPLATE_INDEX[part]]
+        try:
+            img = load_template(template)
+        except Exception as e:
+            logger.exception(f"Failed to open template {template}: {e}")
+            return written
+        w, h = img.size
+        draw = ImageDraw.Draw(img, "RGBA")
+        for text, x, y, max_width, size in CARD_FIELDS[part](row, w, h):
+            draw_text_auto_fit(draw, text, x, y, max_width=max_width, size=size, anchor="lt", fill=CARD_FILL[part])
+
+        out = GENERATED / f"{cid}_{part}.png"
+        img.save(out)
+        logger.info(f"Wrote final {'loan' if part == 'loan' else 'EMI'} image: {out}", extra={"customer": cid})
+        written[part] = out
+    artifact_index.record_many([(cid, lang, f"{part}_card", out) for part, out in written.items()])
+    return written
+
+# ---------- batched compositor ----------
+@lru_cache(maxsize=8192)
+def text_layer(text: str, font_size: int):
+    """Coverage masks of fitted text with its 1 px outline, drawn once per (text, size).
+
+    Returns (dx, dy, outline, fill): float32 0..1 arrays and their offset from
+    the text origin (ImageDraw's default "la" anchor), i.e. what
+    draw_text_with_outline would paint.
+    """
+    import numpy as np
+    from PIL import Image, ImageDraw
+
+    font = get_font_for_lang("english", font_size)
+    l, t, r, b = font.getbbox(text, "L", stroke_width=1)
+    masks = []
+    for stroke in (1, 0):
+        mask = Image.new("L", (max(1, r - l), max(1, b - t)))
+        ImageDraw.Draw(mask).text((-l, -t), text, font=font, fill=255,
+                                  stroke_width=stroke, stroke_fill=255)
+        masks.append(np.asarray(mask, dtype=np.float32) / 255)
+    return l, t, masks[0], masks[1]
+
+def composite_cards(template: str, part: str, entries):
+    """Draw one template's cards for a block of customers in one NumPy pass.
+
+    entries: [(cid, fields, out_path)]. All cards start as copies of the decoded
+    template in one preallocated array. Each customer's text masks go into
+    outline/fill coverage planes that span only the rows and columns the fields
+    touch. One alpha blend over that band paints every card (outline first,
+    then fill, like ImageDraw), and then each slice is PNG-encoded.
+    """
+    import numpy as np
+    from PIL import Image
+
+    p = TEMPLATES / template
+    base = np.asarray(_decoded_template(p, p.stat().st_mtime))
+    h, w = base.shape[:2]
+
+    placed = []   # (card index, x, y, outline, fill), clipped to the card
+    for n, (_, fields, _) in enumerate(entries):
+        for text, x, y, max_width, size in fields:
+            text = str(text or "").strip()
+            if not text:
+                continue
+            font_size, fitted = fit_text(text, size, max_width)
+            dx, dy, outline, fill = text_layer(fitted, font_size)
+            x0, y0 = x + dx, y + dy
+            cx0, cy0 = max(0, -x0), max(0, -y0)
+            cx1, cy1 = min(outline.shape[1], w - x0), min(outline.shape[0], h - y0)
+            if cx1 > cx0 and cy1 > cy0:
+                placed.append((n, x0 + cx0, y0 + cy0, outline[cy0:cy1, cx0:cx1], fill[cy0:cy1, cx0:cx1]))
+
+    cards = np.empty((len(entries), h, w, base.shape[2]), dtype=np.uint8)
+    cards[:] = base
+    if placed:
+        bx0 = min(x for _, x, _, o, _ in placed)
+        by0 = min(y for _, _, y, o, _ in placed)
+        bx1 = max(x + o.shape[1] for _, x, _, o, _ in placed)
+        by1 = max(y + o.shape[0] for _, _, y, o, _ in placed)
+        outline_a = np.zeros((len(entries), by1 - by0, bx1 - bx0, 1), dtype=np.float32)
+        fill_a = np.zeros_like(outline_a)
+        for n, x, y, outline, fill in placed:
+            region = (n, slice(y - by0, y - by0 + outline.shape[0]), slice(x - bx0, x - bx0 + outline.shape[1]), 0)
+            np.maximum(outline_a[region], outline, out=outline_a[region])
+            np.maximum(fill_a[region], fill, out=fill_a[region])
+
+        band = cards[:, by0:by1, bx0:bx1, :3].astype(np.float32)
+        band += (np.float32(STROKE_FILL) - band) * outline_a
+        band += (np.float32(CARD_FILL[part]) - band) * fill_a
+        cards[:, by0:by1, bx0:bx1, :3] = band + 0.5
+
+    mode = "RGBA" if base.shape[2] == 4 else "RGB"
+    for card, (cid, _, out) in zip(cards, entries):
+        Image.fromarray(card, mode).save(out)
+        logger.info(f"Wrote final {'loan' if part == 'loan' else 'EMI'} image: {out}", extra={"customer": cid})
+
+def render_block(items):
+    """Render a block of queued customers with the batched compositor; [(id, error or None)].
+
+    Customers are grouped by template, so each group is one composite_cards call.
+    If a group fails, its customers are retried one at a time on the ImageDraw path.
+    """
+    results, groups, rows, langs = {}, {}, {}, {}
+    for cid, row, parts in items:
+        lang = (row.get("language") or "hindi").lower().strip()
+        logger.info(f"Processing id={cid} lang={lang}", extra={"customer": cid})
+        templates = card_templates(cid, lang)
+        results[cid] = None
+        rows[cid] = (row, parts)
+        langs[cid] = lang
+        if templates is None:
+            continue
+        for part in parts:
+            template = templates[CARD_TEMPLATE_INDEX[part]]
+            p = TEMPLATES / template
+            size = _decoded_template(p, p.stat().st_mtime).size
+            groups.setdefault((template, part), []).append(
+                (cid, CARD_FIELDS[part](row, *size), GENERATED / f"{cid}_{part}.png"))
+
+    for (template, part), entries in groups.items():
+        try:
+            composite_cards(template, part, entries)
+            artifact_index.record_many([(cid, langs[cid], f"{part}_card", out) for cid, _, out in entries])
+        except Exception:
+            logger.warning(f"Batched {part} cards on {template} failed; drawing them one by one:\n"
+                           + traceback.format_exc())
+            for cid, _, _ in entries:
+                results[cid] = render_customer((cid, rows[cid][0], [part]))[1]
+    return list(results.items())
+
+def render_customer(item):
+    """Render one queued customer; returns (id, error text or None). Runs in workers too."""
+    cid, row, parts = item
+    try:
+        with instrumentation.span("cards.customer", id=cid, language=row.get("language"), parts=parts) as sp, \
+                profiling.customer(cid):
+            written = generate_for_row(row, parts)
+            sp["bytes_out"] = sum(p.stat().st_size for p in written.values())
+        return cid, None
+    except Exception:
+        error = traceback.format_exc()
+        logger.error("Unhandled error while processing row:\n" + error)
+        return cid, error
+
+
+def render_chunk(chunk):
+    """One unit of work: a block for the batched compositor, or a single customer."""
+    if BATCH_SIZE <= 1:
+        return [render_customer(item) for item in chunk]
+    ids = [cid for cid, _, _ in chunk]
+    try:
+        with instrumentation.span("cards.batch", ids=ids) as sp, profiling.customer(f"{ids[0]}+{len(ids) - 1}"):
+            results = render_block(chunk)
+            sp["bytes_out"] = sum((GENERATED / f"{cid}_{part}.png").stat().st_size
+                                  for cid, _, parts in chunk for part in parts
+                                  if (GENERATED / f"{cid}_{part}.png").exists())
+        return results
+    except Exception:
+        error = traceback.format_exc()
+        logger.error("Unhandled error while processing a batch of rows:\n" + error)
+        return [(cid, error) for cid in ids]
+
+
+def _render_chunk_in_worker(chunk):
+    """render_chunk in a pool worker; its metric totals go back with the results for the parent to merge."""
+    return render_chunk(chunk), instrumentation.drain()
+
+
+def _render_all(work):
+    """Yield (id, error) per customer, in this process or over a pool of WORKERS processes."""
+    size = max(1, BATCH_SIZE)
+    chunks = [work[i:i + size] for i in range(0, len(work), size)]
+    # single customers are small jobs: hand them to workers several at a time
+    per_task = 1 if size > 1 else max(1, min(32, len(chunks) // (WORKERS * 4)))
+    if WORKERS <= 1 or len(chunks) < 2:
+        for chunk in chunks:
+            yield from render_chunk(chunk)
+        return
+    log_queue = multiprocessing.Queue()
+    setup_logging(log_queue)
+    try:
+        with multiprocessing.Pool(WORKERS, initializer=_init_worker, initargs=(log_queue,)) as pool:
+            # in order, so the deadline ordering carries over
+            for results, metrics in pool.imap(_render_chunk_in_worker, chunks, chunksize=per_task):
+                instrumentation.merge(metrics)
+                yield from results
+    finally:
+        setup_logging()
 
-    emi_out = GENERATED / f"{cid}_emi.png"
-    img2.save(emi_out)
-    logger.info(f"Wrote final EMI image: {emi_out}")
 
 def main():
+    # pandas comes in with these; a worker or render-service import of this module doesn't need them
+    import customer_store
+    import change_set
+    import scheduler
+
+    init()
+    logger.info(f"Per-customer log lines: {'all' if LOG_SAMPLE == 1 else 'none' if LOG_SAMPLE <= 0 else f'1 in {LOG_SAMPLE} customers'}")
     try:
-        df = pd.read_csv("data/customers_master.csv", dtype=str).fillna("")
+        df = customer_store.read_customers()
     except Exception as e:
         logger.exception(f"Failed to read CSV: {e}")
         return
-    logger.info(f"Loaded {len(df)} rows from data/customers_master.csv")
-    for _, row in df.iterrows():
-        try:
-            generate_for_row(row)
-        except Exception:
-            logger.exception("Unhandled error while processing row:\n" + traceback.format_exc())
+    logger.info(f"Loaded {len(df)} rows from {customer_store.MASTER_CSV}")
+
+    # With a change set only new/changed customers are redrawn; the loan card has
+    # no due date on it, so a due-date-only change just redraws the EMI card.
+    changes = change_set.load_change_set()
+    loan_todo = change_set.pending_ids(changes, uses_due_date=False, kinds=["loan_card"])
+    emi_todo = change_set.pending_ids(changes, uses_due_date=True, kinds=["emi_card"])
+    for cid, lang in change_set.removed_customers(changes):
+        for kind in ("loan", "emi"):
+            (GENERATED / f"{cid}_{kind}.png").unlink(missing_ok=True)
+        artifact_index.forget(cid, lang, ["loan_card", "emi_card"])
+
+    # earliest send deadline first, so a late batch still gets the urgent customers out
+    df = scheduler.prioritize(df)
+    # what is already drawn comes from the artifact index, not a stat() per card
+    have = {part: artifact_index.customers(f"{part}_card") for part in ("loan", "emi")}
+    work = []
+    for row in df.to_dict(orient="records"):
+        cid = str(row.get("id", ""))
+        key = (cid, (row.get("language") or "hindi").lower().strip())
+        parts = []
+        if loan_todo is None or cid in loan_todo or key not in have["loan"] or not artifact_index.present(*key, "loan_card"):
+            parts.append("loan")
+        if emi_todo is None or cid in emi_todo or key not in have["emi"] or not artifact_index.present(*key, "emi_card"):
+            parts.append("emi")
+        if parts:
+            work.append((cid, row, parts))
+
+    tracker = scheduler.DeadlineTracker("cards", [w[0] for w in work], [w[1]["send_by"] for w in work])
+    logger.info(tracker.forecast_summary())
+    instrumentation.count("skipped_total", len(df) - len(work), reason="unchanged")
+    failed = 0
+    for cid, error in _render_all(work):
+        if error:
+            failed += 1
+        else:
+            tracker.done(cid)
+    logger.info(f"Rendered {len(work) - failed} customer(s), {failed} failed, {len(df) - len(work)} unchanged")
+    logger.info(f"Deadlines: {tracker.summary()}")
     logger.info("All done. Check assets/generated/ and logs/card_generation.log")
 
 if __name__ == "__main__":
-    main()
+    if "--fetch-fonts" in sys.argv:
+        init()
+        sys.exit(0 if fetch_fonts() else 1)
+    instrumentation.init("cards")
+    with instrumentation.span("stage.cards"), profiling.stage("cards", focus="generate_for_row"):
+        main()
@@ -0,0 +1,133 @@
+import json
+import math
+import os
+import shutil
+from pathlib import Path
+
+import media_worker
+
+# Shared-segment delivery: the base video of a language is encoded once into
+# fMP4 HLS segments whose edges fall on every overlay window edge. A customer
+# then only needs the segments their overlays touch re-encoded; their playlist
+# points at the shared segments for everything else.
+HLS_SEGMENT_SECONDS = float(os.getenv("HLS_SEGMENT_SECONDS", "6"))
+MATCH_TOLERANCE = 0.05   # seconds; segment starts closer than this are the same cut
+
+
+def segment_boundaries(windows, duration, every=HLS_SEGMENT_SECONDS):
+    """Cut points (seconds, starting at 0): every window edge plus a regular grid."""
+    cuts = {0.0}
+    if every > 0:
+        cuts.update(i * every for i in range(1, int(duration // every) + 1))
+    for start, end in windows:
+        cuts.update((start, end))
+    return sorted(t for t in cuts if 0 <= t < duration)
+
+
+def hls_args(out_dir: Path, boundaries, offset=0.0):
+    """Muxer args that cut exactly at `boundaries` (given in base-video time)."""
+    keyframes = [t - offset for t in boundaries if t >= offset]
+    return [
+        # keyframes only at the cuts, so every segment starts where the shared ones do
+        "-force_key_frames", ",".join(f"{t:.3f}" for t in keyframes) or "0",
+        "-g", "100000",
+        "-sc_threshold", "0",
+        "-f", "hls",
+        "-hls_time", "0.1",
+        "-hls_playlist_type", "vod",
+        "-hls_segment_type", "fmp4",
+        "-hls_fmp4_init_filename", "init.mp4",
+        "-hls_segment_filename", str(out_dir / "seg_%03d.m4s"),
+    ]
+
+
+def read_playlist(m3u8: Path, offset=0.0):
+    """[(segment file name, start, duration), ...] from a media playlist ffmpeg wrote."""
+    segments, t, dur = [], offset, None
+    for line in m3u8.read_text().splitlines():
+        line = line.strip()
+        if line.startswith("#EXTINF:"):
+            dur = float(line[8:].split(",")[0])
+        elif line and not line.startswith("#") and dur is not None:
+            segments.append((line, t, dur))
+            t += dur
+            dur = None
+    return segments
+
+
+def ensure_shared(base_vid: Path, out_dir: Path, boundaries, encode_args):
+    """Encode (or reuse) a language's shared segments. Returns (segments, rebuilt)."""
+    st = base_vid.stat()
+    stamp = {"base": str(base_vid), "mtime": st.st_mtime, "size": st.st_size,
+             "boundaries": boundaries, "args": list(encode_args)}
+    stamp_file = out_dir / "shared.json"
+    index = out_dir / "index.m3u8"
+    if index.exists() and stamp_file.exists() and json.loads(stamp_file.read_text()) == stamp:
+        return read_playlist(index), False
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    out_dir.mkdir(parents=True)
+    cmd = (["ffmpeg", "-y", "-i", str(base_vid), "-map", "0:v", "-map", "0:a?"]
+           + list(encode_args) + hls_args(out_dir, boundaries) + [str(index)])
+    code, err = media_worker.run_ffmpeg(cmd)
+    if code != 0:
+        raise RuntimeError(err[-2000:])
+    stamp_file.write_text(json.dumps(stamp))
+    return read_playlist(index), True
+
+
+def personal_span(shared, overlays):
+    """(start, end) of the shared segments that any overlay overlaps, or None."""
+    hit = [(s, s + d) for _, s, d in shared
+           if any(ov["start"] < s + d and ov["end"] > s for ov in overlays)]
+    if not hit:
+        return None
+    return hit[0][0], hit[-1][1]
+
+
+def customer_pieces(shared, shared_uri, personal, personal_uri, windows):
+    """Playlist entries: personal segments inside the overlay windows, shared ones elsewhere.
+
+    The personal encode covers one continuous span; its segments that fall in a
+    gap between windows are dropped in favour of the identical shared ones.
+    """
+    by_start = {round(s / MATCH_TOLERANCE): (name, d) for name, s, d in personal}
+    pieces = []
+    for name, start, dur in shared:
+        mine = by_start.get(round(start / MATCH_TOLERANCE))
+        if mine and any(a < start + dur and b > start for a, b in windows):
+            pieces.append((f"{personal_uri}/init.mp4", f"{personal_uri}/{mine[0]}", mine[1]))
+        else:
+            pieces.append((f"{shared_uri}/init.mp4", f"{shared_uri}/{name}", dur))
+    return pieces
+
+
+def write_playlist(path: Path, pieces):
+    """Media playlist over [(init uri, segment uri, duration), ...]; switching init = discontinuity."""
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:7",
+        f"#EXT-X-TARGETDURATION:{math.ceil(max((d for _, _, d in pieces), default=1))}",
+        "#EXT-X-PLAYLIST-TYPE:VOD",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+    ]
+    current_init = None
+    for init, uri, dur in pieces:
+        if init != current_init:
+            if current_init is not None:
+                lines.append("#EXT-X-DISCONTINUITY")
+            lines.append(f'#EXT-X-MAP:URI="{init}"')
+            current_init = init
+        lines += [f"#EXTINF:{dur:.6f},", uri]
+    lines.append("#EXT-X-ENDLIST")
+    tmp = path.with_suffix(".m3u8.tmp")
+    tmp.write_text("\n".join(lines) + "\n")
+    os.replace(tmp, path)
+
+
+def prune_personal(out_dir: Path, pieces):
+    """Delete personal segments the playlist doesn't use (and ffmpeg's own index)."""
+    used = {Path(uri).name for init, uri, _ in pieces if Path(init).parent.name == out_dir.name}
+    for f in out_dir.iterdir():
+        if f.suffix == ".m3u8" or (f.suffix == ".m4s" and f.name not in used):
+            f.unlink()
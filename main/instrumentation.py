@@ -0,0 +1,234 @@
+import atexit
+import contextvars
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+# ---------- CONFIG ----------
+ROOT = Path(".")
+SPANS_PATH = Path(os.getenv("REMINDERS_SPANS_PATH", str(ROOT / "logs" / "spans.jsonl")))
+# past this size the spans file is renamed to spans.jsonl.1 (replacing the previous
+# one) and a new file is started, so at most about twice this is kept on disk
+SPANS_MAX_BYTES = int(os.getenv("REMINDERS_SPANS_MAX_BYTES", str(256 * 1024 ** 2)))
+ROTATE_CHECK_EVERY = 1000               # lines between size checks
+# one textfile per stage, so separate stage processes never overwrite each other;
+# point the node exporter's --collector.textfile.directory here
+METRICS_DIR = Path(os.getenv("REMINDERS_METRICS_DIR", str(ROOT / "logs" / "metrics")))
+ENABLED = os.getenv("REMINDERS_INSTRUMENT", "1") not in ("", "0")
+
+_SPEED = re.compile(r"speed=\s*([\d.]+)x")
+
+_stage = "adhoc"
+_lock = threading.Lock()
+_file = None
+_lines = 0
+_ids = itertools.count(1)
+_current = contextvars.ContextVar("span", default=None)
+
+# aggregates for the metrics file
+_span_seconds = defaultdict(float)      # (name, status) -> seconds
+_span_count = defaultdict(int)          # (name, status) -> count
+_counters = defaultdict(float)          # (metric, labels tuple) -> value
+_ffmpeg_speed = []
+
+
+def init(stage):
+    """Name the stage this process belongs to; metrics are written when it exits."""
+    global _stage
+    _stage = stage
+    atexit.register(write_metrics)
+
+
+def rotated_path(path=SPANS_PATH):
+    return path.with_name(path.name + ".1")
+
+
+def _rotate_if_needed():
+    """Start a new spans file when it outgrew SPANS_MAX_BYTES; follow a rotation done by another process."""
+    global _file
+    try:
+        st = os.stat(SPANS_PATH)
+    except FileNotFoundError:
+        st = None
+    if st is not None and st.st_size > SPANS_MAX_BYTES:
+        try:
+            os.replace(SPANS_PATH, rotated_path())
+        except FileNotFoundError:       # another process rotated it first
+            pass
+        st = None
+    if _file is not None and (st is None or st.st_ino != os.fstat(_file.fileno()).st_ino):
+        _file.close()
+        _file = None
+
+
+def _emit(record):
+    global _file, _lines
+    if not ENABLED:
+        return
+    line = json.dumps(record, default=str, ensure_ascii=False)
+    with _lock:
+        if _file is None or _lines % ROTATE_CHECK_EVERY == 0:
+            SPANS_PATH.parent.mkdir(parents=True, exist_ok=True)
+            _rotate_if_needed()
+        if _file is None:
+            _file = open(SPANS_PATH, "a", encoding="utf-8", buffering=1)
+        _file.write(line + "\n")
+        _lines += 1
+
+
+def count(metric, value=1, **labels):
+    """Add to a counter, e.g. count("cache_hits_total", cache="tts")."""
+    with _lock:
+        _counters[(metric, tuple(sorted(labels.items())))] += value
+
+
+def drain():
+    """Take this process's aggregates and reset them; a pool worker hands them to the parent (merge)."""
+    with _lock:
+        snapshot = {"span_seconds": dict(_span_seconds), "span_count": dict(_span_count),
+                    "counters": dict(_counters), "ffmpeg_speed": list(_ffmpeg_speed)}
+        _span_seconds.clear()
+        _span_count.clear()
+        _counters.clear()
+        _ffmpeg_speed.clear()
+    return snapshot
+
+
+def merge(snapshot):
+    """Add a worker's drained aggregates to this process's, so the metrics file covers the workers too."""
+    with _lock:
+        for key, secs in snapshot["span_seconds"].items():
+            _span_seconds[key] += secs
+        for key, n in snapshot["span_count"].items():
+            _span_count[key] += n
+        for key, value in snapshot["counters"].items():
+            _counters[key] += value
+        _ffmpeg_speed.extend(snapshot["ffmpeg_speed"])
+
+
+def _aggregate(name, status, seconds):
+    with _lock:
+        _span_seconds[(name, status)] += seconds
+        _span_count[(name, status)] += 1
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time a block: wall and thread CPU time, plus any attrs set on the yielded dict.
+
+    Spans nest (the enclosing span's id is recorded as parent) and one JSON line
+    is appended to logs/spans.jsonl per span (rotated past SPANS_MAX_BYTES). An
+    exception marks it "error".
+    """
+    span_id = next(_ids)
+    parent = _current.get()
+    token = _current.set(span_id)
+    t0, c0 = time.perf_counter(), time.thread_time()
+    status = "ok"
+    try:
+        yield attrs
+    except BaseException as e:
+        status = "error"
+        attrs.setdefault("error", f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current.reset(token)
+        wall = time.perf_counter() - t0
+        _aggregate(name, status, wall)
+        _emit({
+            "ts": time.time(), "stage": _stage, "span": name, "id": span_id, "parent": parent,
+            "pid": os.getpid(), "status": status,
+            "wall_s": round(wall, 6), "cpu_s": round(time.thread_time() - c0, 6), **attrs,
+        })
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return 0
+
+
+def ffmpeg_io(cmd):
+    """(bytes in, bytes out): sizes of the -i inputs and of the output files named in cmd."""
+    inputs = [cmd[i + 1] for i, a in enumerate(cmd[:-1]) if a == "-i"]
+    # any other non-option arg that names an existing file is an output
+    # (option values and filter graphs aren't files, so they count as 0)
+    outputs = [a for a in cmd[1:] if not str(a).startswith("-") and a not in inputs]
+    return sum(_file_size(p) for p in inputs), sum(_file_size(p) for p in outputs)
+
+
+def record_subprocess(cmd, returncode, stderr, wall, rusage=None):
+    """One span per external process (ffmpeg): exit code, encode speed, child CPU, bytes."""
+    tool = os.path.basename(str(cmd[0]))
+    speeds = _SPEED.findall(stderr or "")
+    speed = float(speeds[-1]) if speeds else None
+    bytes_in, bytes_out = ffmpeg_io(cmd)
+    status = "ok" if returncode == 0 else "error"
+    cpu = rusage.ru_utime + rusage.ru_stime if rusage else None
+
+    _aggregate(tool, status, wall)
+    count("subprocess_runs_total", tool=tool, exit_code=returncode)
+    count("bytes_read_total", bytes_in, tool=tool)
+    count("bytes_written_total", bytes_out, tool=tool)
+    if cpu is not None:
+        count("subprocess_cpu_seconds_total", cpu, tool=tool)
+    if speed is not None:
+        with _lock:
+            _ffmpeg_speed.append(speed)
+    _emit({
+        "ts": time.time(), "stage": _stage, "span": tool, "id": next(_ids), "parent": _current.get(),
+        "pid": os.getpid(), "status": status, "exit_code": returncode,
+        "wall_s": round(wall, 6), "cpu_s": round(cpu, 6) if cpu is not None else None,
+        "max_rss_kb": rusage.ru_maxrss if rusage else None,
+        "speed": speed, "bytes_in": bytes_in, "bytes_out": bytes_out,
+    })
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in pairs) + "}"
+
+
+def write_metrics():
+    """Prometheus textfile snapshot of this process's totals (atomically replaced)."""
+    if not ENABLED:
+        return None
+    stage = ("stage", _stage)
+    lines = [
+        "# HELP reminders_span_seconds_total Wall time spent in spans.",
+        "# TYPE reminders_span_seconds_total counter",
+    ]
+    with _lock:
+        for (name, status), secs in sorted(_span_seconds.items()):
+            lines.append(f"reminders_span_seconds_total{_labels([stage, ('span', name), ('status', status)])} {secs:.6f}")
+        lines += ["# HELP reminders_spans_total Number of spans.", "# TYPE reminders_spans_total counter"]
+        for (name, status), n in sorted(_span_count.items()):
+            lines.append(f"reminders_spans_total{_labels([stage, ('span', name), ('status', status)])} {n}")
+        by_metric = defaultdict(list)
+        for (metric, labels), value in sorted(_counters.items()):
+            by_metric[metric].append((labels, value))
+        for metric, rows in by_metric.items():
+            lines.append(f"# TYPE reminders_{metric} counter")
+            for labels, value in rows:
+                lines.append(f"reminders_{metric}{_labels([stage, *labels])} {value:.15g}")
+        if _ffmpeg_speed:
+            lines += ["# HELP reminders_ffmpeg_speed_ratio Mean ffmpeg speed (x realtime) this run.",
+                      "# TYPE reminders_ffmpeg_speed_ratio gauge",
+                      f"reminders_ffmpeg_speed_ratio{_labels([stage])} {sum(_ffmpeg_speed) / len(_ffmpeg_speed):.3f}"]
+    lines += ["# TYPE reminders_last_run_timestamp_seconds gauge",
+              f"reminders_last_run_timestamp_seconds{_labels([stage])} {time.time():.0f}"]
+
+    METRICS_DIR.mkdir(parents=True, exist_ok=True)
+    path = METRICS_DIR / f"reminders_{_stage}.prom"
+    tmp = path.with_suffix(".prom.tmp")
+    tmp.write_text("\n".join(lines) + "\n")
+    os.replace(tmp, path)
+    return path
@@ -1,6 +1,8 @@
 import subprocess
 import os
 import pandas as pd
+import instrumentation
+import profiling
 
 SCRIPTS_DIR = "main"
 STEPS = [
@@ -11,11 +13,17 @@ STEPS = [
 
 def run_pipeline():
     print("🚀 Starting full video generation pipeline...\n")
+    # --profile[=sample] profiles every stage: each one reads REMINDERS_PROFILE
+    mode = profiling.requested_mode()
+    if mode:
+        os.environ["REMINDERS_PROFILE"] = mode
+        print(f"📊 Profiling each stage ({mode}) → {profiling.PROFILE_DIR}/\n")
     for step in STEPS:
         path = os.path.join(SCRIPTS_DIR, step)
         print(f"🟢 Running: {step}")
         try:
-            subprocess.run([os.sys.executable, path], check=True)
+            with instrumentation.span("pipeline.step", step=step):
+                subprocess.run([os.sys.executable, path], check=True)
             print(f"✅ Completed: {step}\n")
         except subprocess.CalledProcessError as e:
             print(f"❌ Failed at {step}: {e}")
@@ -24,4 +32,5 @@ def run_pipeline():
     print("🎯 All steps executed successfully!")
 
 if __name__ == "__main__":
+    instrumentation.init("pipeline")
     run_pipeline()
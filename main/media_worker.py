@@ -0,0 +1,191 @@
+import subprocess
+import json
+import os
+import time
+from functools import lru_cache
+
+import instrumentation
+
+# How many customers share one ffmpeg process. The base video is demuxed and
+# decoded once per batch and the shared static card is scaled once; every
+# customer still gets its own encoder. Larger batches amortise more startup
+# but hold more encoders (and their lookahead buffers) in memory at once.
+#
+# This stands in for a persistent worker (PyAV, or one ffmpeg fed jobs): an
+# encoder can't be reused across output files anyway, and what a warm process
+# would save is small. 48 s 720p base, three overlays, veryfast/CRF 20, 1 core:
+#   process start + demuxer/decoder/encoder init + graph parse: 0.20 s for one
+#   customer, 0.43 s for an 8-customer graph (0.05 s per customer)
+#   render: 23.3 s per customer one at a time, 18.4 s in batches of 8
+# so a warm worker could save at most 0.05 s of 18.4 s per customer (0.3%),
+# while the shared decode that batching already gives is worth 21%.
+BATCH_SIZE = int(os.getenv("MEDIA_BATCH_SIZE", "8"))
+
+# x264 preset / CRF / threads measured on this host by main/calibrate_encoder.py.
+# Without the file every stage keeps its own built-in defaults.
+ENCODER_PROFILE = os.getenv("REMINDERS_ENCODER_PROFILE", os.path.join("data", "encoder_profile.json"))
+# The CRF is calibrated for the compositing stage (main/complete_video.py's
+# FF_CRf). Other stages apply the same offset to their own default, so an
+# intermediate that is encoded again (join_cards, CRF 18) stays sharper than
+# the final encode.
+PROFILE_REFERENCE_CRF = 20
+
+
+def run_ffmpeg(cmd):
+    """Run ffmpeg, returning (exit code, stderr); each run is recorded as an instrumentation span."""
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    err = proc.stderr.read().decode(errors="replace")
+    proc.stderr.close()
+    if hasattr(os, "wait4"):
+        # wait4 rather than wait: it also returns this child's own CPU time and peak RSS
+        _, status, rusage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+    else:   # Windows: no child rusage, the span just has no CPU / RSS
+        proc.wait()
+        rusage = None
+    instrumentation.record_subprocess(cmd, proc.returncode, err, time.perf_counter() - t0, rusage)
+    return proc.returncode, err
+
+
+@lru_cache(maxsize=None)
+def _probe(path: str, mtime: float, size: int):
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-show_entries", "format=duration:stream=codec_type,codec_name,width,height,r_frame_rate",
+        "-of", "json",
+        path,
+    ]
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.decode())
+    return json.loads(proc.stdout.decode())
+
+
+def probe(path) -> dict:
+    """ffprobe a file once per process; later calls for the unchanged file are free."""
+    st = os.stat(path)
+    hits = _probe.cache_info().hits
+    info = _probe(str(path), st.st_mtime, st.st_size)
+    instrumentation.count("cache_hits_total" if _probe.cache_info().hits > hits else "cache_misses_total", cache="probe")
+    return info
+
+
+@lru_cache(maxsize=1)
+def encoder_profile() -> dict:
+    """The calibrated encoder choice ({"preset", "crf", "threads"}), or {} when there is none."""
+    try:
+        with open(ENCODER_PROFILE, encoding="utf-8") as f:
+            return json.load(f).get("selected") or {}
+    except (OSError, ValueError):
+        return {}
+
+
+def x264_args(preset, crf):
+    """-preset/-crf(/-threads) for libx264: the calibrated profile if present, else the given defaults.
+
+    The profile's CRF is applied as an offset from PROFILE_REFERENCE_CRF to
+    this stage's default `crf`, not copied over it.
+    """
+    chosen = encoder_profile()
+    if "crf" in chosen:
+        offset = chosen.get("crf_offset", int(chosen["crf"]) - chosen.get("reference_crf", PROFILE_REFERENCE_CRF))
+        crf = min(51, max(0, int(crf) + offset))
+    args = ["-preset", str(chosen.get("preset", preset)), "-crf", str(crf)]
+    if chosen.get("threads"):
+        args += ["-threads", str(chosen["threads"])]
+    return args
+
+
+def video_dimensions(path):
+    streams = [s for s in probe(path).get("streams") or [] if s.get("codec_type") == "video"]
+    if not streams:
+        raise RuntimeError("No video streams found")
+    return int(streams[0]["width"]), int(streams[0]["height"])
+
+
+def duration(path) -> float:
+    return float(probe(path).get("format", {}).get("duration") or 0.0)
+
+
+def build_batch_command(base_video, size, jobs, input_args=()):
+    """One ffmpeg command that composites every job in `jobs` over a single decode of base_video.
+
+    jobs: [{"id": ..., "overlays": [{"img", "start", "end"}, ...],
+            "outputs": [{"file": path, "height": None or int, "args": [...]}, ...]}, ...]
+    Overlay images used by several jobs (the language's static card) are
+    read and scaled once, then split. A job with several outputs (a rendition
+    ladder) is composited once and split to one scaler + encoder per output.
+    input_args go before the base input (e.g. -ss/-t to render only part of it).
+    """
+    vid_w, vid_h = size
+    images = []
+    uses = {}
+    for job in jobs:
+        for ov in job["overlays"]:
+            if ov["img"] not in uses:
+                images.append(ov["img"])
+                uses[ov["img"]] = 0
+            uses[ov["img"]] += 1
+
+    filter_parts = [f"[0:v]split={len(jobs)}" + "".join(f"[b{j}]" for j in range(len(jobs)))]
+    img_labels = {}
+    for i, img in enumerate(images, start=1):
+        labels = [f"i{i}_{k}" for k in range(uses[img])]
+        filter_parts.append(f"[{i}:v]scale={vid_w}:{vid_h},split={uses[img]}" + "".join(f"[{l}]" for l in labels))
+        img_labels[img] = iter(labels)
+
+    cmd = ["ffmpeg", "-y"] + list(input_args) + ["-i", str(base_video)]
+    for img in images:
+        cmd += ["-i", img]
+
+    outputs = []
+    for j, job in enumerate(jobs):
+        last = f"[b{j}]"
+        for k, ov in enumerate(job["overlays"]):
+            enable = f"between(t,{ov['start']},{ov['end']})"
+            filter_parts.append(f"{last}[{next(img_labels[ov['img']])}]overlay=0:0:enable='{enable}'[v{j}_{k}]")
+            last = f"[v{j}_{k}]"
+
+        renditions = job["outputs"]
+        if len(renditions) == 1 and not renditions[0].get("height"):
+            out_labels = [last]
+        else:
+            split = [f"[r{j}_{n}]" for n in range(len(renditions))]
+            filter_parts.append(f"{last}split={len(renditions)}" + "".join(split))
+            out_labels = []
+            for n, rend in enumerate(renditions):
+                if rend.get("height"):
+                    filter_parts.append(f"{split[n]}scale=-2:{rend['height']}[o{j}_{n}]")
+                    out_labels.append(f"[o{j}_{n}]")
+                else:
+                    out_labels.append(split[n])
+
+        for label, rend in zip(out_labels, renditions):
+            outputs += ["-map", label, "-map", "0:a?"] + list(rend["args"]) + [str(rend["file"])]
+
+    cmd += ["-filter_complex", ";".join(filter_parts)] + outputs
+    return cmd
+
+
+def composite_batch(base_video, size, jobs, input_args=()):
+    """Render a batch in one process; if that fails, retry each job alone so one bad input
+    doesn't cost the whole batch. Returns {job id: error or None}."""
+    if not jobs:
+        return {}
+    code, err = run_ffmpeg(build_batch_command(base_video, size, jobs, input_args))
+    if code == 0:
+        return {job["id"]: None for job in jobs}
+    if len(jobs) == 1:
+        return {jobs[0]["id"]: err[-2000:]}
+
+    results = {}
+    for job in jobs:
+        results.update(composite_batch(base_video, size, [job], input_args))
+    return results
+
+
+def batches(items, size=BATCH_SIZE):
+    size = max(1, size)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
@@ -0,0 +1,402 @@
+"""Will the monthly run fit? Predict wall time, CPU, scratch and output size from measured stage costs.
+
+    python main/plan_batch.py                               # the current master, costs from logs/spans.jsonl
+    python main/plan_batch.py --customers 300000 --workers 16 --cores 16 --window 8
+    python main/plan_batch.py --benchmark benchmarks/results/<run>.json
+    python main/plan_batch.py --calibrate                   # short benchmark run first, then plan with it
+
+The language mix comes from the customer master (scaled to --customers). Each
+language's base video duration and the TSPEC windows give the seconds the
+video stage encodes per customer: the whole video in mp4 mode, only the
+segments under the cards in hls mode. Per-customer costs are measured from
+recent runs: wall time, CPU time including the ffmpeg children, and bytes
+written. For the video stage the cost is measured per encoded second.
+
+From cost = wall and CPU per customer, one worker keeps cpu / wall cores busy.
+So N workers on C cores run min(N, C / (cpu / wall)) times faster than one,
+and no faster once the cores are saturated. Only the card stage has workers
+(CARD_WORKERS); the video and script stages run as one process, and the
+processes they could use on disjoint shards are reported as a recommendation
+only. Stages run one after another. The audio stage is bound by the TTS API's
+rate limit, not by workers. Scratch is what the workspace stages hold per
+customer in flight, capped by the quota.
+"""
+import argparse
+import bisect
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import complete_video
+import customer_store
+import hls_output
+import instrumentation
+import media_worker
+import scheduler
+import workspace
+
+# ---------- CONFIG ----------
+ROOT = Path(".")
+SPANS_PATH = ROOT / "logs" / "spans.jsonl"
+BENCHMARK = Path(__file__).resolve().parent.parent / "benchmarks" / "run_benchmarks.py"
+SINCE_DAYS = 30                     # spans older than this are ignored
+PIPELINE = "cards,video"            # what main_pipeline.py runs after prepare
+SCRIPT_CHAIN = "audio,merge_audio,concat,join_cards"
+
+# stage → unit spans and how they scale. "scratch": bytes a customer in flight
+# holds in the workspace, as a multiple of the bytes it writes (merge_audio
+# reserves twice its inputs; concat and join_cards about their output).
+STAGES = {
+    "cards": {"spans": ("cards.customer", "cards.batch"), "knob": "CARD_WORKERS"},
+    "video": {"spans": ("video.batch",), "per_second": True},
+    "audio": {"spans": ("tts.request",), "network": True},
+    "merge_audio": {"spans": ("merge_audio.customer",), "scratch": 2.0},
+    "concat": {"spans": ("concat.customer",), "scratch": 1.0, "languages": ("hindi",)},
+    "join_cards": {"spans": ("join_cards.customer",), "scratch": 1.0, "languages": ("hindi",)},
+}
+CLIPS_PER_CUSTOMER = 2              # generate_audio_snippets: two sentences, one TTS request each (cold cache)
+
+
+# ---------- inputs ----------
+def language_mix(customers=None):
+    """{language: customers} from the master; scaled to `customers` in total when given."""
+    df = customer_store.read_customers(columns=["language"])
+    counts = df["language"].fillna("english").astype(str).str.strip().str.lower().value_counts()
+    mix = {lang: int(n) for lang, n in counts.items()}
+    if customers and mix:
+        total = sum(mix.values())
+        mix = {lang: round(n * customers / total) for lang, n in mix.items()}
+        largest = max(mix, key=mix.get)
+        mix[largest] += customers - sum(mix.values())     # rounding remainder
+    return mix
+
+
+def encoded_seconds(languages):
+    """{language: seconds of video the video stage encodes per customer}; languages without a base video are left out."""
+    windows = [w for w in complete_video.slots.values() if w[0] is not None]
+    out = {}
+    for lang in languages:
+        base = complete_video.find_language_asset(complete_video.BASE_VIDEOS_DIR, lang, ".mp4", "base_video")
+        if base is None:
+            continue
+        duration = media_worker.duration(base)
+        if complete_video.OUTPUT_MODE != "hls":
+            out[lang] = duration
+            continue
+        cuts = hls_output.segment_boundaries(windows, duration) + [duration]
+        shared = [(n, s, e - s) for n, (s, e) in enumerate(zip(cuts, cuts[1:]))]
+        span = hls_output.personal_span(shared, [{"start": s, "end": e} for s, e in windows])
+        out[lang] = span[1] - span[0] if span else 0.0
+    return out
+
+
+# ---------- measured costs ----------
+def _cost(units, wall, cpu, nbytes, rss_mb=None, source=""):
+    if units <= 0:
+        return None
+    return {"units": units, "wall": wall / units, "cpu": cpu / units, "bytes": nbytes / units,
+            "rss_mb": rss_mb, "source": source}
+
+
+def costs_from_spans(path=SPANS_PATH, since_days=SINCE_DAYS, enc=None):
+    """Per-unit cost of each stage from its recent unit spans, with the ffmpeg runs inside them.
+
+    A unit's ffmpeg children are found by process and time (the child ran in
+    the same pid and finished inside the unit), and nested units (a per-customer
+    fallback inside a card batch) are counted once, in the outer one.
+    """
+    files = [p for p in (instrumentation.rotated_path(Path(path)), Path(path)) if p.exists()]
+    if not files:
+        return {}
+    stage_of = {span: stage for stage, spec in STAGES.items() for span in spec["spans"]}
+    cutoff = time.time() - since_days * 86400
+    units, children = defaultdict(list), defaultdict(list)
+    for p in files:     # the rotated file first: older spans
+        with open(p, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    r = json.loads(line)
+                except ValueError:
+                    continue
+                if r.get("ts", 0) < cutoff or r.get("status") != "ok":
+                    continue
+                if r.get("span") in stage_of:
+                    units[r["pid"]].append(r)
+                elif r.get("span") == "ffmpeg":
+                    children[r["pid"]].append(r)
+
+    totals = defaultdict(lambda: {"units": 0.0, "wall": 0.0, "cpu": 0.0, "bytes": 0.0, "rss_kb": 0})
+    for pid, recs in units.items():
+        recs.sort(key=lambda r: r["ts"] - r["wall_s"])
+        outer, end = [], -1.0
+        for r in recs:
+            if r["ts"] <= end:
+                continue        # nested in the previous unit
+            outer.append(r)
+            end = r["ts"]
+        starts = [r["ts"] - r["wall_s"] for r in outer]
+        child_cpu, child_bytes, child_rss = defaultdict(float), defaultdict(float), defaultdict(int)
+        for c in children.get(pid, []):
+            i = bisect.bisect_right(starts, c["ts"]) - 1
+            if i >= 0 and c["ts"] <= outer[i]["ts"]:
+                child_cpu[i] += c.get("cpu_s") or 0
+                child_bytes[i] += c.get("bytes_out") or 0
+                child_rss[i] = max(child_rss[i], c.get("max_rss_kb") or 0)
+        for i, r in enumerate(outer):
+            stage = stage_of[r["span"]]
+            customers = len(r.get("ids") or [None])
+            if STAGES[stage].get("per_second"):
+                lang = str(r.get("language") or "").strip().lower()
+                if not enc or lang not in enc:
+                    continue    # can't normalise without that language's base video
+                units_ = customers * enc[lang]
+            else:
+                units_ = customers
+            t = totals[stage]
+            t["units"] += units_
+            t["wall"] += r["wall_s"]
+            t["cpu"] += (r.get("cpu_s") or 0) + child_cpu.get(i, 0)
+            t["bytes"] += (r.get("bytes_out") or 0) + child_bytes.get(i, 0)
+            t["rss_kb"] = max(t["rss_kb"], child_rss.get(i, 0))
+    costs = {stage: _cost(t["units"], t["wall"], t["cpu"], t["bytes"], t["rss_kb"] / 1024 or None,
+                          f"{path}, last {since_days:g} days")
+             for stage, t in totals.items()}
+    return {k: v for k, v in costs.items() if v}
+
+
+def costs_from_benchmark(path):
+    """Per-unit costs from a benchmarks/run_benchmarks.py results file."""
+    results = json.loads(Path(path).read_text())
+    s, params = results["stages"], results.get("params", {})
+    costs = {}
+    if "cards" in s:
+        customers = s["cards"]["items"] / 2     # two cards per customer
+        costs["cards"] = _cost(customers, s["cards"]["wall_s"], s["cards"]["cpu_s"], s["cards"]["bytes_written"],
+                               source=str(path))
+    if "video" in s:
+        seconds = s["video"]["items"] * params.get("video_seconds", 48)
+        costs["video"] = _cost(seconds, s["video"]["wall_s"], s["video"]["cpu_s"], s["video"]["bytes_written"],
+                               s["video"].get("peak_child_rss_mb"), str(path))
+    if "merge_audio" in s:
+        m = s["merge_audio"]
+        costs["merge_audio"] = _cost(m["items"], m["wall_s"], m["cpu_s"], m["bytes_written"],
+                                     m.get("peak_child_rss_mb"), str(path))
+    return {k: v for k, v in costs.items() if v}
+
+
+def calibrate():
+    """A short benchmark run (a few customers per language) whose results are used as the costs."""
+    out = Path(tempfile.mkdtemp(prefix="plan-batch-")) / "calibration.json"
+    print(f"Calibrating with {BENCHMARK.name} (a few minutes) ...")
+    subprocess.run([sys.executable, str(BENCHMARK), "--customers", "20", "--video-customers", "1",
+                    "--startup-runs", "1", "--out", str(out)], check=True, stdout=subprocess.DEVNULL)
+    return costs_from_benchmark(out)
+
+
+# ---------- model ----------
+def _memory_gb():
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024 ** 3
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def plan_stage(stage, cost, units, customers, workers, cores, memory_gb, shard=False):
+    """One stage's row. Only stages with a worker knob run in parallel; the others
+    are one process unless `shard` (separate processes on disjoint shards of the
+    master, which the stages don't do themselves) is asked for."""
+    if not (STAGES[stage].get("knob") or shard):
+        workers = 1
+    busy = min(cores, max(0.05, cost["cpu"] / cost["wall"]))        # cores one worker keeps busy
+    by_cpu = max(1, math.floor(cores / busy + 1e-9))
+    by_memory = max(1, math.floor(memory_gb * 1024 / cost["rss_mb"])) if cost.get("rss_mb") and memory_gb else None
+    recommended = min(by_cpu, by_memory) if by_memory else by_cpu
+    parallel = min(workers, cores / busy, by_memory or workers)
+    row = {
+        "stage": stage, "customers": customers, "workers": workers,
+        "wall_s": units * cost["wall"] / max(1.0, parallel),
+        "cpu_hours": units * cost["cpu"] / 3600,
+        "output_bytes": units * cost["bytes"],
+        "seconds_per_customer": units * cost["wall"] / max(1, customers),   # one worker
+        "cores_per_worker": busy,
+        "recommended_workers": recommended,
+        "scratch_bytes": 0,
+        "source": cost.get("source", ""),
+    }
+    if not cost["bytes"]:
+        row["note"] = "output size not measured"
+    factor = STAGES[stage].get("scratch")
+    if factor:
+        per_customer = factor * units * cost["bytes"] / max(1, customers)
+        row["scratch_bytes"] = min(workspace.SCRATCH_QUOTA_BYTES, math.ceil(parallel) * per_customer)
+        if math.ceil(parallel) * per_customer > workspace.SCRATCH_QUOTA_BYTES:
+            row["note"] = "scratch quota throttles the workers"
+    return row
+
+
+def plan_audio(cost, customers):
+    """TTS is rate-limited: requests / rate, or latency-bound at the client's concurrency."""
+    rate = float(os.getenv("TTS_REQUESTS_PER_SECOND", "3"))
+    concurrency = int(os.getenv("TTS_MAX_CONCURRENCY", "4"))
+    requests_ = customers * CLIPS_PER_CUSTOMER
+    latency = cost["wall"] if cost else 1.5
+    wall = max(requests_ / rate, requests_ * latency / concurrency)
+    return {
+        "stage": "audio", "customers": customers, "workers": concurrency,
+        "wall_s": wall, "cpu_hours": 0.0,
+        "output_bytes": requests_ * cost["bytes"] if cost else 0.0,
+        "cores_per_worker": 0.0, "recommended_workers": max(1, math.ceil(rate * latency)),
+        "scratch_bytes": 0, "source": cost["source"] if cost else "no measurements: 1.5 s per request assumed",
+        "note": f"bound by TTS_REQUESTS_PER_SECOND={rate:g}, upper bound (cold speech cache)",
+    }
+
+
+def plan(mix, enc, costs, stages, workers, cores, memory_gb, shard=False):
+    rows, missing = [], []
+    for stage in stages:
+        spec = STAGES[stage]
+        langs = [l for l in mix if l in spec.get("languages", mix)]
+        customers = sum(mix[l] for l in langs)
+        cost = costs.get(stage)
+        if spec.get("network"):
+            rows.append(plan_audio(cost, customers))
+            continue
+        if cost is None:
+            missing.append(stage)
+            continue
+        if spec.get("per_second"):
+            rendered = [l for l in langs if l in enc]
+            units = sum(mix[l] * enc[l] for l in rendered)
+            row = plan_stage(stage, cost, units, sum(mix[l] for l in rendered), workers, cores, memory_gb, shard)
+            skipped = customers - row["customers"]
+            if skipped:
+                row["note"] = f"{skipped} customer(s) without a base video are skipped"
+        else:
+            row = plan_stage(stage, cost, customers, customers, workers, cores, memory_gb, shard)
+        rows.append(row)
+    return rows, missing
+
+
+def workers_for_window(mix, enc, costs, stages, cores, memory_gb, window_s, shard=False):
+    """Smallest worker count (on this many cores) that fits the window, or None."""
+    for n in range(1, max(1, cores) + 1):
+        rows, _ = plan(mix, enc, costs, stages, n, cores, memory_gb, shard)
+        if sum(r["wall_s"] for r in rows) <= window_s:
+            return n
+    return None
+
+
+def _hms(seconds):
+    seconds = int(round(seconds))
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def _gb(nbytes):
+    return f"{nbytes / 1024 ** 3:.1f} GB"
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--customers", type=int, help="plan for this many customers in the master's language mix")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes per stage")
+    ap.add_argument("--cores", type=int, default=os.cpu_count() or 1, help="cores on the host")
+    ap.add_argument("--memory-gb", type=float, default=_memory_gb(), help="RAM on the host")
+    ap.add_argument("--stages", default=PIPELINE, help=f"comma-separated, in run order (script chain: {SCRIPT_CHAIN})")
+    ap.add_argument("--window", type=float, help="hours available; report whether the run fits")
+    ap.add_argument("--spans", default=str(SPANS_PATH), help="instrumentation spans of recent runs")
+    ap.add_argument("--since-days", type=float, default=SINCE_DAYS)
+    ap.add_argument("--benchmark", help="take costs from a run_benchmarks.py results file instead")
+    ap.add_argument("--calibrate", action="store_true", help="run a short benchmark first and use its costs")
+    ap.add_argument("--json", help="also write the plan here")
+    args = ap.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        sys.exit(f"Unknown stage(s): {', '.join(unknown)} (known: {', '.join(STAGES)})")
+
+    mix = language_mix(args.customers)
+    enc = encoded_seconds(mix)
+    if args.calibrate:
+        costs = calibrate()
+    elif args.benchmark:
+        costs = costs_from_benchmark(args.benchmark)
+    else:
+        costs = costs_from_spans(args.spans, args.since_days, enc)
+    rows, missing = plan(mix, enc, costs, stages, args.workers, args.cores, args.memory_gb)
+
+    print(f"Customers: {sum(mix.values())} (" + ", ".join(f"{l} {n}" for l, n in mix.items()) + ")")
+    print("Encoded per customer: " + (", ".join(f"{l} {s:.1f}s" for l, s in enc.items()) or "no base videos")
+          + f" ({complete_video.OUTPUT_MODE} mode)")
+    print(f"Host: {args.workers} worker(s), {args.cores} core(s)"
+          + (f", {args.memory_gb:.0f} GB RAM" if args.memory_gb else "") + "\n")
+    print(f"  {'stage':12s} {'customers':>9s} {'wall':>10s} {'CPU-h':>8s} {'output':>9s} {'scratch':>9s} "
+          f"{'cores/wkr':>9s} {'rec. workers':>12s}")
+    for r in rows:
+        print(f"  {r['stage']:12s} {r['customers']:9d} {_hms(r['wall_s']):>10s} {r['cpu_hours']:8.1f} "
+              f"{_gb(r['output_bytes']):>9s} {_gb(r['scratch_bytes']):>9s} {r['cores_per_worker']:9.2f} "
+              f"{r['recommended_workers']:12d}" + (f"   {r['note']}" if r.get("note") else ""))
+    total = sum(r["wall_s"] for r in rows)
+    print(f"\n  total wall {_hms(total)}, {sum(r['cpu_hours'] for r in rows):.1f} CPU-hours, "
+          f"{_gb(sum(r['output_bytes'] for r in rows))} written, peak scratch {_gb(max([r['scratch_bytes'] for r in rows], default=0))}")
+    for stage in missing:
+        print(f"  {stage}: no measurements; run it once (spans in {args.spans}) or use --calibrate")
+    sources = sorted({r["source"] for r in rows})
+    if sources:
+        print("  costs from: " + "; ".join(sources))
+
+    print("\nRecommended settings:")
+    for r in rows:
+        knob = STAGES[r["stage"]].get("knob")
+        if knob:
+            print(f"  {knob}={r['recommended_workers']}")
+        elif r["stage"] == "video" and r["recommended_workers"] > 1:
+            print(f"  video: planned as one process (complete_video renders one batch at a time); "
+                  f"{r['recommended_workers']} processes on disjoint shards of the master would use this host")
+        elif r["stage"] == "audio":
+            print(f"  TTS_MAX_CONCURRENCY={r['recommended_workers']} (enough requests in flight to use the rate limit)")
+        elif r["stage"] in costs and r["recommended_workers"] > 1:
+            print(f"  {r['stage']}: planned as one process; {r['recommended_workers']} processes on disjoint "
+                  f"shards of the master would use this host")
+    # the deadline forecasts (scheduler.DeadlineTracker) use these planning rates
+    for stage in ("cards", "video"):
+        r = next((r for r in rows if r["stage"] == stage), None)
+        if r and r["customers"]:
+            per = r["seconds_per_customer"]
+            if abs(per - scheduler.seconds_per_customer(stage)) > 0.1 * per:
+                print(f"  REMINDERS_SECONDS_PER_{stage.upper()}={per:.2f}   (deadline forecast assumes "
+                      f"{scheduler.seconds_per_customer(stage):g})")
+
+    if args.window:
+        window_s = args.window * 3600
+        if total <= window_s:
+            print(f"\nFits the {args.window:g} h window with {_hms(window_s - total)} to spare.")
+        elif any(r["stage"] == "audio" and r["wall_s"] > window_s for r in rows):
+            print(f"\nDoes NOT fit the {args.window:g} h window: speech synthesis alone needs "
+                  f"{_hms(next(r['wall_s'] for r in rows if r['stage'] == 'audio'))} at the TTS rate limit; "
+                  f"more workers don't help. Raise the limit, start it earlier or use SPEECH_MODE=phrases.")
+        else:
+            n = workers_for_window(mix, enc, costs, stages, args.cores, args.memory_gb, window_s)
+            shards = n or workers_for_window(mix, enc, costs, stages, args.cores, args.memory_gb, window_s, shard=True)
+            print(f"\nDoes NOT fit the {args.window:g} h window ({_hms(total)} needed). "
+                  + (f"{n} worker(s) on this host would fit." if n else
+                     f"{shards} processes per stage on disjoint shards of the master would fit; the stages "
+                     f"don't shard the master themselves." if shards else
+                     f"Not on {args.cores} core(s): about {math.ceil(total / window_s)}x the capacity is needed."))
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({
+            "customers": mix, "encoded_seconds": enc, "costs": costs, "stages": rows,
+            "workers": args.workers, "cores": args.cores, "total_wall_s": total,
+        }, indent=2))
+        print(f"Plan written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,21 @@
 import os
 import pandas as pd
 from datetime import datetime, timedelta
+import customer_store
+import display_fields
+import change_set
+import instrumentation
+import profiling
 
 
 DATA_DIR = "data"
 OUTPUT_FILE = os.path.join(DATA_DIR, "customers_master.csv")
 OUTPUT_FILE_SPOKEN = os.path.join(DATA_DIR, "customers_master_spoken.csv")
 
+# Also write data/customers_master/<Language>.parquet so later stages can memory-map
+# just their language and columns instead of re-parsing the CSV (needs pyarrow).
+WRITE_COLUMNAR = True
+
 COLUMN_MAP = {
     "LOAN ACCOUNT NO": "loan_account_number",
     "CUSTOMER NAME": "name",
@@ -16,41 +25,68 @@ COLUMN_MAP = {
     "Account Last 4 Digits": "account_last4"
 }
 
-def process_language_csv(filepath: str, language: str) -> pd.DataFrame:
-    df = pd.read_csv(filepath)
-    df.rename(columns=COLUMN_MAP, inplace=True)
-    df["language"] = language
+def next_due_date() -> str:
     next_due = datetime.now().replace(day=5)
     if next_due < datetime.now():
         next_due += timedelta(days=30)
-    df["due_date"] = next_due.strftime("%d-%b-%Y")
+    return next_due.strftime("%d-%b-%Y")
+
+
+def process_language_csv(filepath: str, language: str, due_date: str = None) -> pd.DataFrame:
+    df = pd.read_csv(filepath, dtype=str).fillna("")
+    df.rename(columns=COLUMN_MAP, inplace=True)
+    df["language"] = language
+    df["due_date"] = due_date or next_due_date()
     df = df[[
         "name", "language", "loan_account_number",
-        "loan_amount", "due_date", "ifsc", "account_last4"
+        "loan_amount", "emi_amount", "due_date", "ifsc", "account_last4"
     ]]
     return df
 
 def create_master_csv():
     combined = []
+    due_date = next_due_date()
 
     for lang_file in os.listdir(DATA_DIR):
-        if lang_file.endswith(".csv") and lang_file not in ["customers_master.csv", "customers_master_spoken.csv"]:
+        if lang_file.endswith(".csv") and lang_file not in ["customers_master.csv", "customers_master_spoken.csv", os.path.basename(change_set.CHANGE_SET_CSV)]:
             language = lang_file.replace(".csv", "")
             filepath = os.path.join(DATA_DIR, lang_file)
             print(f"📂 Processing {filepath} ...")
-            combined.append(process_language_csv(filepath, language))
+            combined.append(process_language_csv(filepath, language, due_date))
 
     if not combined:
         print("⚠️ No CSV files found in 'data' directory.")
         return
 
     master_df = pd.concat(combined, ignore_index=True)
-    master_df.insert(0, "id", range(1, len(master_df) + 1))
+
+    # Compare against the previous run's master before overwriting it; matched
+    # loan accounts keep their id so downstream stages can skip unchanged customers.
+    previous = pd.read_csv(OUTPUT_FILE, dtype=str).fillna("") if os.path.exists(OUTPUT_FILE) else None
+    master_df, changes = change_set.diff_masters(master_df, previous, change_set.read_high_water())
+    # work the previous change set asked for and the stages haven't finished yet stays pending
+    changes, carried = change_set.carry_forward(changes, change_set.read_change_set())
+    change_set.write_change_set(changes)
+    print(f"🔁 Change set vs previous master: {change_set.summary(changes)} → {change_set.CHANGE_SET_CSV}")
+    if carried:
+        print(f"   {carried} customer(s) carried over from the previous change set, not yet rendered")
+    # display strings (₹ amounts, localized due date, 4-digit account) computed once, column-wise
+    master_df = display_fields.add_display_columns(master_df)
 
     # Save normal CSV
     master_df.to_csv(OUTPUT_FILE, index=False)
+    change_set.write_high_water(master_df["id"])
     print(f"\n✅ Master CSV successfully created at: {OUTPUT_FILE}")
 
+    if WRITE_COLUMNAR and customer_store.pq is not None:
+        out_dir = customer_store.write_master_dataset(master_df, OUTPUT_FILE)
+        print(f"✅ Columnar master (one parquet per language) written to: {out_dir}")
+    else:
+        # never leave a stale columnar copy behind that readers would prefer over the new CSV
+        customer_store.remove_master_dataset(OUTPUT_FILE)
+        if WRITE_COLUMNAR:
+            print("⚠️ pyarrow not installed; skipping columnar master (stages will read the CSV).")
+
 
 
 def main():
@@ -61,4 +97,6 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    instrumentation.init("prepare")
+    with instrumentation.span("stage.prepare"), profiling.stage("prepare"):
+        main()
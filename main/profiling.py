@@ -0,0 +1,283 @@
+"""Opt-in profiling for the pipeline stages.
+
+    python main/generate_cards.py --profile              # cProfile around the stage
+    python main/generate_cards.py --profile=sample       # low-overhead stack sampler instead
+    python main/main_pipeline.py --profile               # every stage (passed on via REMINDERS_PROFILE)
+
+REMINDERS_PROFILE_CUSTOMERS=N also keeps a separate profile for the N slowest
+customers (or video batches), REMINDERS_PROFILE_MEMORY=0 turns tracemalloc off.
+Everything lands in logs/profiles/<stage>-<time>/:
+
+    stage.prof / stage.collapsed    cProfile dump (pstats, snakeviz) / flamegraph stacks
+    stage_top.txt                   top functions by own and cumulative time, plus the
+                                    breakdown under the stage's focus function
+    slow_<id>.prof, slow_<id>_top.txt  the N slowest customers
+    memory.txt                      peak traced memory, per-customer peaks, top allocation sites
+"""
+import cProfile
+import heapq
+import io
+import os
+import pstats
+import sys
+import tracemalloc
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from pathlib import Path
+
+# ---------- CONFIG ----------
+ROOT = Path(".")
+PROFILE_DIR = ROOT / "logs" / "profiles"
+MODES = ("cprofile", "sample")
+SLOWEST_CUSTOMERS = int(os.getenv("REMINDERS_PROFILE_CUSTOMERS", "0"))
+TRACK_MEMORY = os.getenv("REMINDERS_PROFILE_MEMORY", "1") != "0"
+SAMPLE_INTERVAL = float(os.getenv("REMINDERS_PROFILE_INTERVAL", "0.005"))   # seconds
+TOP_N = int(os.getenv("REMINDERS_PROFILE_TOP", "30"))
+
+_active = None
+
+
+def requested_mode(argv=None):
+    """'cprofile', 'sample' or '' from --profile[=mode] on the command line or REMINDERS_PROFILE."""
+    argv = sys.argv[1:] if argv is None else argv
+    mode = os.getenv("REMINDERS_PROFILE", "")
+    for arg in argv:
+        if arg == "--profile":
+            mode = mode or "cprofile"
+        elif arg.startswith("--profile="):
+            mode = arg.split("=", 1)[1]
+    if mode in ("1", "true"):
+        mode = "cprofile"
+    if mode and mode not in MODES:
+        sys.exit(f"--profile must be one of {', '.join(MODES)} (got {mode!r})")
+    return mode
+
+
+class Sampler:
+    """Every `interval` seconds, record the stack of each non-daemon thread (collapsed, root first).
+
+    Samples taken while a thread is inside `customer()` are tagged with that
+    customer so the slowest ones can be written out on their own.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()                 # (tag, stack tuple) -> samples
+        self.tags = {}                          # thread id -> current customer
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            # daemon threads (this one, log listeners) mostly sit idle and would swamp the counts
+            busy = {t.ident for t in threading.enumerate() if not t.daemon}
+            for tid, frame in sys._current_frames().items():
+                if tid not in busy:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[(self.tags.get(tid), tuple(reversed(stack)))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self, tag=all):
+        lines = Counter()
+        for (t, stack), n in self.stacks.items():
+            if tag is all or t == tag:
+                lines[";".join(stack)] += n
+        return "".join(f"{stack} {n}\n" for stack, n in lines.most_common())
+
+    def top(self, focus=None, tag=all):
+        own, total, under = Counter(), Counter(), Counter()
+        samples = 0
+        for (t, stack), n in self.stacks.items():
+            if tag is not all and t != tag:
+                continue
+            samples += n
+            own[stack[-1]] += n
+            for fn in set(stack):
+                total[fn] += n
+            if focus:
+                depth = next((i for i, fn in enumerate(stack) if fn.startswith(focus + " ")), None)
+                if depth is not None:
+                    # time under focus, by the function it called (or itself)
+                    under[stack[depth + 1] if depth + 1 < len(stack) else stack[depth]] += n
+        ms = self.interval * 1000
+        out = [f"{samples} samples every {ms:g} ms (~{samples * self.interval:.1f}s of thread time)\n"]
+        for title, counts in (("own time", own), ("cumulative", total)):
+            out.append(f"\nTop {TOP_N} by {title}:")
+            out += [f"  {n:7d}  {n / samples:6.1%}  {fn}" for fn, n in counts.most_common(TOP_N)] if samples else []
+        if focus:
+            in_focus = sum(under.values())
+            out.append(f"\nInside {focus} ({in_focus} samples), by direct callee:")
+            out += [f"  {n:7d}  {n / in_focus:6.1%}  {fn}" for fn, n in under.most_common(TOP_N)]
+        return "\n".join(out) + "\n"
+
+
+def _pstats_report(stats, focus=None):
+    buf = io.StringIO()
+    stats.stream = buf
+    stats.sort_stats("tottime").print_stats(TOP_N)
+    stats.sort_stats("cumulative").print_stats(TOP_N)
+    if focus:
+        # where the focus function's time goes: font loading, textbbox, PNG encoding, ...
+        stats.sort_stats("cumulative").print_callees(rf"\b{focus}\b")
+    return buf.getvalue()
+
+
+class Profiler:
+    def __init__(self, stage, mode, focus=None, slowest=SLOWEST_CUSTOMERS, memory=TRACK_MEMORY):
+        self.stage = stage
+        self.mode = mode
+        self.focus = focus
+        self.slowest = slowest
+        self.memory = memory
+        self.out_dir = PROFILE_DIR / f"{stage}-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}"
+        self.profile = cProfile.Profile() if mode == "cprofile" else None
+        self.sampler = Sampler() if mode == "sample" else None
+        self.customer_stats = None          # every customer's cProfile, merged
+        self.slow = []                      # min-heap of (wall, n, id, cProfile or None)
+        self.memory_peaks = []              # (peak bytes, id)
+        self._n = 0
+        self.pid = os.getpid()
+
+    def start(self):
+        self.t0 = time.perf_counter()
+        if self.memory:
+            tracemalloc.start(10)
+        if self.sampler:
+            self.sampler.start()
+        if self.profile:
+            self.profile.enable()
+
+    @contextmanager
+    def customer(self, cid):
+        cid = str(cid)
+        own = None
+        if self.profile and self.slowest:
+            # a second cProfile can't run inside the first: pause the stage
+            # profile and merge this customer's stats back in at the end
+            self.profile.disable()
+            own = cProfile.Profile()
+            own.enable()
+        if self.sampler:
+            self.sampler.tags[threading.get_ident()] = cid
+        if self.memory:
+            tracemalloc.reset_peak()
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - t0
+            if self.memory:
+                self.memory_peaks.append((tracemalloc.get_traced_memory()[1], cid))
+            if self.sampler:
+                self.sampler.tags.pop(threading.get_ident(), None)
+            if own is not None:
+                own.disable()
+                if self.customer_stats is None:
+                    self.customer_stats = pstats.Stats(own)
+                else:
+                    self.customer_stats.add(own)
+                self.profile.enable()
+            self._n += 1
+            if self.slowest:
+                entry = (wall, self._n, cid, own)
+                if len(self.slow) < self.slowest:
+                    heapq.heappush(self.slow, entry)
+                else:
+                    heapq.heappushpop(self.slow, entry)
+
+    def stop(self):
+        if self.profile:
+            self.profile.disable()
+        if self.sampler:
+            self.sampler.stop()
+        wall = time.perf_counter() - self.t0
+        snapshot = peak = None
+        if self.memory:
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return self._write(wall, snapshot, peak)
+
+    def _write(self, wall, snapshot, peak):
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        header = f"stage={self.stage} mode={self.mode} wall={wall:.2f}s\n"
+        if self.profile:
+            stats = pstats.Stats(self.profile)
+            if self.customer_stats is not None:
+                stats.add(self.customer_stats)
+            stats.dump_stats(self.out_dir / "stage.prof")
+            report = _pstats_report(stats, self.focus)
+        else:
+            (self.out_dir / "stage.collapsed").write_text(self.sampler.collapsed())
+            report = self.sampler.top(self.focus)
+        (self.out_dir / "stage_top.txt").write_text(header + report)
+
+        for wall_c, _, cid, prof in sorted(self.slow, reverse=True):
+            name = f"slow_{cid}".replace(os.sep, "_")
+            if prof is not None:
+                pstats.Stats(prof).dump_stats(self.out_dir / f"{name}.prof")
+                report = _pstats_report(pstats.Stats(prof), self.focus)
+            elif self.sampler:
+                (self.out_dir / f"{name}.collapsed").write_text(self.sampler.collapsed(cid))
+                report = self.sampler.top(self.focus, tag=cid)
+            else:
+                continue
+            (self.out_dir / f"{name}_top.txt").write_text(f"customer={cid} wall={wall_c:.3f}s\n" + report)
+
+        lines = [header]
+        try:
+            import resource     # Unix-only; Windows reports have no max-RSS line
+            lines.append(f"max RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+        except ImportError:
+            pass
+        if snapshot is not None:
+            lines.append(f"peak traced Python memory: {peak / 1024 ** 2:.1f} MB")
+            if self.memory_peaks:
+                lines.append("\nHighest per-customer peaks:")
+                lines += [f"  {b / 1024 ** 2:8.1f} MB  {cid}" for b, cid in heapq.nlargest(10, self.memory_peaks)]
+            lines.append(f"\nTop {TOP_N} allocation sites still held at the end:")
+            lines += [f"  {stat}" for stat in snapshot.statistics("lineno")[:TOP_N]]
+        (self.out_dir / "memory.txt").write_text("\n".join(lines) + "\n")
+        return self.out_dir
+
+
+@contextmanager
+def stage(name, focus=None):
+    """Profile the block when --profile / REMINDERS_PROFILE asks for it; otherwise do nothing."""
+    global _active
+    mode = requested_mode()
+    if not mode:
+        yield None
+        return
+    _active = Profiler(name, mode, focus)
+    _active.start()
+    try:
+        yield _active
+    finally:
+        out = _active.stop()
+        _active = None
+        print(f"📊 Profile for {name} written to {out}")
+
+
+def customer(cid):
+    """Per-customer block inside a profiled stage (kept when it is among the N slowest).
+
+    Only the profiled process counts; forked pool workers get a no-op.
+    """
+    if _active is None or _active.pid != os.getpid():
+        return nullcontext()
+    return _active.customer(cid)
@@ -0,0 +1,192 @@
+"""On-demand render service: regenerate one customer's cards or video without a batch run.
+
+    python main/render_service.py --port 8780
+    curl -X POST localhost:8780/cards -d '{"id": 1, "language": "Hindi", "name": "...", ...}'
+    curl -X POST localhost:8780/video -d '{"id": 1, "language": "Hindi", "name": "...", ...}'
+    curl -X POST localhost:8780/video -d '{"id": 1, "language": "Hindi"}'    # reuse existing cards
+    curl -O localhost:8780/files/assets/generated_videos/hindi_1_video.mp4
+
+Fonts, decoded templates, base-video probes and (hls mode) shared segments are
+loaded once at startup and stay in memory, so a request only pays for drawing
+the two cards and compositing one video.
+"""
+import argparse
+import json
+import mimetypes
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pandas as pd
+
+import complete_video
+import display_fields
+import generate_cards
+from prepare_customer_csv import next_due_date
+
+# ---------- CONFIG ----------
+ROOT = Path(".")
+SERVE_DIRS = [generate_cards.GENERATED, complete_video.OUTPUT_DIR]
+MAX_VIDEO_RENDERS = int(os.getenv("RENDER_SERVICE_MAX_VIDEOS", str(os.cpu_count() or 2)))
+CARD_FIELDS = ["name", "loan_account_number", "loan_amount", "emi_amount", "ifsc", "account_last4"]
+
+# PIL font objects are shared through the warm cache and FreeType faces aren't
+# safe to draw with from two threads, so card drawing is serialized (it is the
+# short step); video encodes run in ffmpeg processes and may overlap.
+_card_lock = threading.Lock()
+_video_slots = threading.BoundedSemaphore(MAX_VIDEO_RENDERS)
+_id_locks = {}
+_id_locks_guard = threading.Lock()
+
+
+def customer_lock(lang, cid):
+    """One request at a time per customer, so two agents can't write the same files at once."""
+    with _id_locks_guard:
+        return _id_locks.setdefault((lang.lower(), cid), threading.Lock())
+
+
+def warm(languages=None):
+    """Load fonts and templates and probe base videos before the first request."""
+    t0 = time.monotonic()
+    languages = languages or list(generate_cards.TEMPLATE_MAP)
+    for lang in languages:
+        for name in generate_cards.TEMPLATE_MAP.get(lang, []):
+            if (generate_cards.TEMPLATES / name).exists():
+                generate_cards.load_template(name)
+        complete_video.language_context(lang.capitalize())
+    for size in range(10, 120, 2):   # every size draw_text_auto_fit can step through
+        generate_cards.get_font_for_lang("english", size)
+    print(f"Warm-up done in {time.monotonic() - t0:.1f}s ({', '.join(languages)})")
+
+
+def customer_row(record):
+    """One customer record → the same row shape generate_for_row gets from the master."""
+    record = dict(record)
+    record.setdefault("due_date", next_due_date())
+    df = pd.DataFrame([{k: "" if v is None else str(v) for k, v in record.items()}])
+    return display_fields.add_display_columns(df).to_dict(orient="records")[0]
+
+
+def render_cards(record):
+    row = customer_row(record)
+    with _card_lock:
+        written = generate_cards.generate_for_row(row)
+    if set(written) != {"loan", "emi"}:
+        raise RuntimeError(f"cards not written for id={row['id']} (missing template?)")
+    return written
+
+
+def render_video(lang, cid):
+    ctx = complete_video.language_context(lang)
+    if ctx is None:
+        raise RuntimeError(f"no usable base video for language {lang!r}")
+    job = complete_video.plan_customer({"id": cid}, lang, ctx["static_card"])
+    with _video_slots:
+        done = complete_video.render_for_language([job], lang, ctx)
+    if cid not in done:
+        raise RuntimeError(f"video render failed for id={cid}")
+    return [out["file"] for out in job["outputs"]]
+
+
+def file_url(path):
+    return "/files/" + Path(path).as_posix()
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        print(f"  {self.address_string()} {fmt % args}")
+
+    def _json(self, status, body):
+        data = json.dumps(body, default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _record(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        record = json.loads(self.rfile.read(length) or b"{}")
+        cid = str(record.get("id") or "").strip()
+        lang = str(record.get("language") or "").strip()
+        if not cid or not lang:
+            raise ValueError("record needs 'id' and 'language'")
+        record["id"], record["language"] = cid, lang
+        return record
+
+    def do_POST(self):
+        t0 = time.monotonic()
+        try:
+            record = self._record()
+        except ValueError as e:
+            self._json(400, {"error": str(e)})
+            return
+        cid, lang = record["id"], record["language"]
+
+        if self.path not in ("/cards", "/video"):
+            self._json(404, {"error": "not found"})
+            return
+        try:
+            with customer_lock(lang, cid):
+                result = {"id": cid, "language": lang}
+                # /video without card fields reuses the cards already on disk
+                if self.path == "/cards" or any(record.get(f) for f in CARD_FIELDS):
+                    cards = render_cards(record)
+                    result["cards"] = {part: file_url(p) for part, p in cards.items()}
+                if self.path == "/video":
+                    result["video"] = [file_url(p) for p in render_video(lang, cid)]
+        except complete_video.MissingCards as e:
+            self._json(404, {"error": str(e)})
+            return
+        except Exception as e:
+            self._json(500, {"error": str(e)})
+            return
+        result["ms"] = round((time.monotonic() - t0) * 1000)
+        self._json(200, result)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._json(200, {"ok": True})
+            return
+        if not self.path.startswith("/files/"):
+            self._json(404, {"error": "not found"})
+            return
+        path = (ROOT / self.path[len("/files/"):]).resolve()
+        if not any(path.is_relative_to(d.resolve()) for d in SERVE_DIRS) or not path.is_file():
+            self._json(404, {"error": "not found"})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", mimetypes.guess_type(path.name)[0] or "application/octet-stream")
+        self.send_header("Content-Length", str(path.stat().st_size))
+        self.end_headers()
+        with open(path, "rb") as f:
+            while chunk := f.read(1024 * 1024):
+                self.wfile.write(chunk)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8780)
+    ap.add_argument("--languages", default="", help="comma-separated languages to warm (default: all)")
+    ap.add_argument("--no-warm", action="store_true", help="skip the start-up warm-up")
+    args = ap.parse_args()
+
+    generate_cards.init()
+    complete_video.OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    if not args.no_warm:
+        warm([l.strip().lower() for l in args.languages.split(",") if l.strip()])
+    server = ThreadingHTTPServer((args.host, args.port), RenderHandler)
+    print(f"Render service on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
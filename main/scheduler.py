@@ -0,0 +1,125 @@
+import heapq
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+# ---------- CONFIG ----------
+ROOT = Path(".")
+LOG_DIR = ROOT / "logs"
+
+# A reminder has to be out SEND_LEAD_DAYS before the due date, at SEND_HOUR.
+# REMINDERS_SEND_DEADLINE ("2025-12-02 09:00") overrides that with one cut-off for everybody.
+SEND_LEAD_DAYS = int(os.getenv("REMINDERS_SEND_LEAD_DAYS", "3"))
+SEND_HOUR = int(os.getenv("REMINDERS_SEND_HOUR", "9"))
+SEND_DEADLINE = os.getenv("REMINDERS_SEND_DEADLINE", "")
+
+# Planning rate per customer for the up-front forecast (seconds, one worker);
+# override with REMINDERS_SECONDS_PER_<STAGE>, e.g. REMINDERS_SECONDS_PER_VIDEO=6.
+SECONDS_PER_CUSTOMER = {"cards": 0.5, "audio": 2.0, "video": 8.0}
+
+
+def send_deadlines(df: pd.DataFrame) -> pd.Series:
+    """Latest time each customer's reminder can be ready; NaT when the due date is unknown."""
+    if SEND_DEADLINE:
+        return pd.Series(pd.Timestamp(SEND_DEADLINE), index=df.index)
+    if "due_on" in df.columns:
+        due = pd.to_datetime(df["due_on"], errors="coerce")
+    elif "due_date" in df.columns:
+        due = pd.to_datetime(df["due_date"], format="%d-%b-%Y", errors="coerce")
+    else:
+        return pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns]")
+    return due.dt.normalize() - pd.Timedelta(days=SEND_LEAD_DAYS) + pd.Timedelta(hours=SEND_HOUR)
+
+
+def prioritize(df: pd.DataFrame) -> pd.DataFrame:
+    """Rows ordered by send deadline (earliest first, unknown last), with a `send_by` column.
+
+    The sort is stable, so customers sharing a deadline keep their CSV order.
+    """
+    df = df.copy()
+    df["send_by"] = send_deadlines(df)
+    return df.sort_values("send_by", kind="mergesort", na_position="last").reset_index(drop=True)
+
+
+def interleave(jobs_by_group, batch_size):
+    """[(group, batch), ...] from per-group job lists that are already in priority order.
+
+    Each group (language) is cut into batches so a batch still shares one base
+    video; batches are then taken earliest-deadline-first across groups, with
+    ties going round-robin so no language waits behind another.
+    """
+    heap = []
+    for order, (group, jobs) in enumerate(jobs_by_group.items()):
+        for n, i in enumerate(range(0, len(jobs), max(1, batch_size))):
+            batch = jobs[i:i + batch_size]
+            first = min((j.get("send_by") for j in batch if pd.notna(j.get("send_by"))), default=pd.Timestamp.max)
+            heapq.heappush(heap, (first, n, order, group, batch))
+    while heap:
+        _, _, _, group, batch = heapq.heappop(heap)
+        yield group, batch
+
+
+def seconds_per_customer(stage):
+    return float(os.getenv(f"REMINDERS_SECONDS_PER_{stage.upper()}", SECONDS_PER_CUSTOMER.get(stage, 1.0)))
+
+
+class DeadlineTracker:
+    """Forecasts which customers of a stage will miss their send deadline, and records who did.
+
+    The forecast assumes the queue is worked in the given order at the stage's
+    planning rate; at the end the actual finish times replace it. Both are
+    written to logs/at_risk_<stage>.csv (only rows that are late or at risk).
+    """
+
+    def __init__(self, stage, ids, send_by, workers=1):
+        self.stage = stage
+        self.ids = [str(i) for i in ids]
+        self.send_by = dict(zip(self.ids, send_by))
+        self.started = datetime.now()
+        self.t0 = time.monotonic()
+        self.finished = {}
+
+        step = pd.Timedelta(seconds=seconds_per_customer(stage) / max(1, workers))
+        self.forecast = {cid: pd.Timestamp(self.started) + step * (n + 1) for n, cid in enumerate(self.ids)}
+        self.at_risk = {cid for cid in self.ids if self._late(cid, self.forecast[cid])}
+
+    def _late(self, cid, when):
+        deadline = self.send_by.get(cid)
+        return pd.notna(deadline) and when > deadline
+
+    def done(self, cid):
+        self.finished[str(cid)] = pd.Timestamp(self.started) + pd.Timedelta(seconds=time.monotonic() - self.t0)
+
+    def report(self, final=False):
+        """Write the at-risk list. Mid-run (final=False) it is the forecast; at the end it
+        lists customers finished after their deadline and any that never finished."""
+        rows = []
+        for cid in self.ids:
+            finished = self.finished.get(cid)
+            if finished is not None:
+                status = "late" if self._late(cid, finished) else None
+            elif final:
+                status = "not_done"
+            else:
+                status = "at_risk" if cid in self.at_risk else None
+            if status:
+                rows.append({"id": cid, "send_by": self.send_by[cid], "finished_at": finished,
+                             "forecast_finish": self.forecast[cid], "status": status})
+        out = pd.DataFrame(rows, columns=["id", "send_by", "finished_at", "forecast_finish", "status"])
+        LOG_DIR.mkdir(parents=True, exist_ok=True)
+        path = LOG_DIR / f"at_risk_{self.stage}.csv"
+        out.to_csv(path, index=False)
+        return out, path
+
+    def forecast_summary(self):
+        _, path = self.report()
+        return f"{len(self.at_risk)} of {len(self.ids)} customer(s) forecast to miss their send deadline → {path}"
+
+    def summary(self):
+        out, path = self.report(final=True)
+        counts = out["status"].value_counts()
+        return (f"{int(counts.get('late', 0))} finished after their send deadline, "
+                f"{int(counts.get('not_done', 0))} not done (of {len(self.ids)}) → {path}")
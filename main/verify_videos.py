@@ -0,0 +1,230 @@
+"""Sampled check of the personalised videos: are the right cards on screen?
+
+    python main/verify_videos.py                      # every customer in the master
+    python main/verify_videos.py --ids 12,40 --report-only
+    VIDEO_VERIFY=1 python main/complete_video.py      # check each batch as it is rendered
+
+Nothing is fully decoded. Per output the container metadata is checked against
+the language's base video: streams, duration and height. Then a few frames
+inside each TSPEC window are decoded with input seeking, in one ffmpeg call
+together with the cards expected there (c1 loan, c2 EMI, c3 the static card).
+Each frame is compared to its card by a difference hash. A frame must be close
+to the card and closer to it than to the plain base video at the same moment,
+which catches a customer who silently got a plain copy. A hash this small
+can't tell two customers' cards apart; it checks which card template is on
+screen, not the text.
+
+Failures are written to logs/verify_videos.csv. Unless --report-only is given,
+the failed outputs are moved to <output>/rejected/, so the next complete_video
+run renders those customers again.
+"""
+import argparse
+import csv
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import artifact_index
+import media_worker
+
+# ---------- CONFIG ----------
+ROOT = Path(".")
+REPORT_PATH = ROOT / "logs" / "verify_videos.csv"
+HASH_SIZE = 16                      # 16x16 difference hash = 256 bits
+MAX_DISTANCE = float(os.getenv("VERIFY_MAX_DISTANCE", "0.2"))   # share of differing bits to still count as the card
+SAMPLES_PER_WINDOW = int(os.getenv("VERIFY_SAMPLES_PER_WINDOW", "1"))
+DURATION_TOLERANCE = 0.5            # seconds, output vs base video
+WINDOW_CARDS = {"c1": "{id}_loan.png", "c2": "{id}_emi.png"}   # c3 is the language's static card
+
+
+def dhash(pixels: bytes):
+    """Difference hash of one (HASH_SIZE + 1) x HASH_SIZE grayscale frame: 1 bit per neighbour pair."""
+    w = HASH_SIZE + 1
+    bits = 0
+    for row in range(HASH_SIZE):
+        line = pixels[row * w:(row + 1) * w]
+        for x in range(HASH_SIZE):
+            bits = (bits << 1) | (line[x] > line[x + 1])
+    return bits
+
+
+def distance(a, b):
+    return bin(a ^ b).count("1") / (HASH_SIZE * HASH_SIZE)
+
+
+def frame_hashes(sources):
+    """dHashes of [(path, seconds or None for a still image), ...], from one ffmpeg run.
+
+    Each source is seeked on input (fast: from the nearest keyframe), reduced
+    to one tiny grayscale frame in the filter graph and concatenated into a
+    single raw stream.
+    """
+    cmd = ["ffmpeg", "-v", "error"]
+    filters = []
+    for n, (path, t) in enumerate(sources):
+        if t is not None:
+            cmd += ["-ss", f"{t:.3f}"]
+        cmd += ["-i", str(path)]
+        filters.append(f"[{n}:v]trim=end_frame=1,setpts=PTS-STARTPTS,"
+                       f"scale={HASH_SIZE + 1}:{HASH_SIZE}:flags=area,setsar=1,format=gray[f{n}]")
+    filters.append("".join(f"[f{n}]" for n in range(len(sources))) + f"concat=n={len(sources)}:v=1:a=0[out]")
+    cmd += ["-filter_complex", ";".join(filters), "-map", "[out]",
+            # passthrough: one output frame per source, however far apart their timestamps are
+            "-fps_mode", "passthrough", "-f", "rawvideo", "-pix_fmt", "gray", "-"]
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    size = (HASH_SIZE + 1) * HASH_SIZE
+    if proc.returncode != 0 or len(proc.stdout) < size * len(sources):
+        raise RuntimeError(proc.stderr.decode(errors="replace")[-1000:] or "no frames decoded")
+    return [dhash(proc.stdout[i * size:(i + 1) * size]) for i in range(len(sources))]
+
+
+def sample_times(start, end, n=SAMPLES_PER_WINDOW):
+    """n evenly spaced points strictly inside the window (away from the cut at either end)."""
+    return [start + (end - start) * (k + 1) / (n + 1) for k in range(n)]
+
+
+class Reference:
+    """What a language's outputs are checked against: the base video's metadata and frames."""
+
+    def __init__(self, base_vid, static_card, slots):
+        self.base_vid = base_vid
+        self.static_card = static_card
+        self.windows = {name: w for name, w in slots.items() if w[0] is not None}
+        info = media_worker.probe(base_vid)
+        self.duration = float(info.get("format", {}).get("duration") or 0)
+        self.width, self.height = media_worker.video_dimensions(base_vid)
+        self.has_audio = any(s.get("codec_type") == "audio" for s in info.get("streams") or [])
+        times = [(name, t) for name, (s, e) in self.windows.items() for t in sample_times(s, e)]
+        hashes = frame_hashes([(base_vid, t) for _, t in times])
+        self.base_hashes = {(name, t): h for (name, t), h in zip(times, hashes)}
+
+    def expected_cards(self, cid, generated_dir):
+        cards = {name: Path(generated_dir) / pattern.format(id=cid) for name, pattern in WINDOW_CARDS.items()}
+        if self.static_card:
+            cards["c3"] = Path(self.static_card)
+        return {name: card for name, card in cards.items() if name in self.windows}
+
+
+def check_container(path, ref, height=None):
+    try:
+        info = media_worker.probe(path)
+    except (OSError, RuntimeError, ValueError) as e:
+        return [f"unreadable: {str(e).strip()[:200]}"]
+    streams = info.get("streams") or []
+    video = [s for s in streams if s.get("codec_type") == "video"]
+    problems = []
+    if not video:
+        return ["no video stream"]
+    if ref.has_audio and not any(s.get("codec_type") == "audio" for s in streams):
+        problems.append("no audio stream")
+    duration = float(info.get("format", {}).get("duration") or 0)
+    if abs(duration - ref.duration) > DURATION_TOLERANCE:
+        problems.append(f"duration {duration:.2f}s, base is {ref.duration:.2f}s")
+    expected_h = height or ref.height
+    if int(video[0].get("height") or 0) != expected_h:
+        problems.append(f"height {video[0].get('height')}, expected {expected_h}")
+    return problems
+
+
+def check_frames(path, ref, cards):
+    """Problems found by comparing sampled frames of one output with the cards expected on screen."""
+    problems = []
+    present = {name: card for name, card in cards.items() if card.exists()}
+    for name, card in cards.items():
+        if name not in present:
+            problems.append(f"{name}: card {card} missing (rendered without it)")
+    samples = [(name, t) for name in present for t in sample_times(*ref.windows[name])]
+    if not samples:
+        return problems
+    try:
+        hashes = frame_hashes([(path, t) for _, t in samples] + [(present[name], None) for name in present])
+    except RuntimeError as e:
+        return problems + [f"frames could not be decoded: {str(e).strip()[:200]}"]
+    card_hash = dict(zip(present, hashes[len(samples):]))
+    for (name, t), frame in zip(samples, hashes):
+        to_card = distance(frame, card_hash[name])
+        to_base = distance(frame, ref.base_hashes[(name, t)])
+        if to_card > MAX_DISTANCE or to_card >= to_base:
+            what = "plain base video" if to_base < MAX_DISTANCE else "something else"
+            problems.append(f"{name} @ {t:.1f}s: shows {what} (card distance {to_card:.2f}, base {to_base:.2f})")
+    return problems
+
+
+def verify_outputs(cid, outputs, ref, generated_dir):
+    """{output file: [problems]} for one customer's outputs ([{"file", "height"}, ...])."""
+    cards = ref.expected_cards(cid, generated_dir)
+    results = {}
+    for out in outputs:
+        path = Path(out["file"])
+        if not path.exists():
+            results[path] = ["missing"]
+            continue
+        problems = check_container(path, ref, out.get("height"))
+        if "no video stream" not in problems and not any(p.startswith("unreadable") for p in problems):
+            problems += check_frames(path, ref, cards)
+        results[path] = problems
+    return results
+
+
+def reject(path: Path, rejected_dir: Path):
+    """Move a failed output aside: kept for inspection, and re-rendered by the next run."""
+    rejected_dir.mkdir(parents=True, exist_ok=True)
+    shutil.move(str(path), rejected_dir / path.name)
+    artifact_index.forget_paths([path])
+
+
+def write_report(rows, path=REPORT_PATH):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["id", "language", "file", "problems"])
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    import complete_video
+    import customer_store
+
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--ids", default="", help="comma-separated customer ids (default: everyone)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="outputs checked in parallel")
+    ap.add_argument("--report-only", action="store_true", help="don't move failed outputs to rejected/")
+    args = ap.parse_args()
+    only = {i.strip() for i in args.ids.split(",") if i.strip()}
+
+    checks = []
+    for lang, df in customer_store.iter_language_groups(columns=["id"], csv_path=complete_video.DATA_CSV):
+        lang = (lang or "english").strip()
+        base_vid = complete_video.find_language_asset(complete_video.BASE_VIDEOS_DIR, lang, ".mp4", "base_video")
+        if base_vid is None:
+            print(f"No base video for '{lang}'; skipping its customers")
+            continue
+        static_card = complete_video.find_language_asset(complete_video.STATIC_DIR, lang, "_Card_3.jpg", "static_card")
+        ref = Reference(base_vid, static_card, complete_video.slots)
+        for cid in df["id"].astype(str):
+            if not only or cid in only:
+                checks.append((cid, lang, complete_video.output_specs(lang, cid), ref))
+
+    print(f"Verifying {len(checks)} customer(s) ...")
+    failed_rows, rejected = [], 0
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = [(cid, lang, pool.submit(verify_outputs, cid, outs, ref, complete_video.GENERATED))
+                   for cid, lang, outs, ref in checks]
+        for cid, lang, fut in futures:
+            for path, problems in fut.result().items():
+                if not problems:
+                    continue
+                print(f"  id={cid} {path.name}: " + "; ".join(problems))
+                failed_rows.append({"id": cid, "language": lang, "file": str(path), "problems": "; ".join(problems)})
+                if not args.report_only and path.exists():
+                    reject(path, complete_video.OUTPUT_DIR / "rejected")
+                    rejected += 1
+    write_report(failed_rows)
+    print(f"{len(failed_rows)} output(s) failed → {REPORT_PATH}"
+          + (f"; {rejected} moved to {complete_video.OUTPUT_DIR / 'rejected'} for re-render" if rejected else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+import itertools
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: the quota ledger is locked with msvcrt instead
+    fcntl = None
+    import msvcrt
+
+import artifact_index
+import media_worker
+
+# Intermediates are written under a scratch root, not next to the final outputs:
+#   REMINDERS_SCRATCH_DIR  explicit location
+#   otherwise /dev/shm (tmpfs) when it has room for the quota, else output/scratch
+SCRATCH_DIR = os.getenv("REMINDERS_SCRATCH_DIR", "")
+SCRATCH_QUOTA_BYTES = int(os.getenv("REMINDERS_SCRATCH_QUOTA_BYTES", str(2 * 1024 ** 3)))  # 2 GB
+TMPFS_DIR = Path("/dev/shm")
+FALLBACK_DIR = Path("output") / "scratch"
+# "1" keeps upstream intermediates after the final artifact is verified (debugging)
+KEEP_INTERMEDIATES = os.getenv("REMINDERS_KEEP_INTERMEDIATES", "") == "1"
+QUOTA_POLL_SECONDS = 0.5
+
+
+def scratch_root(quota=SCRATCH_QUOTA_BYTES) -> Path:
+    if SCRATCH_DIR:
+        return Path(SCRATCH_DIR)
+    try:
+        if shutil.disk_usage(TMPFS_DIR).free >= quota:
+            return TMPFS_DIR / "reminders-scratch"
+    except OSError:
+        pass
+    return FALLBACK_DIR
+
+
+def _pid_alive(pid: int) -> bool:
+    if os.name == "nt":
+        # os.kill(pid, 0) would terminate the process on Windows: ask for its exit code instead
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)    # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        code = ctypes.c_ulong()
+        try:
+            return bool(kernel32.GetExitCodeProcess(handle, ctypes.byref(code))) and code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+@contextmanager
+def _exclusive(lock_path: Path):
+    """Hold an exclusive lock on lock_path across processes (flock, or msvcrt on Windows)."""
+    with open(lock_path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+            return
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)   # gives up after ~10 s: try again
+                break
+            except OSError:
+                continue
+        try:
+            yield
+        finally:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def dir_bytes(path: Path) -> int:
+    total = 0
+    for dirpath, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.stat(os.path.join(dirpath, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def verify_video(path) -> bool:
+    """A finished artifact is a readable container with a video stream and a duration."""
+    try:
+        info = media_worker.probe(path)
+    except (OSError, RuntimeError, ValueError):
+        return False
+    has_video = any(s.get("codec_type") == "video" for s in info.get("streams") or [])
+    return has_video and float(info.get("format", {}).get("duration") or 0) > 0
+
+
+class Workspace:
+    """Per-customer scratch directories under a disk quota shared by every process using the root.
+
+    Each customer in flight leaves a reservation in `<root>/.reservations`;
+    `customer()` blocks while the space held by all of them (the larger of what
+    was reserved and what the customer's directory really holds) plus its own
+    estimate would exceed the quota, so stage processes sharing the scratch disk
+    slow down instead of filling it. A customer is always let through when
+    nothing else is in flight. A customer's directory is removed when its block
+    exits, success or not; `publish()` moves a verified file out to its final
+    place first.
+    """
+
+    def __init__(self, stage, root=None, quota=SCRATCH_QUOTA_BYTES):
+        base = Path(root) if root else scratch_root(quota)
+        self._clear_stale(base, stage)
+        self.root = base / f"{stage}-{os.getpid()}"
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.ledger = base / ".reservations"
+        self.ledger.mkdir(exist_ok=True)
+        self.lock_path = base / ".quota.lock"
+        self.quota = quota
+        self._seq = itertools.count()
+
+    @staticmethod
+    def _clear_stale(base: Path, stage):
+        """Drop scratch left by earlier runs of this stage that died mid-customer."""
+        if not base.is_dir():
+            return
+        for d in base.glob(f"{stage}-*"):
+            pid = d.name.rsplit("-", 1)[-1]
+            if pid.isdigit() and not _pid_alive(int(pid)):
+                shutil.rmtree(d, ignore_errors=True)
+
+    def held(self) -> int:
+        """Bytes held by the customers in flight in every process; drops dead processes' reservations."""
+        total = 0
+        for ticket in self.ledger.glob("*.json"):
+            pid = ticket.name.split("-", 1)[0]
+            if pid.isdigit() and not _pid_alive(int(pid)):
+                ticket.unlink(missing_ok=True)
+                continue
+            try:
+                r = json.loads(ticket.read_text())
+            except (FileNotFoundError, ValueError):
+                continue
+            total += max(r["bytes"], dir_bytes(Path(r["dir"])))
+        return total
+
+    def reserve(self, nbytes, path) -> Path:
+        """Wait until `nbytes` more fit in the quota, then record them for `path`; returns the ticket."""
+        ticket = self.ledger / f"{os.getpid()}-{next(self._seq)}.json"
+        while True:
+            with _exclusive(self.lock_path):
+                held = self.held()
+                # with nothing in flight anywhere there is no one to wait for
+                if not held or held + nbytes <= self.quota:
+                    ticket.write_text(json.dumps({"bytes": nbytes, "dir": str(path)}))
+                    return ticket
+            time.sleep(QUOTA_POLL_SECONDS)
+
+    def release(self, ticket):
+        ticket.unlink(missing_ok=True)
+
+    @contextmanager
+    def customer(self, key, estimate=0):
+        """Scratch directory for one customer's intermediates, reserved against the quota."""
+        path = self.root / str(key)
+        ticket = self.reserve(estimate, path)
+        try:
+            shutil.rmtree(path, ignore_errors=True)
+            path.mkdir(parents=True)
+            yield path
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+            self.release(ticket)
+
+    def publish(self, src, dest, verify=verify_video) -> bool:
+        """Move a finished scratch file to dest if it verifies; False leaves dest untouched."""
+        if verify is not None and not verify(src):
+            return False
+        dest = str(dest)
+        os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+        # scratch may be another filesystem: copy beside dest, then rename into place
+        part = dest + ".part"
+        shutil.move(str(src), part)
+        os.replace(part, dest)
+        return True
+
+    def close(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        for ticket in self.ledger.glob(f"{os.getpid()}-*.json"):
+            ticket.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def retire(paths):
+    """Remove upstream intermediates once the artifact built from them is verified.
+
+    Their artifact-index records go with them.
+    """
+    if KEEP_INTERMEDIATES:
+        return 0
+    freed = 0
+    artifact_index.forget_paths(paths)
+    for p in paths:
+        p = Path(p)
+        if p.is_dir():
+            freed += dir_bytes(p)
+            shutil.rmtree(p, ignore_errors=True)
+        elif p.exists():
+            freed += p.stat().st_size
+            p.unlink()
+    return freed
@@ -1,105 +1,123 @@
 import subprocess
 import os
-import pandas as pd
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+import artifact_index
+import customer_store
+import change_set
+import scheduler
+import media_worker
+import workspace
+import instrumentation
+import profiling
 
 # =========================
 # CONFIGURATION
 # =========================
 CSV_PATH = "data/customers_master.csv"
-MERGED_DIR = "output/merged_videos"
+# Only this language's customers are processed, not every id in the CSV: the
+# clips and cards used below are Hindi-only, so another language's customer
+# would get a Hindi intro/outro (or fail on a missing input).
+LANGUAGE = "Hindi"
 FINAL_DIR = "output/final_videos"
+# inputs come from the artifact index: base_part1/base_part2 (seperate_base_videos.py,
+# language-level) around the customer's merged_video (merge_audio.py)
 
-BASE_PART1 = "base_hindi_part1.mp4"
-BASE_PART2 = "base_hindi_part2.mp4"
-
-
-
-def normalize_clip(src_path: str, dest_path: str):
-    """Normalize a video clip to fix timestamps and audio."""
-    cmd = [
-        "ffmpeg", "-y",
-        "-i", src_path,
-        "-c:v", "libx264", "-preset", "fast",
-        "-c:a", "aac", "-b:a", "192k", "-ar", "48000", "-ac", "2",
-        "-fflags", "+genpts",
-        dest_path
-    ]
-    subprocess.run(cmd, check=True)
 
 
 def merge_videos(video_list, output_path):
-    """Merge multiple video clips into one final file."""
-    list_file = os.path.join(os.path.dirname(output_path), "temp_concat_list.txt")
-    with open(list_file, "w", encoding="utf-8") as f:
-        for v in video_list:
-            abs_path = os.path.abspath(v).replace("\\", "/")
-            f.write(f"file '{abs_path}'\n")
-
-    cmd = [
-        "ffmpeg", "-y",
-        "-f", "concat", "-safe", "0",
-        "-i", list_file,
-        "-c:v", "libx264", "-preset", "medium",
+    """Normalize and join clips in a single ffmpeg run.
+
+    The concat filter re-times every input (the old separate normalize pass
+    existed to fix timestamps), so each customer costs one process launch and
+    no fixed_* intermediates instead of a normalize run per clip plus a concat.
+    """
+    width, height = media_worker.video_dimensions(video_list[0])
+    cmd = ["ffmpeg", "-y"]
+    for v in video_list:
+        cmd += ["-i", v]
+
+    filter_parts = []
+    for i in range(len(video_list)):
+        filter_parts.append(f"[{i}:v]scale={width}:{height},setsar=1,format=yuv420p[v{i}]")
+        filter_parts.append(f"[{i}:a]aresample=48000,aformat=channel_layouts=stereo[a{i}]")
+    filter_parts.append("".join(f"[v{i}][a{i}]" for i in range(len(video_list)))
+                        + f"concat=n={len(video_list)}:v=1:a=1[v][a]")
+
+    cmd += [
+        "-filter_complex", ";".join(filter_parts),
+        "-map", "[v]", "-map", "[a]",
+        "-c:v", "libx264", *media_worker.x264_args("medium", "23"),
         "-c:a", "aac", "-b:a", "192k", "-ar", "48000", "-ac", "2",
         "-movflags", "+faststart",
         output_path
     ]
-    subprocess.run(cmd, check=True)
-    os.remove(list_file)
+    code, err = media_worker.run_ffmpeg(cmd)
+    if code != 0:
+        raise subprocess.CalledProcessError(code, cmd, stderr=err)
 
 
-def process_customer(cid):
+def process_customer(cid, ws):
     """Process video merging for a single customer ID."""
     print(f"\n🔹 Processing ID: {cid}")
-    part1 = os.path.join(MERGED_DIR, BASE_PART1)
-    middle = os.path.join(MERGED_DIR, f"{cid}_hindi.mp4")
-    part2 = os.path.join(MERGED_DIR, BASE_PART2)
-
-    # Ensure files exist
-    for clip in [part1, middle, part2]:
-        if not os.path.exists(clip):
-            print(f"⚠️ Missing file: {clip}")
-
-    # Normalize each clip
-    fixed_files = []
-    for clip in [part1, middle, part2]:
-        if os.path.exists(clip):
-            fixed_path = os.path.join(MERGED_DIR, f"fixed_{cid}_{os.path.basename(clip)}")
-            print(f"🎧 Normalizing: {os.path.basename(clip)}")
-            normalize_clip(clip, fixed_path)
-            fixed_files.append(fixed_path)
+    lang = LANGUAGE.lower()
+    sources = [(artifact_index.LANGUAGE_LEVEL, "base_part1"), (cid, "merged_video"), (artifact_index.LANGUAGE_LEVEL, "base_part2")]
+
+    # Ensure files exist: a video without one of its parts must not be published
+    clips = []
+    for owner, kind in sources:
+        clip = artifact_index.entry(owner, lang, kind)
+        if clip is None:
+            print(f"⚠️ Missing file: {kind} for {owner or lang}; skipping {cid}")
+            return
+        clips.append(clip)
 
     # Merge them
     output_path = os.path.join(FINAL_DIR, f"final_hindi_{cid}.mp4")
     print(f"🎬 Merging for ID {cid}...")
-    merge_videos(fixed_files, output_path)
+    with ws.customer(cid, estimate=sum(c["size"] for c in clips)) as scratch:
+        scratch_output = str(scratch / os.path.basename(output_path))
+        merge_videos([c["path"] for c in clips], scratch_output)
+        if not ws.publish(scratch_output, output_path):
+            print(f"❌ Merged video for {cid} failed verification; nothing published")
+            return
+    artifact_index.record(cid, lang, "final_video", output_path)
     print(f"✅ Done: {output_path}")
 
 
 def main():
     os.makedirs(FINAL_DIR, exist_ok=True)
-    os.makedirs(MERGED_DIR, exist_ok=True)
 
-    # Load CSV
-    df = pd.read_csv(CSV_PATH)
-    if "id" in df.columns:
-        ids = df["id"].astype(str).tolist()
-    elif "ID" in df.columns:
-        ids = df["ID"].astype(str).tolist()
-    else:
-        raise ValueError("❌ CSV must contain a column named 'id' or 'ID'")
+    # Load only the ids of this language's partition
+    # earliest send deadline first
+    df = scheduler.prioritize(customer_store.read_customers(LANGUAGE, columns=["id", "due_on", "due_date"], csv_path=CSV_PATH))
+    if "id" not in df.columns:
+        raise ValueError("❌ CSV must contain a column named 'id'")
+    ids = df["id"].astype(str).tolist()
 
     print(f"🧾 Found {len(ids)} customers in CSV")
 
-    if TEST_MODE:
-        # 🧪 Run only for one specific ID
-        test_id = ids[0]
-        print(f"\n🧪 TEST MODE ON → Running only for ID: {test_id}")
-        process_customer(test_id)
-    else:
-        # 🚀 Run for all customers
-        for cid in ids:
-            process_customer(cid)
+    with workspace.Workspace("complete_video") as ws:
+        if TEST_MODE:
+            # 🧪 Run only for one specific ID
+            test_id = ids[0]
+            print(f"\n🧪 TEST MODE ON → Running only for ID: {test_id}")
+            process_customer(test_id, ws)
+        else:
+            # 🚀 Run for all customers
+            # skip customers the change set says are untouched and already rendered
+            pending = change_set.pending_ids(change_set.load_change_set(), uses_due_date=True,
+                                             kinds=["final_video", "final_with_cards"])
+            # join_cards.py's output counts too: once it exists this stage's output may have been retired
+            done_ids = {c for c, _ in artifact_index.customers("final_video", LANGUAGE)
+                        | artifact_index.customers("final_with_cards", LANGUAGE)}
+            for cid in ids:
+                done = cid in done_ids and any(artifact_index.present(cid, LANGUAGE, k) for k in ("final_video", "final_with_cards"))
+                if pending is not None and cid not in pending and done:
+                    continue
+                with instrumentation.span("concat.customer", id=cid), profiling.customer(cid):
+                    process_customer(cid, ws)
 
     print("\n🏁 All done!")
 
@@ -110,4 +128,6 @@ def main():
 TEST_MODE = False  # 👈 Set to False to run for all customers
 
 if __name__ == "__main__":
-    main()
+    instrumentation.init("concat")
+    with instrumentation.span("stage.concat"), profiling.stage("concat", focus="process_customer"):
+        main()
@@ -1,80 +1,97 @@
-import pandas as pd
 import os
-import requests
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+import artifact_index
+import customer_store
+import change_set
+import scheduler
+import instrumentation
+import profiling
+from tts_client import TTSClient
+from tts_cache import SpeechCache
+import phrase_assembly
 
 # ==================================================
 # 🗣️ STEP 1: Generate Speech Function
 # ==================================================
-def generate_speech(text, lang_code, output_path):
-    ELEVEN_API_KEY = "sk_f69d64ab5822565596479fab3500a503cf72a50a133794ba"   # Replace safely
-    MODEL_ID = "eleven_multilingual_v2"
-    VOICE_ID = "21m00Tcm4TlvDq8ikWAM"  # Multilingual voice
+ELEVEN_API_KEY = os.getenv("ELEVEN_API_KEY", "sk_f69d64ab5822565596479fab3500a503cf72a50a133794ba")   # Replace safely
+MODEL_ID = "eleven_multilingual_v2"
+VOICE_ID = "21m00Tcm4TlvDq8ikWAM"  # Multilingual voice
+VOICE_SETTINGS = {"stability": 0.4, "similarity_boost": 0.8}
 
-    url = f"https://api.elevenlabs.io/v1/text-to-speech/{VOICE_ID}"
+# "full": one TTS call per sentence. "phrases": splice cached fixed-wording and
+# per-token clips (digits, amounts, month names) — see phrase_assembly.py.
+SPEECH_MODE = os.getenv("SPEECH_MODE", "full")
 
-    headers = {
-        "Accept": "audio/mpeg",
-        "Content-Type": "application/json",
-        "xi-api-key": ELEVEN_API_KEY,
-    }
 
-    payload = {
-        "text": text,
-        "model_id": MODEL_ID,
-        "voice_settings": {"stability": 0.4, "similarity_boost": 0.8},
-    }
+def make_client():
+    """Pooled, rate-limited, retrying client (limits via TTS_* env vars, see tts_client.py)."""
+    return TTSClient(ELEVEN_API_KEY, VOICE_ID, MODEL_ID, VOICE_SETTINGS)
 
-    response = requests.post(url, headers=headers, json=payload)
 
-    if response.status_code == 200:
-        with open(output_path, "wb") as f:
-            f.write(response.content)
-        print(f"✅ Saved: {output_path}")
-    else:
-        print(f"❌ Error {response.status_code}: {response.text}")
+def generate_speech(text, lang_code, output_path, client=None, cache=None):
+    own_client = client is None
+    client = client or make_client()
+    try:
+        results = client.synthesize_many([(text, lang_code, output_path)], cache=cache)
+    finally:
+        if own_client:
+            client.close()
+    return results[output_path] is None
 
 
 # ==================================================
 # 💬 STEP 2: Two-sentence dynamic text
 # ==================================================
-def make_two_segments(row):
-    name = row["name"]
-    loan_no = row["loan_account_number"]
-    loan_amount = row["loan_amount"]
-    emi_amount = row["emi_amount"]
-    due_date = row["due_date"]
-    ifsc = row["ifsc"]
-    last4 = str(row.get("account_last4", "XXXX"))
-    lang = row["language"].strip().lower()
-
-    templates = {
-        "hindi": [
-            f"प्रिय {name}, आपका लोन नंबर {loan_no} है, जिसकी स्वीकृत राशि {loan_amount} है।",
-            f" आपकी मासिक ईएमआई {emi_amount} निर्धारित की गई है, जिसकी अगली देय तिथि {due_date} है। आपका बैंक खाता, जिसका अंतिम चार अंक {last4} हैं, और IFSC कोड {ifsc} है, से यह राशि स्वतः काटी जाएगी।"
-        ],
-
-        "tamil": [
-            f"அன்புடையீர் {name}, உங்கள் கடன் எண் {loan_no}, கடன் தொகை {loan_amount} ரூபாய்.",
-            f" மாதாந்திர EMI {emi_amount} ரூபாய், கடைசி தேதி {due_date}. உங்கள் வங்கி கணக்கு (கடைசி நான்கு இலக்கங்கள் {last4}) மற்றும் IFSC குறியீடு {ifsc} இலிருந்து இந்த தொகை தானாகக் கழிக்கப்படும்."
-        ],
-
-        "telugu": [
-            f"ప్రియమైన {name}, మీ రుణ సంఖ్య {loan_no}, మొత్తం {loan_amount} రూపాయలు.",
-            f" మీ EMI {emi_amount} రూపాయలు, గడువు తేదీ {due_date}. మీ బ్యాంక్ ఖాతా చివరి నాలుగు అంకెలు {last4}, IFSC కోడ్ {ifsc} నుండి ఈ మొత్తం స్వయంగా తీసుకోబడుతుంది."
-        ],
-
-        "kannada": [
-            f"ಆದರನೀಯ {name}, ನಿಮ್ಮ ಸಾಲ ಸಂಖ್ಯೆ {loan_no}, ಸಾಲ ಮೊತ್ತ {loan_amount} ರೂಪಾಯಿ.",
-            f" ನಿಮ್ಮ ಇಎಂಐ {emi_amount} ರೂಪಾಯಿ ಆಗಿದ್ದು, ಪಾವತಿ ದಿನಾಂಕ {due_date}. ನಿಮ್ಮ ಬ್ಯಾಂಕ್ ಖಾತೆಯ ಕೊನೆಯ ನಾಲ್ಕು ಅಂಕೆಗಳು {last4}, IFSC ಕೋಡ್ {ifsc} ಇಂದ ಈ ಮೊತ್ತ ಸ್ವಯಂಚಾಲಿತವಾಗಿ ಕಡಿತಗೊಳ್ಳುತ್ತದೆ."
-        ],
-
-        "english": [
-            f"Dear {name}, your loan number is {loan_no} with a sanctioned amount of {loan_amount} rupees.",
-            f" Your monthly EMI is {emi_amount}, due on {due_date}. The amount will be auto-debited from your bank account ending with {last4}, having IFSC code {ifsc}."
-        ],
+# Plain str.format templates (not f-strings) so phrase_assembly can split them
+# into fixed wording and customer slots.
+SEGMENT_TEMPLATES = {
+    "hindi": [
+        "प्रिय {name}, आपका लोन नंबर {loan_no} है, जिसकी स्वीकृत राशि {loan_amount} है।",
+        " आपकी मासिक ईएमआई {emi_amount} निर्धारित की गई है, जिसकी अगली देय तिथि {due_date} है। आपका बैंक खाता, जिसका अंतिम चार अंक {last4} हैं, और IFSC कोड {ifsc} है, से यह राशि स्वतः काटी जाएगी।"
+    ],
+
+    "tamil": [
+        "அன்புடையீர் {name}, உங்கள் கடன் எண் {loan_no}, கடன் தொகை {loan_amount} ரூபாய்.",
+        " மாதாந்திர EMI {emi_amount} ரூபாய், கடைசி தேதி {due_date}. உங்கள் வங்கி கணக்கு (கடைசி நான்கு இலக்கங்கள் {last4}) மற்றும் IFSC குறியீடு {ifsc} இலிருந்து இந்த தொகை தானாகக் கழிக்கப்படும்."
+    ],
+
+    "telugu": [
+        "ప్రియమైన {name}, మీ రుణ సంఖ్య {loan_no}, మొత్తం {loan_amount} రూపాయలు.",
+        " మీ EMI {emi_amount} రూపాయలు, గడువు తేదీ {due_date}. మీ బ్యాంక్ ఖాతా చివరి నాలుగు అంకెలు {last4}, IFSC కోడ్ {ifsc} నుండి ఈ మొత్తం స్వయంగా తీసుకోబడుతుంది."
+    ],
+
+    "kannada": [
+        "ಆದರನೀಯ {name}, ನಿಮ್ಮ ಸಾಲ ಸಂಖ್ಯೆ {loan_no}, ಸಾಲ ಮೊತ್ತ {loan_amount} ರೂಪಾಯಿ.",
+        " ನಿಮ್ಮ ಇಎಂಐ {emi_amount} ರೂಪಾಯಿ ಆಗಿದ್ದು, ಪಾವತಿ ದಿನಾಂಕ {due_date}. ನಿಮ್ಮ ಬ್ಯಾಂಕ್ ಖಾತೆಯ ಕೊನೆಯ ನಾಲ್ಕು ಅಂಕೆಗಳು {last4}, IFSC ಕೋಡ್ {ifsc} ಇಂದ ಈ ಮೊತ್ತ ಸ್ವಯಂಚಾಲಿತವಾಗಿ ಕಡಿತಗೊಳ್ಳುತ್ತದೆ."
+    ],
+
+    "english": [
+        "Dear {name}, your loan number is {loan_no} with a sanctioned amount of {loan_amount} rupees.",
+        " Your monthly EMI is {emi_amount}, due on {due_date}. The amount will be auto-debited from your bank account ending with {last4}, having IFSC code {ifsc}."
+    ],
+}
+
+
+def segment_values(row):
+    # display strings precomputed in prepare_customer_csv (see display_fields.py)
+    return {
+        "name": row["name"],
+        "loan_no": row["loan_account_number"],
+        "loan_amount": row["loan_amount_num"],
+        "emi_amount": row["emi_amount_num"],
+        "due_date": row["due_date_local"],
+        "ifsc": row["ifsc"],
+        "last4": str(row.get("account_last4", "XXXX")),
     }
 
-    return templates.get(lang, templates["english"]), lang
+
+def make_two_segments(row):
+    lang = row["language"].strip().lower()
+    values = segment_values(row)
+    templates = SEGMENT_TEMPLATES.get(lang, SEGMENT_TEMPLATES["english"])
+    return [t.format(**values) for t in templates], lang
 
 
 # ==================================================
@@ -82,23 +99,56 @@ def make_two_segments(row):
 # ==================================================
 def process_csv(csv_path, output_dir="output_2clips"):
     os.makedirs(output_dir, exist_ok=True)
-    df = pd.read_csv(csv_path)
-
+    # earliest send deadline first: jobs are submitted to the client in this order
+    df = scheduler.prioritize(customer_store.read_customers(csv_path=csv_path))
+
+    # Only new/changed customers need speech again; the first sentence has no
+    # due date in it, so a due-date-only change re-synthesizes just clip 02.
+    changes = change_set.load_change_set()
+    todo = [change_set.pending_ids(changes, uses_due_date=False, kinds=["audio1"]),
+            change_set.pending_ids(changes, uses_due_date=True, kinds=["audio2"])]
+
+    # collect every clip first, then synthesize them concurrently over one pooled client;
+    # clips already made are known from the artifact index, not a stat() per file
+    have = [artifact_index.customers("audio1"), artifact_index.customers("audio2")]
+    jobs, clips = [], {}
     for _, row in df.iterrows():
         segments, lang = make_two_segments(row)
+        templates = SEGMENT_TEMPLATES.get(lang, SEGMENT_TEMPLATES["english"])
+        values = segment_values(row)
         cid = str(row["id"])
         customer_dir = os.path.join(output_dir, f"{cid}_{lang}")
-        os.makedirs(customer_dir, exist_ok=True)
-
-        print(f"\n🎙️ Generating 2 audio clips for {row['name']} ({lang})...")
 
         for i, text in enumerate(segments, start=1):
             file_path = os.path.join(customer_dir, f"{i:02d}_{lang}.mp3")
-            generate_speech(text, lang, file_path)
+            pending = todo[i - 1] if i <= len(todo) else None
+            if pending is None or cid in pending or (cid, lang) not in have[i - 1] \
+                    or not artifact_index.present(cid, lang, f"audio{i}"):
+                os.makedirs(customer_dir, exist_ok=True)
+                clips[file_path] = (cid, lang, f"audio{i}")
+                if SPEECH_MODE == "phrases":
+                    jobs.append((templates[i - 1], values, lang, file_path))
+                else:
+                    jobs.append((text, lang, file_path))
+
+    print(f"\n🎙️ Generating {len(jobs)} audio clip(s) for {len(df)} customers ({SPEECH_MODE} mode)...")
+    # identical texts (same EMI / IFSC / due date) are synthesized once and shared
+    with make_client() as client:
+        if SPEECH_MODE == "phrases":
+            results = phrase_assembly.assemble_many(jobs, client, SpeechCache())
+        else:
+            results = client.synthesize_many(jobs, cache=SpeechCache())
+
+    failed = [path for path, error in results.items() if error]
+    artifact_index.record_many([(*clips[path], path) for path, error in results.items() if not error])
+    print(f"\n🏁 {len(results) - len(failed)} clip(s) saved, {len(failed)} failed")
+    return results
 
 
 # ==================================================
 # 🚀 MAIN
 # ==================================================
 if __name__ == "__main__":
-    process_csv("data/customers_master_spoken.csv")
+    instrumentation.init("audio")
+    with instrumentation.span("stage.audio"), profiling.stage("audio", focus="generate_speech"):
+        process_csv("data/customers_master_spoken.csv")
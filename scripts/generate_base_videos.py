@@ -1,5 +1,10 @@
+import glob
+import hashlib
 import os
+import random
 import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 
 # ==========================================
@@ -7,11 +12,24 @@ import requests
 # ==========================================
 HEYGEN_API_KEY = os.getenv("HEYGEN_API_KEY", "sk_V2_hgu_kxLruCQ2C0a_mDsDfxQfiirKohMpJ26PXDz1q4P0YAo0")
 
+HEYGEN_BASE_URL = os.getenv("HEYGEN_BASE_URL", "https://api.heygen.com")  # point at scripts/stub_server.py to test
+
 OUTPUT_DIR = "output/base_videos"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 AVATAR_ID = "Adriana_Business_Front_public"
 
+# polling: start fast, back off while the render is still running
+POLL_TIMEOUT = 600          # seconds per language (was 60 x 10s)
+POLL_FIRST_DELAY = 5
+POLL_MAX_DELAY = 30
+POLL_BACKOFF = 1.5
+
+DOWNLOAD_CHUNK = 1024 * 1024
+DOWNLOAD_RETRIES = 5
+
+session = requests.Session()
+
 LANG_VOICE = {
     "hindi": {"voice_id": "dcf69bbbab5b41f2b75b9f86316c06c5"},
     "tamil": {"voice_id": "f37bfc7d0be8494c8fa103a4a47eed33"},
@@ -127,7 +145,7 @@ TEMPLATES = {
 # CREATE VIDEO
 # ==========================================
 def generate_video(lang, text, voice_id):
-    url = "https://api.heygen.com/v2/video/generate"
+    url = f"{HEYGEN_BASE_URL}/v2/video/generate"
     headers = {
         "Authorization": f"Bearer {HEYGEN_API_KEY}",
         "Content-Type": "application/json"
@@ -152,7 +170,7 @@ def generate_video(lang, text, voice_id):
         "dimension": {"width": 1280, "height": 720}
     }
 
-    response = requests.post(url, headers=headers, json=payload)
+    response = session.post(url, headers=headers, json=payload, timeout=30)
     if response.status_code != 200:
         print(f"❌ Failed for {lang}: {response.status_code} - {response.text}")
         return None
@@ -170,54 +188,148 @@ def generate_video(lang, text, voice_id):
 # ==========================================
 # POLL STATUS AND DOWNLOAD (v2 FIXED)
 # ==========================================
-def download_video(video_id, lang):
-    status_url = f"https://api.heygen.com/v1/video/status?video_id={video_id}"
+def wait_for_video_url(video_id, lang):
+    """Poll the render status with growing delays; returns the video URL or None on timeout."""
+    status_url = f"{HEYGEN_BASE_URL}/v1/video/status?video_id={video_id}"
     headers = {"Authorization": f"Bearer {HEYGEN_API_KEY}"}
 
     print(f"⏳ Waiting for {lang} video to render...")
 
-    for attempt in range(60):  # up to 10 minutes
-        time.sleep(10)
+    deadline = time.monotonic() + POLL_TIMEOUT
+    delay = POLL_FIRST_DELAY
+    attempt = 0
+    while time.monotonic() < deadline:
+        time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+        attempt += 1
         try:
-            r = requests.get(status_url, headers=headers, timeout=15)
+            r = session.get(status_url, headers=headers, timeout=15)
             if r.status_code != 200:
                 print(f"⚠️ [{lang}] Status check failed ({r.status_code}), retrying...")
-                continue
-
-            data = r.json().get("data", {})
-            status = data.get("status")
-            video_url = data.get("video_url")
-
-            print(f"🔍 [{lang}] Attempt {attempt+1}/60 → status: {status}")
-
-            # ✅ If video_url available (even if status says 'failed'), download it
-            if video_url:
-                output_path = os.path.join(OUTPUT_DIR, f"{lang}.mp4")
-                print(f"⬇️ [{lang}] Downloading from {video_url} ...")
-                try:
-                    video_data = requests.get(video_url, timeout=30).content
-                    with open(output_path, "wb") as f:
-                        f.write(video_data)
-                    print(f"✅ [{lang}] Video saved successfully → {output_path}")
-                except Exception as e:
-                    print(f"⚠️ [{lang}] Download issue: {e}")
-                return
+            else:
+                data = r.json().get("data", {})
+                status = data.get("status")
+                video_url = data.get("video_url")
 
+                print(f"🔍 [{lang}] Attempt {attempt} → status: {status}")
+
+                # ✅ If video_url available (even if status says 'failed'), download it
+                if video_url:
+                    return video_url
         except Exception as e:
             print(f"⚠️ [{lang}] Network or JSON issue: {e}")
-            time.sleep(5)
+        delay = min(POLL_MAX_DELAY, delay * POLL_BACKOFF) * random.uniform(0.9, 1.1)
+
+    print(f"⚠️ [{lang}] Timeout: video not ready even after {POLL_TIMEOUT // 60} minutes.")
+    return None
+
+
+def looks_like_mp4(path):
+    with open(path, "rb") as f:
+        head = f.read(12)
+    return len(head) == 12 and head[4:8] == b"ftyp"
+
+
+def part_path_for(output_path, source):
+    """`<output>.<source tag>.part`: a partial download only resumes against the same render."""
+    tag = hashlib.sha256(str(source).encode("utf-8")).hexdigest()[:16]
+    return f"{output_path}.{tag}.part"
 
-    print(f"⚠️ [{lang}] Timeout: video not ready even after 10 minutes.")
+
+def stream_download(url, output_path, lang="", source=None):
+    """Download in chunks to a `.part` file, resuming with a Range request after a drop.
+
+    The .part is named after `source` (the render's video_id; the URL when not
+    given), and partial files of other renders for the same output are deleted
+    first, so bytes of an earlier render are never stitched onto a new one.
+    The finished file must match the server's advertised size and start with an
+    MP4 `ftyp` box before it replaces output_path.
+    """
+    part_path = part_path_for(output_path, source or url)
+    for stale in glob.glob(glob.escape(output_path) + ".*part"):
+        if stale != part_path:
+            print(f"🧹 [{lang}] Discarding partial download of another render: {stale}")
+            os.remove(stale)
+    expected = None
+
+    for attempt in range(DOWNLOAD_RETRIES):
+        have = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {"Range": f"bytes={have}-"} if have else {}
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=(10, 60)) as r:
+                if r.status_code == 416:
+                    break   # nothing left past what we have; verified below
+                if r.status_code == 206:
+                    total = r.headers.get("Content-Range", "").rpartition("/")[2]
+                    expected = int(total) if total.isdigit() else None
+                    mode = "ab"
+                elif r.status_code == 200:
+                    # server ignored the Range header: start over
+                    length = r.headers.get("Content-Length")
+                    expected = int(length) if length and length.isdigit() else None
+                    mode, have = "wb", 0
+                else:
+                    raise IOError(f"HTTP {r.status_code}")
+
+                if have:
+                    print(f"↩️ [{lang}] Resuming download at {have / 1e6:.1f} MB")
+                with open(part_path, mode) as f:
+                    for chunk in r.iter_content(DOWNLOAD_CHUNK):
+                        f.write(chunk)
+
+            size = os.path.getsize(part_path)
+            if expected is not None and size < expected:
+                raise IOError(f"short read: {size} of {expected} bytes")
+            break
+        except (requests.RequestException, IOError) as e:
+            print(f"⚠️ [{lang}] Download interrupted ({e}), retry {attempt + 1}/{DOWNLOAD_RETRIES}")
+            time.sleep(min(30, 2 ** attempt))
+    else:
+        return False
+
+    size = os.path.getsize(part_path)
+    if expected is not None and size != expected:
+        print(f"❌ [{lang}] Size mismatch: got {size} bytes, expected {expected}")
+        os.remove(part_path)
+        return False
+    if not looks_like_mp4(part_path):
+        print(f"❌ [{lang}] Downloaded file is not an MP4; discarding")
+        os.remove(part_path)
+        return False
+    os.replace(part_path, output_path)
+    return True
+
+
+def download_video(video_id, lang):
+    video_url = wait_for_video_url(video_id, lang)
+    if not video_url:
+        return None
+
+    output_path = os.path.join(OUTPUT_DIR, f"{lang}.mp4")
+    print(f"⬇️ [{lang}] Downloading from {video_url} ...")
+    if stream_download(video_url, output_path, lang, source=video_id):
+        print(f"✅ [{lang}] Video saved successfully → {output_path}")
+        return output_path
+    print(f"⚠️ [{lang}] Download failed")
+    return None
 
 
 # ==========================================
 # MAIN EXECUTION
 # ==========================================
 if __name__ == "__main__":
+    # submit every language up front, then wait on all renders at once:
+    # total time ≈ the slowest render instead of the sum of all of them
+    video_ids = {}
     for lang, customer in CUSTOMER_EXAMPLE.items():
         text = TEMPLATES[lang].format(**customer)
         voice_id = LANG_VOICE[lang]["voice_id"]
         print(f"🎬 Generating {lang} base video...")
         video_id = generate_video(lang, text, voice_id)
         if video_id:
-            download_video(video_id, lang)
+            video_ids[lang] = video_id
+
+    with ThreadPoolExecutor(max_workers=max(1, len(video_ids))) as pool:
+        results = dict(zip(video_ids, pool.map(download_video, video_ids.values(), video_ids.keys())))
+
+    for lang, path in results.items():
+        print(f"{'✅' if path else '❌'} {lang}: {path or 'not downloaded'}")
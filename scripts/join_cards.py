@@ -1,11 +1,25 @@
 import subprocess
 import os
-import pandas as pd
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+import artifact_index
+import customer_store
+import change_set
+import scheduler
+import media_worker
+import workspace
+import instrumentation
+import profiling
 
 # ==============================
 # CONFIGURATION
 # ==============================
 DATA_PATH = "data/customers_master.csv"
+# Only this language's customers are processed, not every id in the CSV: the
+# clips and cards used below are Hindi-only, so another language's customer
+# would get a Hindi intro/outro (or fail on a missing input).
+LANGUAGE = "Hindi"
 FINAL_VIDEOS_DIR = "output/final_videos"
 IMAGE1 = "assets/static/1.jpg"
 IMAGE2 = "assets/static/Hindi_Card_3.jpg"
@@ -28,31 +42,47 @@ def apply_templates_with_ffmpeg(input_video, output_video, image1, image2):
         "-map", "[vout]",
         "-map", "0:a?",  # keep original audio if available
         "-c:v", "libx264",
-        "-crf", "18",
-        "-preset", "veryfast",
+        *media_worker.x264_args("veryfast", "18"),
         "-c:a", "copy",
         "-y",  # overwrite
         output_video
     ]
 
     print(f"🎬 Applying templates to {os.path.basename(input_video)} ...")
-    subprocess.run(cmd, check=True)
+    code, err = media_worker.run_ffmpeg(cmd)
+    if code != 0:
+        raise subprocess.CalledProcessError(code, cmd, stderr=err)
     print(f"✅ Done: {output_video}\n")
 
 
-def process_customer(cust_id):
+def process_customer(cust_id, ws):
     """Apply templates to a single customer's video."""
-    input_video = os.path.join(FINAL_VIDEOS_DIR, f"final_hindi_{cust_id}.mp4")
+    lang = LANGUAGE.lower()
+    source = artifact_index.entry(cust_id, lang, "final_video")
     output_video = os.path.join(FINAL_VIDEOS_DIR, f"final_hindi_with_cards_{cust_id}.mp4")
 
-    if not os.path.exists(input_video):
+    if source is None:
         print(f"⚠️ Skipping {cust_id} — input video not found.")
         return
-
-    try:
-        apply_templates_with_ffmpeg(input_video, output_video, IMAGE1, IMAGE2)
-    except subprocess.CalledProcessError as e:
-        print(f"❌ FFmpeg failed for {cust_id}: {e}")
+    input_video = source["path"]
+
+    with ws.customer(cust_id, estimate=source["size"]) as scratch:
+        scratch_output = str(scratch / os.path.basename(output_video))
+        try:
+            apply_templates_with_ffmpeg(input_video, scratch_output, IMAGE1, IMAGE2)
+        except subprocess.CalledProcessError as e:
+            print(f"❌ FFmpeg failed for {cust_id}: {e}\n{(e.stderr or '')[-1000:]}")
+            return
+        if not ws.publish(scratch_output, output_video):
+            print(f"❌ {output_video} failed verification; keeping intermediates")
+            return
+    artifact_index.record(cust_id, lang, "final_with_cards", output_video)
+
+    # the final video is verified, so the chain's intermediates can go
+    merged = artifact_index.lookup(cust_id, lang, "merged_video")
+    freed = workspace.retire([input_video] + ([merged] if merged else []))
+    if freed:
+        print(f"🧹 Removed {freed / 1024 ** 2:.1f} MB of intermediates for {cust_id}")
 
 
 def main():
@@ -60,27 +90,35 @@ def main():
         print(f"❌ CSV not found: {DATA_PATH}")
         return
 
-    df = pd.read_csv(DATA_PATH)
+    # earliest send deadline first
+    df = scheduler.prioritize(customer_store.read_customers(LANGUAGE, columns=["id", "due_on", "due_date"], csv_path=DATA_PATH))
 
-    if "id" in df.columns:
-        ids = df["id"].astype(str).tolist()
-    elif "ID" in df.columns:
-        ids = df["ID"].astype(str).tolist()
-    else:
-        raise ValueError("❌ CSV must contain 'id' or 'ID' column")
+    if "id" not in df.columns:
+        raise ValueError("❌ CSV must contain 'id' column")
+    ids = df["id"].astype(str).tolist()
 
     print(f"🧾 Found {len(ids)} customers in CSV")
 
-    if TEST_MODE:
-        test_id = ids[0]
-        print(f"\n🧪 TEST MODE ON → Running only for ID: {test_id}")
-        process_customer(test_id)
-    else:
-        for cid in ids:
-            process_customer(cid)
+    with workspace.Workspace("join_cards") as ws:
+        if TEST_MODE:
+            test_id = ids[0]
+            print(f"\n🧪 TEST MODE ON → Running only for ID: {test_id}")
+            process_customer(test_id, ws)
+        else:
+            # skip customers the change set says are untouched and already rendered
+            pending = change_set.pending_ids(change_set.load_change_set(), uses_due_date=True, kinds=["final_with_cards"])
+            done_ids = {c for c, _ in artifact_index.customers("final_with_cards", LANGUAGE)}
+            for cid in ids:
+                if pending is not None and cid not in pending and cid in done_ids \
+                        and artifact_index.present(cid, LANGUAGE, "final_with_cards"):
+                    continue
+                with instrumentation.span("join_cards.customer", id=cid), profiling.customer(cid):
+                    process_customer(cid, ws)
 
     print("\n🏁 All done!")
 
 
 if __name__ == "__main__":
-    main()
+    instrumentation.init("join_cards")
+    with instrumentation.span("stage.join_cards"), profiling.stage("join_cards", focus="process_customer"):
+        main()
@@ -1,106 +1,109 @@
 import os
-import subprocess
-
-OUTPUT_CLIPS_DIR = "output_2clips"
-GENERATED_DIR = "assets/generated"
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+import artifact_index
+import change_set
+import customer_store
+import scheduler
+import media_worker
+import workspace
+import instrumentation
+import profiling
+
+CSV_PATH = "data/customers_master.csv"
+# inputs (output_2clips/ audio, assets/generated/ cards) are found through the artifact index
 FINAL_OUTPUT_DIR = "output/merged_videos"
 
 os.makedirs(FINAL_OUTPUT_DIR, exist_ok=True)
 
-def compose_customer_video(customer_id, lang):
+def compose_customer_video(customer_id, lang, ws):
     folder = f"{customer_id}_{lang}"
-    folder_path = os.path.join(OUTPUT_CLIPS_DIR, folder)
-
-    audio1 = os.path.join(folder_path, f"01_{lang}.mp3")
-    audio2 = os.path.join(folder_path, f"02_{lang}.mp3")
-    loan_img = os.path.join(GENERATED_DIR, f"{customer_id}_loan.png")
-    emi_img = os.path.join(GENERATED_DIR, f"{customer_id}_emi.png")
 
-    # Step 1: check files
-    if not (os.path.exists(audio1) and os.path.exists(audio2)):
+    # Step 1: find the inputs (artifact index, no filesystem probes)
+    found = [artifact_index.entry(customer_id, lang, kind) for kind in ("loan_card", "emi_card", "audio1", "audio2")]
+    if not (found[2] and found[3]):
         print(f"⚠️ Skipping {folder} — missing audio files")
         return
-    if not (os.path.exists(loan_img) and os.path.exists(emi_img)):
+    if not (found[0] and found[1]):
         print(f"⚠️ Skipping {folder} — missing image files")
         return
+    loan_img, emi_img, audio1, audio2 = (e["path"] for e in found)
 
     print(f"🎬 Processing {folder}")
 
-    # Step 2: join both audios
-    combined_audio = os.path.join(folder_path, "combined_audio.mp3")
-    list_file = os.path.join(folder_path, "audio_list.txt")
-    with open(list_file, "w") as f:
-        f.write(f"file '{os.path.abspath(audio1)}'\n")
-        f.write(f"file '{os.path.abspath(audio2)}'\n")
-
-    subprocess.run([
-        "ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", list_file,
-        "-c", "copy", combined_audio
-    ], stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
-
-    # Step 3: get durations using ffprobe
-    def get_duration(path):
-        result = subprocess.run(
-            ["ffprobe", "-v", "error", "-show_entries", "format=duration",
-             "-of", "csv=p=0", path],
-            capture_output=True, text=True
-        )
-        return float(result.stdout.strip())
-
-    dur1 = get_duration(audio1)
-    dur2 = get_duration(audio2)
+    # Durations come from the shared (per-process cached) probe.
+    dur1 = media_worker.duration(audio1)
+    dur2 = media_worker.duration(audio2)
     print(f"🕒 Durations → {dur1:.2f}s + {dur2:.2f}s")
 
-    # Step 4: make two image-based video clips
-    clip1 = os.path.join(folder_path, "clip1.mp4")
-    clip2 = os.path.join(folder_path, "clip2.mp4")
-
-    subprocess.run([
-        "ffmpeg", "-y", "-loop", "1", "-i", loan_img, "-t", str(dur1),
-        "-vf", "scale=1280:720", "-c:v", "libx264", "-pix_fmt", "yuv420p",
-        clip1
-    ], stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
-
-    subprocess.run([
-        "ffmpeg", "-y", "-loop", "1", "-i", emi_img, "-t", str(dur2),
-        "-vf", "scale=1280:720", "-c:v", "libx264", "-pix_fmt", "yuv420p",
-        clip2
-    ], stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
-
-    # Step 5: merge both clips
-    video_list = os.path.join(folder_path, "video_list.txt")
-    with open(video_list, "w") as f:
-        f.write(f"file '{os.path.abspath(clip1)}'\n")
-        f.write(f"file '{os.path.abspath(clip2)}'\n")
-
-    combined_video = os.path.join(folder_path, "combined_video.mp4")
-    subprocess.run([
-        "ffmpeg", "-y", "-f", "concat", "-safe", "0",
-        "-i", video_list, "-c", "copy", combined_video
-    ], stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
-
-    # Step 6: add combined audio to final video
+    # One ffmpeg run builds both still-image clips, joins them, joins the two
+    # audios and muxes the result — instead of five separate launches and four
+    # intermediate files (clip1/clip2/combined_video/combined_audio).
     final_output = os.path.join(FINAL_OUTPUT_DIR, f"{customer_id}_{lang}.mp4")
-    subprocess.run([
-        "ffmpeg", "-y", "-i", combined_video, "-i", combined_audio,
-        "-c:v", "copy", "-c:a", "aac", "-shortest", final_output
-    ], stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    inputs = [loan_img, emi_img, audio1, audio2]
+    with ws.customer(folder, estimate=2 * sum(e["size"] for e in found)) as scratch:
+        scratch_output = str(scratch / os.path.basename(final_output))
+        if not run_compose(folder, inputs, dur1, dur2, scratch_output):
+            return
+        if not ws.publish(scratch_output, final_output):
+            print(f"❌ Output failed verification for {folder}; nothing published")
+            return
+    artifact_index.record(customer_id, lang, "merged_video", final_output)
 
     print(f"✅ Video ready → {final_output}\n")
 
+
+def run_compose(folder, inputs, dur1, dur2, output):
+    loan_img, emi_img, audio1, audio2 = inputs
+    filter_complex = (
+        "[0:v]scale=1280:720,setsar=1,format=yuv420p[v0];"
+        "[1:v]scale=1280:720,setsar=1,format=yuv420p[v1];"
+        "[v0][v1]concat=n=2:v=1:a=0[v];"
+        "[2:a][3:a]concat=n=2:v=0:a=1[a]"
+    )
+    code, err = media_worker.run_ffmpeg([
+        "ffmpeg", "-y",
+        "-loop", "1", "-t", str(dur1), "-i", loan_img,
+        "-loop", "1", "-t", str(dur2), "-i", emi_img,
+        "-i", audio1, "-i", audio2,
+        "-filter_complex", filter_complex,
+        "-map", "[v]", "-map", "[a]",
+        "-c:v", "libx264", *media_worker.x264_args("medium", "23"), "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-shortest", output
+    ])
+    if code != 0:
+        print(f"❌ FFmpeg failed for {folder}:\n{err[-1000:]}")
+        return False
+    return True
+
 # -------------------------------------------
 # MAIN LOGIC WITH IF-ELSE
 # -------------------------------------------
 if __name__ == "__main__":
+    instrumentation.init("merge_audio")
     TEST_MODE = False   # 👈 change this to False to run for all customers
 
-    if TEST_MODE:
-        # 🧪 Run only for one specific ID (for testing)
-        compose_customer_video(1, "hindi")
-    else:
-        # 🚀 Run for all folders in output_2clips
-        for folder in os.listdir(OUTPUT_CLIPS_DIR):
-            if "_" not in folder:
-                continue
-            cust_id, lang = folder.split("_", 1)
-            compose_customer_video(cust_id, lang)
+    with workspace.Workspace("merge_audio") as ws, profiling.stage("merge_audio", focus="compose_customer_video"):
+        if TEST_MODE:
+            # 🧪 Run only for one specific ID (for testing)
+            compose_customer_video(1, "hindi", ws)
+        else:
+            # 🚀 Run for everyone with audio clips in the artifact index (skipping unchanged, already-composed customers)
+            pending = change_set.pending_ids(change_set.load_change_set(), uses_due_date=True,
+                                             kinds=["merged_video", "final_with_cards"])
+            # earliest send deadline first; unknown customers go last
+            order = scheduler.prioritize(customer_store.read_customers(columns=["id", "due_on", "due_date"], csv_path=CSV_PATH))
+            rank = {str(cid): n for n, cid in enumerate(order["id"])}
+            customers = sorted(artifact_index.customers("audio1"), key=lambda c: rank.get(c[0], len(rank)))
+            merged = artifact_index.customers("merged_video")
+            finished = artifact_index.customers("final_with_cards")
+            for cust_id, lang in customers:
+                # final_with_cards is the last artifact of the chain; once it exists this stage's output may have been retired
+                done = ((cust_id, lang) in merged and artifact_index.present(cust_id, lang, "merged_video")) \
+                    or ((cust_id, lang) in finished and artifact_index.present(cust_id, lang, "final_with_cards"))
+                if pending is not None and cust_id not in pending and done:
+                    continue
+                with instrumentation.span("merge_audio.customer", id=cust_id, language=lang), \
+                        profiling.customer(f"{cust_id}_{lang}"):
+                    compose_customer_video(cust_id, lang, ws)
@@ -0,0 +1,146 @@
+import os
+import re
+import string
+
+from pydub import AudioSegment
+
+# ==================================================
+# CONFIGURATION
+# ==================================================
+CROSSFADE_MS = int(os.getenv("PHRASE_CROSSFADE_MS", "30"))
+
+# How each template slot is broken into reusable speech units:
+#   "whole"  → the value is one unit (names)
+#   "spell"  → one unit per character (account numbers, IFSC: digits/letters shared by everyone)
+#   "words"  → one unit per word (due date: day, month name, year)
+#   "amount" → Indian-system number words: [n crore] [n lakh] [n thousand] [n hundred] [n]
+SLOT_UNITS = {
+    "name": "whole",
+    "loan_no": "spell",
+    "loan_amount": "amount",
+    "emi_amount": "amount",
+    "due_date": "words",
+    "ifsc": "spell",
+    "last4": "spell",
+}
+
+# Scale words per language for "amount" slots. Each n above (1-99) is a unit
+# of its own, voiced by the language's TTS, so about a hundred number units
+# plus these cover every amount instead of one clip per distinct amount.
+AMOUNT_SCALES = {
+    "hindi": {"crore": "करोड़", "lakh": "लाख", "thousand": "हज़ार", "hundred": "सौ"},
+    "tamil": {"crore": "கோடி", "lakh": "லட்சம்", "thousand": "ஆயிரம்", "hundred": "நூறு"},
+    "telugu": {"crore": "కోట్లు", "lakh": "లక్షలు", "thousand": "వేలు", "hundred": "వందలు"},
+    "kannada": {"crore": "ಕೋಟಿ", "lakh": "ಲಕ್ಷ", "thousand": "ಸಾವಿರ", "hundred": "ನೂರು"},
+    "english": {"crore": "crore", "lakh": "lakh", "thousand": "thousand", "hundred": "hundred"},
+}
+_SCALES = [("crore", 10 ** 7), ("lakh", 10 ** 5), ("thousand", 1000), ("hundred", 100)]
+
+_SPEAKABLE = re.compile(r"\w", re.UNICODE)
+
+
+def split_template(template):
+    """'Dear {name}, your loan…' → [("text", "Dear"), ("slot", "name"), ("text", ", your loan…")]"""
+    parts = []
+    for literal, field, _, _ in string.Formatter().parse(template):
+        if literal.strip():
+            parts.append(("text", literal.strip()))
+        if field:
+            parts.append(("slot", field))
+    return parts
+
+
+def amount_units(value, lang):
+    """'3,000,000' → ['30', 'लाख'] in Hindi; a value that isn't a whole number stays one unit."""
+    digits = value.replace(",", "")
+    if not digits.isdigit():
+        return [value] if value else []
+    n = int(digits)
+    if n == 0:
+        return ["0"]
+    words = AMOUNT_SCALES.get(lang, AMOUNT_SCALES["english"])
+    units = []
+    for scale, size in _SCALES:
+        count, n = divmod(n, size)
+        if scale == "crore" and count >= 100:
+            units.extend(amount_units(str(count), lang))     # 100+ crore: "1 hundred 20 crore"
+            units.append(words[scale])
+        elif count:
+            units += [str(count), words[scale]]
+    if n:
+        units.append(str(n))
+    return units
+
+
+def slot_units(field, value, lang="english"):
+    value = str(value or "").strip()
+    mode = SLOT_UNITS.get(field, "whole")
+    if mode == "amount":
+        return amount_units(value, lang)
+    if mode == "spell":
+        return [ch for ch in value if not ch.isspace()]
+    if mode == "words":
+        return value.split()
+    return [value] if value else []
+
+
+def plan_units(template, values, lang="english"):
+    """Ordered list of texts whose clips, joined, speak `template.format(**values)`.
+
+    Fixed wording stays in one unit per fragment so it is synthesized once per
+    language and voice; punctuation-only fragments are dropped.
+    """
+    units = []
+    for kind, part in split_template(template):
+        if kind == "text":
+            if _SPEAKABLE.search(part):
+                units.append(part)
+        else:
+            units.extend(slot_units(part, values.get(part), lang))
+    return units
+
+
+def join_clips(paths, output_path, crossfade_ms=CROSSFADE_MS):
+    """Concatenate clips with a short crossfade at every seam and write an mp3."""
+    combined = None
+    for path in paths:
+        seg = AudioSegment.from_file(path)
+        if combined is None:
+            combined = seg
+            continue
+        fade = min(crossfade_ms, len(seg), len(combined))
+        combined = combined.append(seg, crossfade=fade)
+    if combined is None:
+        raise ValueError("nothing to join")
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    combined.export(output_path, format="mp3")
+
+
+def assemble_many(jobs, client, cache, crossfade_ms=CROSSFADE_MS):
+    """Build [(template, values, lang, output_path), ...] from cached phrase and token clips.
+
+    Every unit across the whole batch is resolved through the cache first, so a
+    unit is only sent to TTS the first time any customer needs it.
+    Returns {output_path: error or None}.
+    """
+    plans = [(plan_units(template, values, lang), lang, path) for template, values, lang, path in jobs]
+    errors = client.ensure_cached([(u, lang) for units, lang, _ in plans for u in units], cache)
+
+    results = {}
+    for units, lang, path in plans:
+        keys = [client.key_for(u, lang) for u in units]
+        failed = next((errors[k] for k in keys if errors.get(k)), None)
+        if failed:
+            results[path] = failed
+            print(f"❌ Failed: {path} → {failed}")
+            continue
+        try:
+            join_clips([cache.path_for(k) for k in keys], path, crossfade_ms)
+        except Exception as e:
+            results[path] = str(e)
+            print(f"❌ Failed: {path} → {e}")
+            continue
+        results[path] = None
+        print(f"✅ Assembled: {path} ({len(keys)} units)")
+    cache.evict(keep=errors)    # after the joins: they read the clips straight from the cache
+    return results
@@ -1,5 +1,10 @@
 import subprocess
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+import artifact_index
+import media_worker
 
 INPUT = "assets/base_videos/base_hindi.mp4"
 OUTPUT_DIR = "output/merged_videos"
@@ -7,12 +12,12 @@ os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 # Define parts
 parts = [
-    ("0", "4", "base_hindi_part1.mp4"),
-    ("30", "50", "base_hindi_part2.mp4")
+    ("0", "4", "base_hindi_part1.mp4", "base_part1"),
+    ("30", "50", "base_hindi_part2.mp4", "base_part2")
 ]
 
 # Run FFmpeg for each segment
-for start, end, output in parts:
+for start, end, output, kind in parts:
     output_path = os.path.join(OUTPUT_DIR, output)
     cmd = [
         "ffmpeg", "-y",  # overwrite if exists
@@ -22,5 +27,9 @@ for start, end, output in parts:
         "-c", "copy",
         output_path
     ]
-    subprocess.run(cmd, check=True)
+    code, err = media_worker.run_ffmpeg(cmd)
+    if code != 0:
+        print(err[-1000:])
+        raise subprocess.CalledProcessError(code, cmd, stderr=err)
+    artifact_index.record(artifact_index.LANGUAGE_LEVEL, "hindi", kind, output_path)
     print(f"✅ Created: {output_path}")
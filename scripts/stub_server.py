@@ -0,0 +1,190 @@
+"""Local stand-in for the ElevenLabs and HeyGen APIs, for exercising the pipeline without paid calls.
+
+    python scripts/stub_server.py --port 8765 --latency 0.3 --fail-rate 0.1
+    ELEVEN_BASE_URL=http://127.0.0.1:8765 python scripts/generate_audio_snippets.py
+    HEYGEN_BASE_URL=http://127.0.0.1:8765 python scripts/generate_base_videos.py
+"""
+import argparse
+import array
+import hashlib
+import io
+import json
+import math
+import random
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STATS = {"requests": 0, "throttled": 0, "errors": 0, "max_in_flight": 0,
+         "renders": 0, "status_polls": 0, "range_requests": 0, "dropped_downloads": 0}
+_in_flight = 0
+_lock = threading.Lock()
+RENDERS = {}   # video_id -> (submitted_at, render_seconds)
+
+
+def fake_audio(text: str, rate: int = 22050) -> bytes:
+    """Deterministic, decodable speech stand-in: a WAV tone whose pitch/length follow the text.
+
+    Served as audio/mpeg like the real API; ffmpeg/pydub sniff the container, so
+    downstream stages can decode it.
+    """
+    seed = hashlib.sha256(text.encode("utf-8")).digest()
+    freq = 200 + seed[0] * 2
+    seconds = min(6.0, 0.15 + 0.06 * len(text))
+    n = int(rate * seconds)
+    samples = array.array("h", (int(8000 * math.sin(2 * math.pi * freq * i / rate)) for i in range(n)))
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(samples.tobytes())
+    return buf.getvalue()
+
+
+def fake_mp4(video_id: str, size: int = 4 * 1024 * 1024) -> bytes:
+    """Bytes that pass the downloader's checks (leading `ftyp` box); not a playable video."""
+    ftyp = b"\x00\x00\x00\x18ftypisom\x00\x00\x02\x00isomiso2"
+    seed = hashlib.sha256(video_id.encode()).digest()
+    body = (seed * (size // len(seed) + 1))[:size - len(ftyp)]
+    return ftyp + body
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    fail_rate = 0.0
+    render_seconds = 5.0
+    drop_first_download = False
+    protocol_version = "HTTP/1.1"   # keep-alive, so connection pooling is visible
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, status, body: bytes, content_type="application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        global _in_flight
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        with _lock:
+            STATS["requests"] += 1
+            _in_flight += 1
+            STATS["max_in_flight"] = max(STATS["max_in_flight"], _in_flight)
+        try:
+            time.sleep(self.latency)
+            if self.path == "/v2/video/generate":
+                video_id = hashlib.sha256(json.dumps(body, sort_keys=True).encode()).hexdigest()[:16]
+                with _lock:
+                    STATS["renders"] += 1
+                    # renders finish at different times, like real avatars of different lengths
+                    RENDERS[video_id] = (time.monotonic(), self.render_seconds * random.uniform(0.5, 1.5))
+                self._send(200, json.dumps({"error": None, "data": {"video_id": video_id}}).encode())
+                return
+            if not self.path.startswith("/v1/text-to-speech/"):
+                self._send(404, b'{"detail": "not found"}')
+                return
+            roll = random.random()
+            if roll < self.fail_rate / 2:
+                with _lock:
+                    STATS["throttled"] += 1
+                self._send(429, b'{"detail": "too_many_requests"}', headers={"Retry-After": "1"})
+                return
+            if roll < self.fail_rate:
+                with _lock:
+                    STATS["errors"] += 1
+                self._send(503, b'{"detail": "unavailable"}')
+                return
+            self._send(200, fake_audio(body.get("text", "")), content_type="audio/mpeg")
+        finally:
+            with _lock:
+                _in_flight -= 1
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send(200, json.dumps(STATS).encode())
+        elif self.path.startswith("/v1/video/status"):
+            self._video_status()
+        elif self.path.startswith("/videos/"):
+            self._video_file(self.path.rsplit("/", 1)[-1].removesuffix(".mp4"))
+        else:
+            self._send(404, b'{"detail": "not found"}')
+
+    def _video_status(self):
+        video_id = self.path.partition("video_id=")[2]
+        with _lock:
+            STATS["status_polls"] += 1
+            render = RENDERS.get(video_id)
+        if render is None:
+            self._send(404, b'{"detail": "unknown video"}')
+            return
+        started, seconds = render
+        data = {"video_id": video_id, "status": "processing", "video_url": None}
+        if time.monotonic() - started >= seconds:
+            host = self.headers.get("Host", "127.0.0.1")
+            data.update(status="completed", video_url=f"http://{host}/videos/{video_id}.mp4")
+        self._send(200, json.dumps({"data": data}).encode())
+
+    def _video_file(self, video_id):
+        body = fake_mp4(video_id)
+        start = 0
+        rng = self.headers.get("Range", "")
+        if rng.startswith("bytes="):
+            with _lock:
+                STATS["range_requests"] += 1
+            start = int(rng[6:].split("-")[0] or 0)
+            if start >= len(body):
+                self._send(416, b"", headers={"Content-Range": f"bytes */{len(body)}"})
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(len(body) - start))
+        self.end_headers()
+
+        chunk = body[start:]
+        with _lock:
+            drop = self.drop_first_download and start == 0
+            if drop:
+                STATS["dropped_downloads"] += 1
+        if drop:
+            # send ~40% then hang up, to exercise Range-based resume
+            self.wfile.write(chunk[: len(chunk) * 2 // 5])
+            self.close_connection = True
+            return
+        self.wfile.write(chunk)
+
+
+def serve(port=8765, latency=0.0, fail_rate=0.0, render_seconds=5.0, drop_first_download=False):
+    StubHandler.latency = latency
+    StubHandler.fail_rate = fail_rate
+    StubHandler.render_seconds = render_seconds
+    StubHandler.drop_first_download = drop_first_download
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    print(f"🧪 Stand-in API on http://127.0.0.1:{server.server_address[1]} (GET /stats for counters)")
+    return server
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency", type=float, default=0.3, help="seconds per request")
+    ap.add_argument("--fail-rate", type=float, default=0.0, help="fraction of 429/503 responses")
+    ap.add_argument("--render-seconds", type=float, default=5.0, help="mean time until a video is ready")
+    ap.add_argument("--drop-first-download", action="store_true",
+                    help="cut every full (non-Range) video download short")
+    args = ap.parse_args()
+    try:
+        serve(args.port, args.latency, args.fail_rate,
+              args.render_seconds, args.drop_first_download).serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n📊 {STATS}")
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+# ==================================================
+# CONFIGURATION
+# ==================================================
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "output/tts_cache")
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))  # 2 GB
+
+
+def speech_key(text, lang, voice_id, model_id, voice_settings) -> str:
+    """Content address of a clip: same text + language + voice + model + settings → same audio."""
+    blob = json.dumps(
+        {"text": text, "lang": lang, "voice_id": voice_id, "model_id": model_id,
+         "voice_settings": voice_settings},
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class SpeechCache:
+    """On-disk store of synthesized clips, `<root>/<ab>/<key>.mp3`, evicted least-recently-used first."""
+
+    def __init__(self, root=TTS_CACHE_DIR, max_bytes=TTS_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, key) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.mp3")
+
+    def get(self, key):
+        """Path of the cached clip, or None. A hit refreshes the entry's mtime for LRU eviction."""
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, src_path) -> str:
+        """Move a freshly synthesized file into the cache."""
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(src_path, path)
+        return path
+
+    def materialize(self, key, dest_path):
+        """Place the cached clip at dest_path (hard link when possible, else copy)."""
+        src = self.path_for(key)
+        os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        try:
+            os.link(src, dest_path)
+        except OSError:
+            shutil.copyfile(src, dest_path)
+
+    def evict(self, keep=()):
+        """Drop oldest entries until the cache fits in max_bytes. Returns bytes freed.
+
+        Keys in `keep` (the clips a batch is still using) are never dropped, even
+        if that leaves the cache above max_bytes until the next call.
+        """
+        keep = {f"{key}.mp3" for key in keep}
+        with self.lock:
+            entries = []
+            for dirpath, _, files in os.walk(self.root):
+                for name in files:
+                    if not name.endswith(".mp3"):
+                        continue
+                    p = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(p)
+                    except FileNotFoundError:  # evicted by another process meanwhile
+                        continue
+                    entries.append((st.st_mtime, st.st_size, name, p))
+            total = sum(e[1] for e in entries)
+            freed = 0
+            for _, size, name, p in sorted(entries):
+                if total - freed <= self.max_bytes:
+                    break
+                if name in keep:
+                    continue
+                try:
+                    os.remove(p)
+                except FileNotFoundError:
+                    continue
+                freed += size
+            return freed
@@ -0,0 +1,208 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import instrumentation
+from tts_cache import speech_key
+
+# ==================================================
+# CONFIGURATION (env overrides so the stand-in server can be used)
+# ==================================================
+ELEVEN_BASE_URL = os.getenv("ELEVEN_BASE_URL", "https://api.elevenlabs.io")
+TTS_MAX_CONCURRENCY = int(os.getenv("TTS_MAX_CONCURRENCY", "4"))
+TTS_REQUESTS_PER_SECOND = float(os.getenv("TTS_REQUESTS_PER_SECOND", "3"))
+TTS_MAX_RETRIES = int(os.getenv("TTS_MAX_RETRIES", "5"))
+TTS_TIMEOUT = (10, 120)          # (connect, read) seconds
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+CHUNK_SIZE = 64 * 1024
+
+
+class RateLimiter:
+    """Token bucket shared by all worker threads; `pause` pushes every caller back after a 429."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.burst = max(1, burst)
+        self.lock = threading.Lock()
+        self.next_free = time.monotonic()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            # allow up to `burst` back-to-back requests after an idle period
+            start = max(self.next_free, now - self.interval * (self.burst - 1))
+            self.next_free = start + self.interval
+            wait = start - now
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        with self.lock:
+            self.next_free = max(self.next_free, time.monotonic() + seconds)
+
+
+class TTSClient:
+    """ElevenLabs text-to-speech over one pooled Session, with rate limit, retries and streaming."""
+
+    def __init__(self, api_key, voice_id, model_id, voice_settings,
+                 base_url=ELEVEN_BASE_URL,
+                 max_concurrency=TTS_MAX_CONCURRENCY,
+                 requests_per_second=TTS_REQUESTS_PER_SECOND,
+                 max_retries=TTS_MAX_RETRIES):
+        self.voice_id = voice_id
+        self.model_id = model_id
+        self.voice_settings = voice_settings
+        self.url = f"{base_url.rstrip('/')}/v1/text-to-speech/{voice_id}"
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.limiter = RateLimiter(requests_per_second, burst=self.max_concurrency)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Accept": "audio/mpeg",
+            "Content-Type": "application/json",
+            "xi-api-key": api_key,
+        })
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = min(30.0, 0.5 * 2 ** attempt) * (0.5 + random.random())
+        if response is not None and response.status_code == 429:
+            self.limiter.pause(delay)
+        return delay
+
+    def synthesize(self, text, output_path):
+        """Synthesize one clip; the body is streamed to `output_path.part` and renamed on success."""
+        with instrumentation.span("tts.request", chars=len(text)) as sp:
+            ok, error = self._synthesize(text, output_path, sp)
+            sp["ok"] = ok
+        return ok, error
+
+    def _synthesize(self, text, output_path, sp):
+        payload = {"text": text, "model_id": self.model_id, "voice_settings": self.voice_settings}
+        tmp_path = output_path + ".part"
+        error = None
+
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                with self.session.post(self.url, json=payload, stream=True, timeout=TTS_TIMEOUT) as r:
+                    if r.status_code == 200:
+                        with open(tmp_path, "wb") as f:
+                            for chunk in r.iter_content(CHUNK_SIZE):
+                                f.write(chunk)
+                        os.replace(tmp_path, output_path)
+                        sp.update(attempts=attempt + 1, bytes_out=os.path.getsize(output_path))
+                        return True, None
+                    error = f"HTTP {r.status_code}: {r.text[:200]}"
+                    instrumentation.count("tts_http_errors_total", status=r.status_code)
+                    if r.status_code not in RETRY_STATUSES:
+                        return False, error
+                    delay = self._backoff(attempt, r)
+            except requests.RequestException as e:
+                error = f"{type(e).__name__}: {e}"
+                delay = self._backoff(attempt)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            if attempt < self.max_retries:
+                time.sleep(delay)
+
+        return False, error
+
+    def key_for(self, text, lang):
+        return speech_key(text, lang, self.voice_id, self.model_id, self.voice_settings)
+
+    def ensure_cached(self, items, cache):
+        """Make sure every (text, lang) in items is in the cache. Returns {key: error or None}.
+
+        Identical items are merged, cache hits are skipped, and each remaining
+        distinct text is synthesized once, concurrently. Nothing is evicted here:
+        the caller calls cache.evict(keep=...) once it has used the clips.
+        """
+        results, todo = {}, {}
+        for text, lang in items:
+            key = self.key_for(text, lang)
+            if key in results or key in todo:
+                continue
+            if cache.get(key):
+                results[key] = None
+            else:
+                todo[key] = text
+        print(f"♻️ {len(items)} request(s): {len(results)} cached, {len(todo)} unique text(s) to synthesize")
+        instrumentation.count("cache_hits_total", len(results), cache="tts")
+        instrumentation.count("cache_misses_total", len(todo), cache="tts")
+
+        def run(key, text):
+            tmp = cache.path_for(key) + f".{threading.get_ident()}.new"
+            os.makedirs(os.path.dirname(tmp), exist_ok=True)
+            ok, error = self.synthesize(text, tmp)
+            if ok:
+                cache.put(key, tmp)
+            return error
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            futures = {pool.submit(run, key, text): key for key, text in todo.items()}
+            for fut in as_completed(futures):
+                try:
+                    results[futures[fut]] = fut.result()
+                except Exception as e:  # keep going for the rest of the batch
+                    results[futures[fut]] = str(e)
+        return results
+
+    def synthesize_many(self, jobs, cache=None):
+        """Run [(text, lang, output_path), ...] concurrently. Returns {output_path: error or None}.
+
+        With a SpeechCache, identical requests in the batch are merged and cached
+        clips are reused, so each distinct text is synthesized at most once.
+        """
+        results = {}
+        if cache is not None:
+            errors = self.ensure_cached([(text, lang) for text, lang, _ in jobs], cache)
+            for text, lang, path in jobs:
+                key = self.key_for(text, lang)
+                error = errors[key]
+                if error is None:
+                    cache.materialize(key, path)
+                    print(f"✅ Saved: {path}")
+                else:
+                    print(f"❌ Failed: {path} → {error}")
+                results[path] = error
+            cache.evict(keep=errors)    # only after every clip of the batch is in place
+            return results
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            futures = {pool.submit(self.synthesize, text, path): path for text, _, path in jobs}
+            for fut in as_completed(futures):
+                path = futures[fut]
+                try:
+                    ok, error = fut.result()
+                except Exception as e:  # keep going for the rest of the batch
+                    ok, error = False, str(e)
+                results[path] = None if ok else error
+                if ok:
+                    print(f"✅ Saved: {path}")
+                else:
+                    print(f"❌ Failed: {path} → {error}")
+        return results
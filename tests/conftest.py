@@ -0,0 +1,39 @@
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO / "main"))
+sys.path.append(str(REPO / "scripts"))   # after main/: scripts/complete_video.py must not shadow main's
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    """A fresh artifact index in tmp_path, with tmp_path as the working directory."""
+    import artifact_index
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(artifact_index, "INDEX_PATH", tmp_path / "data" / "artifacts.sqlite")
+    monkeypatch.setattr(artifact_index, "_conn", None)
+    return artifact_index
+
+
+@pytest.fixture
+def stub_api():
+    """Start scripts/stub_server.py on an ephemeral port: stub_api(**serve options) -> base URL."""
+    import stub_server
+    servers = []
+
+    def start(**options):
+        stub_server.STATS.update(dict.fromkeys(stub_server.STATS, 0))
+        stub_server.RENDERS.clear()
+        server = stub_server.serve(port=0, **options)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,47 @@
+import pandas as pd
+
+
+def touch(path, data=b"x"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return path
+
+
+def test_rebuild_indexes_the_output_tree(index, tmp_path):
+    touch(tmp_path / "output" / "final_videos" / "final_Hindi_7.mp4", b"abc")
+    touch(tmp_path / "output" / "final_videos" / "final_hindi_with_cards_7.mp4")
+    touch(tmp_path / "output_2clips" / "7_hindi" / "01_hindi.mp3")
+    touch(tmp_path / "output" / "merged_videos" / "base_hindi_part1.mp4")
+    touch(tmp_path / "assets" / "generated_videos" / "tamil_8_video_720p.mp4")
+    touch(tmp_path / "assets" / "generated" / "7_loan.png")          # language from the master
+    touch(tmp_path / "assets" / "generated" / "99_loan.png")         # no longer in the master
+    touch(tmp_path / "output" / "final_videos" / "notes.txt")
+    pd.DataFrame({"id": [7, 8], "language": ["Hindi", "Tamil"]}).to_csv(touch(tmp_path / "data" / "customers_master.csv"), index=False)
+
+    assert index.rebuild(hash_files=True) == 6
+    assert index.entry("7", "hindi", "final_video")["size"] == 3
+    assert index.entry("7", "Hindi", "final_video")["sha256"] == index.sha256(tmp_path / "output" / "final_videos" / "final_Hindi_7.mp4")
+    assert index.customers("final_with_cards") == {("7", "hindi")}
+    assert index.lookup("", "hindi", "base_part1") is not None
+    assert index.lookup("8", "tamil", "video_720p") is not None
+    assert index.customers("loan_card") == {("7", "hindi")}
+
+
+def test_recording_does_not_hash_unless_asked(index, tmp_path):
+    index.record("1", "hindi", "merged_video", touch(tmp_path / "output" / "merged_videos" / "1_hindi.mp4"))
+    assert index.entry("1", "hindi", "merged_video")["sha256"] is None
+
+
+def test_forget_paths_and_present(index, tmp_path):
+    merged = touch(tmp_path / "output" / "merged_videos" / "1_hindi.mp4")
+    final = touch(tmp_path / "output" / "final_videos" / "final_hindi_1.mp4")
+    index.record_many([("1", "hindi", "merged_video", merged), ("1", "hindi", "final_video", final)])
+    assert index.present("1", "hindi", "merged_video")
+
+    index.forget_paths([merged])
+    assert index.lookup("1", "hindi", "merged_video") is None
+    assert index.present("1", "hindi", "final_video")
+
+    final.unlink()                              # removed by hand: still recorded, no longer present
+    assert index.lookup("1", "hindi", "final_video") is not None
+    assert not index.present("1", "hindi", "final_video")
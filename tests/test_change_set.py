@@ -0,0 +1,99 @@
+import pandas as pd
+
+import change_set
+
+
+def master(*rows):
+    cols = ["name", "language", "loan_account_number", "loan_amount", "emi_amount", "due_date", "ifsc", "account_last4"]
+    return pd.DataFrame([dict(zip(cols, r)) for r in rows], columns=cols)
+
+
+A = ("Asha", "Hindi", "L1", "1000", "100", "05-01-2026", "SBIN0001", "1234")
+B = ("Bala", "Tamil", "L2", "2000", "200", "05-01-2026", "SBIN0002", "2345")
+C = ("Chitra", "Hindi", "L3", "3000", "300", "05-01-2026", "SBIN0003", "3456")
+D = ("Dev", "Hindi", "L4", "4000", "400", "05-01-2026", "SBIN0004", "4567")
+
+
+def by_account(changes):
+    return {r["loan_account_number"]: r for r in changes.to_dict(orient="records")}
+
+
+def touch(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x")
+    return path
+
+
+def test_first_master_gives_everyone_new_ids_above_the_high_water():
+    new, changes = change_set.diff_masters(master(A, B), None, high_water=10)
+    assert new["id"].tolist() == [11, 12]
+    assert set(changes["status"]) == {"new"}
+
+
+def test_new_changed_due_only_and_removed():
+    prev, _ = change_set.diff_masters(master(A, B, C, D), None)
+    moved_due = C[:5] + ("05-02-2026",) + C[6:]
+    renamed = ("Bala K",) + B[1:]
+    new, changes = change_set.diff_masters(master(A, renamed, moved_due, ("Esha", "Hindi", "L5", "500", "50", "05-01-2026", "SBIN0005", "5678")),
+                                           prev.astype(str), high_water=9)
+    rows = by_account(changes)
+    assert rows["L1"]["status"] == "unchanged" and not rows["L1"]["due_date_changed"]
+    assert rows["L2"]["status"] == "changed"
+    assert rows["L3"]["status"] == "unchanged" and rows["L3"]["due_date_changed"]
+    assert rows["L4"]["status"] == "removed" and rows["L4"]["id"] == "4"
+    assert rows["L5"]["status"] == "new" and rows["L5"]["id"] == "10"   # above the high-water mark, not 5
+    assert new["id"].tolist() == [1, 2, 3, 10]
+    assert change_set.pending_ids(changes, uses_due_date=False) == {"2", "10"}
+    assert change_set.pending_ids(changes, uses_due_date=True) == {"2", "3", "10"}
+    assert change_set.removed_customers(changes) == [("4", "Hindi")]
+
+
+def test_language_change_removes_the_old_language():
+    prev, _ = change_set.diff_masters(master(A), None)
+    _, changes = change_set.diff_masters(master(A[:1] + ("Tamil",) + A[2:]), prev.astype(str))
+    assert changes[changes["status"] != "removed"]["status"].tolist() == ["changed"]
+    assert change_set.removed_customers(changes) == [("1", "Hindi")]
+
+
+def test_pending_customer_is_carried_until_the_final_video_is_recorded(index):
+    prev, first = change_set.diff_masters(master(A, B), None)
+    # prepare runs again before anything was rendered: the plain diff says unchanged
+    _, second = change_set.diff_masters(master(A, B), prev.astype(str))
+    assert change_set.pending_ids(second) == set()
+    second, carried = change_set.carry_forward(second, first)
+    assert carried == 2
+    assert change_set.pending_ids(second) == {"1", "2"}
+
+    # cards done for customer 1: the card stage skips it, later stages don't
+    index.record("1", "hindi", "emi_card", touch(index.ROOT / "assets" / "generated" / "1_emi.png"))
+    assert change_set.pending_ids(second, kinds=["emi_card"]) == {"2"}
+    assert change_set.pending_ids(second, kinds=["video*"]) == {"1", "2"}
+
+    # customer 1's video is out: a third prepare stops carrying it
+    index.record("1", "hindi", "video", touch(index.ROOT / "assets" / "generated_videos" / "hindi_1_video.mp4"))
+    _, third = change_set.diff_masters(master(A, B), prev.astype(str))
+    third, carried = change_set.carry_forward(third, second)
+    assert carried == 1
+    assert change_set.pending_ids(third) == {"2"}
+
+
+def test_removal_is_carried_while_the_index_still_holds_the_customer(index):
+    prev, _ = change_set.diff_masters(master(A, B), None)
+    _, first = change_set.diff_masters(master(A), prev.astype(str))
+    index.record("2", "tamil", "video", touch(index.ROOT / "assets" / "generated_videos" / "tamil_2_video.mp4"))
+
+    _, second = change_set.diff_masters(master(A), prev.drop(index=1).astype(str))
+    second, _ = change_set.carry_forward(second, first)
+    assert change_set.removed_customers(second) == [("2", "Tamil")]
+
+    index.forget("2", "tamil")
+    third, _ = change_set.carry_forward(change_set.diff_masters(master(A), prev.drop(index=1).astype(str))[1], second)
+    assert change_set.removed_customers(third) == []
+
+
+def test_change_set_round_trips_through_the_csv(tmp_path):
+    _, changes = change_set.diff_masters(master(A, B), None)
+    change_set.write_change_set(changes, tmp_path / "change_set.csv")
+    loaded = change_set.read_change_set(tmp_path / "change_set.csv")
+    assert change_set.pending_ids(loaded) == {"1", "2"}
+    assert loaded["detected"].notna().all()
@@ -0,0 +1,35 @@
+import os
+
+import pandas as pd
+import pytest
+
+import customer_store
+
+pytest.importorskip("pyarrow")
+
+
+def write_master(path, names):
+    df = pd.DataFrame({"id": range(1, len(names) + 1), "name": names, "language": "Hindi",
+                       "loan_account_number": [f"L{i}" for i in range(len(names))]})
+    df.to_csv(path, index=False)
+    return df
+
+
+def test_dataset_is_used_only_while_it_matches_the_csv(tmp_path):
+    csv = tmp_path / "customers_master.csv"
+    customer_store.write_master_dataset(write_master(csv, ["Asha", "Bala"]), csv)
+    assert customer_store.has_dataset(csv)
+    assert customer_store.read_customers("Hindi", ["name"], csv)["name"].tolist() == ["Asha", "Bala"]
+
+    # the CSV is regenerated without the partitions (pyarrow missing on that host, or a hand edit)
+    write_master(csv, ["Asha", "Bala", "Chitra"])
+    os.utime(csv, ns=(os.stat(csv).st_atime_ns, os.stat(csv).st_mtime_ns + 1_000_000_000))
+    assert not customer_store.has_dataset(csv)
+    assert customer_store.read_customers("Hindi", ["name"], csv)["name"].tolist() == ["Asha", "Bala", "Chitra"]
+
+
+def test_dataset_without_a_stamp_is_not_trusted(tmp_path):
+    csv = tmp_path / "customers_master.csv"
+    customer_store.write_master_dataset(write_master(csv, ["Asha"]), csv)
+    (customer_store.dataset_dir(csv) / "_source.json").unlink()
+    assert not customer_store.has_dataset(csv)
@@ -0,0 +1,79 @@
+import importlib
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+import stub_server
+
+
+@pytest.fixture
+def gbv(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)                 # the module creates output/base_videos on import
+    return importlib.import_module("generate_base_videos")
+
+
+def test_dropped_download_resumes_with_a_range_request(tmp_path, gbv, stub_api):
+    base = stub_api(drop_first_download=True)
+    out = str(tmp_path / "hindi.mp4")
+    assert gbv.stream_download(f"{base}/videos/abc.mp4", out, "hindi", source="abc")
+
+    assert stub_server.STATS["dropped_downloads"] == 1
+    assert stub_server.STATS["range_requests"] == 1
+    with open(out, "rb") as f:
+        assert f.read() == stub_server.fake_mp4("abc")
+    assert [p.name for p in tmp_path.glob("*.part")] == []
+
+
+def test_partial_download_of_another_render_is_not_resumed(tmp_path, gbv, stub_api):
+    base = stub_api()
+    out = str(tmp_path / "hindi.mp4")
+    old = gbv.part_path_for(out, "old-render")
+    with open(old, "wb") as f:
+        f.write(stub_server.fake_mp4("old-render")[:1000])
+
+    assert gbv.stream_download(f"{base}/videos/abc.mp4", out, "hindi", source="abc")
+    assert stub_server.STATS["range_requests"] == 0           # started over, not appended to old bytes
+    with open(out, "rb") as f:
+        assert f.read() == stub_server.fake_mp4("abc")
+    assert [p.name for p in tmp_path.glob("*.part")] == []
+
+
+def test_partial_download_of_the_same_render_is_resumed(tmp_path, gbv, stub_api):
+    base = stub_api()
+    out = str(tmp_path / "hindi.mp4")
+    with open(gbv.part_path_for(out, "abc"), "wb") as f:
+        f.write(stub_server.fake_mp4("abc")[:1000])
+
+    assert gbv.stream_download(f"{base}/videos/abc.mp4", out, "hindi", source="abc")
+    assert stub_server.STATS["range_requests"] == 1
+    with open(out, "rb") as f:
+        assert f.read() == stub_server.fake_mp4("abc")
+
+
+def test_status_polls_back_off_until_the_render_is_ready(gbv, stub_api, monkeypatch):
+    base = stub_api(render_seconds=0.6)        # ready after 0.3-0.9 s
+    monkeypatch.setattr(gbv, "HEYGEN_BASE_URL", base)
+    monkeypatch.setattr(gbv, "POLL_FIRST_DELAY", 0.05)
+    monkeypatch.setattr(gbv, "POLL_BACKOFF", 2.0)
+    monkeypatch.setattr(gbv, "POLL_MAX_DELAY", 0.4)
+    delays = []
+    monkeypatch.setattr(gbv, "time", SimpleNamespace(monotonic=time.monotonic,
+                                                     sleep=lambda s: (delays.append(s), time.sleep(s))))
+
+    video_id = requests.post(f"{base}/v2/video/generate", json={"lang": "hindi"}).json()["data"]["video_id"]
+    url = gbv.wait_for_video_url(video_id, "hindi")
+
+    assert url.endswith(f"/videos/{video_id}.mp4")
+    assert stub_server.STATS["status_polls"] == len(delays)
+    assert delays[0] == pytest.approx(0.05)
+    assert all(later > earlier or later >= 0.4 * 0.9 for earlier, later in zip(delays, delays[1:]))
+    assert max(delays) <= 0.4 * 1.1
+
+
+def test_status_polling_gives_up_at_the_timeout(gbv, stub_api, monkeypatch):
+    monkeypatch.setattr(gbv, "HEYGEN_BASE_URL", stub_api())
+    monkeypatch.setattr(gbv, "POLL_FIRST_DELAY", 0.05)
+    monkeypatch.setattr(gbv, "POLL_TIMEOUT", 0.3)
+    assert gbv.wait_for_video_url("never-submitted", "hindi") is None
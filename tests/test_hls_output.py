@@ -0,0 +1,25 @@
+import hls_output
+
+SHARED = [("seg_000.m4s", 0.0, 6.0), ("seg_001.m4s", 6.0, 4.0), ("seg_002.m4s", 10.0, 4.0),
+          ("seg_003.m4s", 14.0, 4.0), ("seg_004.m4s", 18.0, 2.0)]
+WINDOWS = [(6.0, 10.0), (14.0, 18.0)]
+
+
+def test_personal_segments_only_inside_the_windows():
+    # the personal encode covers 6-18 s; its starts drift a little from the shared cuts
+    personal = [("seg_000.m4s", 6.02, 4.0), ("seg_001.m4s", 10.0, 4.0), ("seg_002.m4s", 13.99, 4.0)]
+    pieces = hls_output.customer_pieces(SHARED, "../shared", personal, "p", WINDOWS)
+
+    assert pieces == [
+        ("../shared/init.mp4", "../shared/seg_000.m4s", 6.0),
+        ("p/init.mp4", "p/seg_000.m4s", 4.0),
+        ("../shared/init.mp4", "../shared/seg_002.m4s", 4.0),   # the gap between windows stays shared
+        ("p/init.mp4", "p/seg_002.m4s", 4.0),
+        ("../shared/init.mp4", "../shared/seg_004.m4s", 2.0),
+    ]
+
+
+def test_personal_span_covers_every_touched_segment():
+    overlays = [{"start": 7.0, "end": 9.0}, {"start": 15.0, "end": 16.0}]
+    assert hls_output.personal_span(SHARED, overlays) == (6.0, 18.0)
+    assert hls_output.personal_span(SHARED, []) is None
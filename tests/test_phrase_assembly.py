@@ -0,0 +1,15 @@
+import phrase_assembly
+
+
+def test_amounts_are_spoken_as_indian_system_number_units():
+    assert phrase_assembly.amount_units("3,000,000", "hindi") == ["30", "लाख"]
+    assert phrase_assembly.amount_units("54,061", "english") == ["54", "thousand", "61"]
+    assert phrase_assembly.amount_units("1,25,00,00,000", "english") == ["1", "hundred", "25", "crore"]
+    assert phrase_assembly.amount_units("0", "tamil") == ["0"]
+    assert phrase_assembly.amount_units("n/a", "tamil") == ["n/a"]
+
+
+def test_only_names_stay_whole_units():
+    template = "Dear {name}, your EMI of {emi_amount} rupees"
+    units = phrase_assembly.plan_units(template, {"name": "Asha Rao", "emi_amount": "12,345"}, "kannada")
+    assert units == ["Dear", "Asha Rao", ", your EMI of", "12", "ಸಾವಿರ", "3", "ನೂರು", "45", "rupees"]
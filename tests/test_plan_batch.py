@@ -0,0 +1,61 @@
+import json
+import time
+
+import pytest
+
+import plan_batch
+
+# one card customer: 2 s wall, 1 s CPU (half a core); one video second: 1 s wall, 1 s CPU
+CARD = {"wall": 2.0, "cpu": 1.0, "bytes": 100.0, "rss_mb": None}
+VIDEO = {"wall": 1.0, "cpu": 1.0, "bytes": 1000.0, "rss_mb": None}
+
+
+def test_card_workers_scale_until_the_cores_are_busy():
+    one = plan_batch.plan_stage("cards", CARD, 100, 100, 1, 4, None)
+    four = plan_batch.plan_stage("cards", CARD, 100, 100, 4, 4, None)
+    many = plan_batch.plan_stage("cards", CARD, 100, 100, 32, 4, None)
+    assert one["wall_s"] == pytest.approx(200)
+    assert four["wall_s"] == pytest.approx(50)
+    assert many["wall_s"] == pytest.approx(25)           # 4 cores / 0.5 core per worker = 8x
+    assert one["cpu_hours"] == pytest.approx(100 / 3600)
+    assert one["recommended_workers"] == 8
+
+
+def test_video_is_one_process_whatever_the_workers():
+    mix, enc = {"hindi": 10}, {"hindi": 30.0}
+    rows, missing = plan_batch.plan(mix, enc, {"video": VIDEO}, ["video"], 8, 8, None)
+    assert not missing
+    assert rows[0]["wall_s"] == pytest.approx(300)
+    assert rows[0]["recommended_workers"] == 8           # reported, not planned
+    sharded, _ = plan_batch.plan(mix, enc, {"video": VIDEO}, ["video"], 8, 8, None, shard=True)
+    assert sharded[0]["wall_s"] == pytest.approx(300 / 8)
+
+
+def test_workers_for_window_only_counts_card_workers():
+    mix, enc = {"hindi": 100}, {"hindi": 30.0}
+    costs = {"cards": CARD, "video": VIDEO}
+    stages = ["cards", "video"]
+    # cards 200 s on one worker, video 3000 s always
+    assert plan_batch.workers_for_window(mix, enc, costs, stages, 8, None, 3100) == 2
+    assert plan_batch.workers_for_window(mix, enc, costs, stages, 8, None, 2000) is None
+    assert plan_batch.workers_for_window(mix, enc, costs, stages, 8, None, 2000, shard=True) == 2
+
+
+def test_costs_from_spans_counts_ffmpeg_children(tmp_path):
+    now = time.time()
+    spans = [
+        {"span": "merge_audio.customer", "pid": 1, "ts": now - 10, "wall_s": 4.0, "cpu_s": 0.2,
+         "bytes_out": 0, "status": "ok"},
+        {"span": "ffmpeg", "pid": 1, "ts": now - 11, "wall_s": 3.0, "cpu_s": 2.8,
+         "bytes_out": 5000, "max_rss_kb": 2048, "status": "ok"},
+        {"span": "ffmpeg", "pid": 2, "ts": now - 11, "wall_s": 3.0, "cpu_s": 9.0, "status": "ok"},   # other process
+        {"span": "merge_audio.customer", "pid": 1, "ts": now - 90 * 86400, "wall_s": 99.0, "status": "ok"},  # too old
+    ]
+    path = tmp_path / "spans.jsonl"
+    path.write_text("\n".join(json.dumps(s) for s in spans) + "\nnot json\n")
+    cost = plan_batch.costs_from_spans(path, since_days=30)["merge_audio"]
+    assert cost["units"] == 1
+    assert cost["wall"] == pytest.approx(4.0)
+    assert cost["cpu"] == pytest.approx(3.0)
+    assert cost["bytes"] == 5000
+    assert cost["rss_mb"] == 2
@@ -0,0 +1,31 @@
+import os
+
+from tts_cache import SpeechCache
+from tts_client import TTSClient
+
+
+def test_batch_larger_than_cache_cap(tmp_path, stub_api):
+    # each stand-in clip is a few kB to 260 kB: 20 of them are well over 100 kB
+    cache = SpeechCache(root=str(tmp_path / "cache"), max_bytes=100_000)
+    jobs = [(f"Dear customer number {i}, your EMI is due", "hi", str(tmp_path / "out" / f"{i}.mp3"))
+            for i in range(20)]
+    with TTSClient("key", "voice", "model", {}, base_url=stub_api(), requests_per_second=0) as client:
+        results = client.synthesize_many(jobs, cache=cache)
+
+    assert results == {path: None for _, _, path in jobs}
+    assert all(os.path.getsize(path) > 0 for _, _, path in jobs)
+
+    # the next batch evicts this one's clips down to the cap
+    cache.evict()
+    sizes = [os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(cache.root) for f in files]
+    assert sum(sizes) <= 100_000
+
+
+def test_evict_keeps_protected_keys(tmp_path):
+    cache = SpeechCache(root=str(tmp_path), max_bytes=0)
+    for key in ("aa1", "bb2"):
+        src = tmp_path / f"{key}.tmp"
+        src.write_bytes(b"x" * 10)
+        cache.put(key, str(src))
+    assert cache.evict(keep=["aa1"]) == 10
+    assert cache.get("aa1") and not cache.get("bb2")
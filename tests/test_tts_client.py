@@ -0,0 +1,70 @@
+import os
+import time
+
+import stub_server
+import tts_client
+from tts_client import RateLimiter, TTSClient
+
+
+class Rolls:
+    """Stands in for stub_server's `random`: the failure rolls come from a list."""
+
+    def __init__(self, *rolls):
+        self.rolls = list(rolls)
+
+    def random(self):
+        return self.rolls.pop(0) if self.rolls else 1.0
+
+    def uniform(self, a, b):
+        return (a + b) / 2
+
+
+def test_retries_429_and_5xx_then_renames_the_part(tmp_path, stub_api, monkeypatch):
+    base = stub_api(fail_rate=1.0)
+    monkeypatch.setattr(stub_server, "random", Rolls(0.1, 0.7))      # a 429, a 503, then a clip
+    out = str(tmp_path / "clip.mp3")
+    with TTSClient("key", "voice", "model", {}, base_url=base, requests_per_second=0) as client:
+        t0 = time.monotonic()
+        ok, error = client.synthesize("नमस्ते", out)
+        elapsed = time.monotonic() - t0
+
+    assert ok and error is None
+    assert stub_server.STATS["throttled"] == 1 and stub_server.STATS["errors"] == 1
+    assert stub_server.STATS["requests"] == 3
+    assert elapsed >= 1.0                       # the 429's Retry-After: 1 was honoured
+    assert os.listdir(tmp_path) == ["clip.mp3"]
+    with open(out, "rb") as f:
+        assert f.read() == stub_server.fake_audio("नमस्ते")
+
+
+def test_gives_up_after_max_retries_without_leaving_a_part(tmp_path, stub_api, monkeypatch):
+    base = stub_api(fail_rate=1.0)
+    monkeypatch.setattr(stub_server, "random", Rolls(0.7, 0.7, 0.7))
+    monkeypatch.setattr(tts_client.random, "random", lambda: 0.0)    # shortest backoff
+    out = str(tmp_path / "clip.mp3")
+    with TTSClient("key", "voice", "model", {}, base_url=base, requests_per_second=0, max_retries=1) as client:
+        ok, error = client.synthesize("hello", out)
+
+    assert not ok and error.startswith("HTTP 503")
+    assert stub_server.STATS["requests"] == 2
+    assert os.listdir(tmp_path) == []
+
+
+def test_requests_are_spaced_by_the_rate_limit(tmp_path, stub_api):
+    base = stub_api()
+    jobs = [(f"clip {i}", "en", str(tmp_path / f"{i}.mp3")) for i in range(6)]
+    with TTSClient("key", "voice", "model", {}, base_url=base, max_concurrency=1, requests_per_second=10) as client:
+        t0 = time.monotonic()
+        results = client.synthesize_many(jobs)
+        elapsed = time.monotonic() - t0
+
+    assert results == {path: None for _, _, path in jobs}
+    assert elapsed >= 0.5 - 0.02                # 6 requests, 0.1 s apart
+
+
+def test_pause_holds_back_every_caller():
+    limiter = RateLimiter(100, burst=4)
+    limiter.pause(0.3)
+    t0 = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - t0 >= 0.29
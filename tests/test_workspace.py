@@ -0,0 +1,72 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import workspace
+from conftest import REPO
+
+# reserves 60 of a 100-byte quota in another process, reports, then holds it until killed or released
+HOLDER = """
+import sys, time, pathlib, workspace
+ws = workspace.Workspace("holder", root=sys.argv[1], quota=100)
+ticket = ws.reserve(60, ws.root / "a")
+print("held", flush=True)
+sys.stdin.readline()
+ws.release(ticket)
+print("released", flush=True)
+time.sleep(30)
+"""
+
+
+@pytest.fixture
+def holder(tmp_path):
+    env = {**os.environ, "PYTHONPATH": str(REPO / "main")}
+    proc = subprocess.Popen([sys.executable, "-c", HOLDER, str(tmp_path)], env=env, cwd=tmp_path,
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    assert proc.stdout.readline().strip() == "held"
+    yield proc
+    proc.kill()
+    proc.wait()
+
+
+def test_reservations_are_shared_across_processes(tmp_path, holder, monkeypatch):
+    monkeypatch.setattr(workspace, "QUOTA_POLL_SECONDS", 0.05)
+    ws = workspace.Workspace("waiter", root=tmp_path, quota=100)
+    assert ws.held() == 60
+
+    holder.stdin.write("\n")
+    holder.stdin.flush()
+    ticket = ws.reserve(50, ws.root / "b")        # 60 + 50 > 100 until the holder releases
+    assert holder.stdout.readline().strip() == "released"
+    assert ws.held() == 50
+    ws.release(ticket)
+
+
+def test_reservation_of_a_dead_process_is_dropped(tmp_path, holder, monkeypatch):
+    monkeypatch.setattr(workspace, "QUOTA_POLL_SECONDS", 0.05)
+    ws = workspace.Workspace("waiter", root=tmp_path, quota=100)
+    holder.kill()
+    holder.wait()
+    ticket = ws.reserve(50, ws.root / "b")
+    assert ws.held() == 50
+    ws.release(ticket)
+
+
+def test_reserve_blocks_while_the_quota_is_held(tmp_path, holder):
+    env = {**os.environ, "PYTHONPATH": str(REPO / "main")}
+    # a third process asking for 50 must still be waiting a second later
+    waiter = subprocess.Popen([sys.executable, "-c",
+                               "import sys, workspace; ws = workspace.Workspace('third', root=sys.argv[1], quota=100);"
+                               "ws.reserve(50, ws.root / 'c'); print('got it', flush=True)", str(tmp_path)],
+                              env=env, cwd=tmp_path, stdout=subprocess.PIPE, text=True)
+    try:
+        with pytest.raises(subprocess.TimeoutExpired):
+            waiter.wait(timeout=1.0)
+        holder.stdin.write("\n")
+        holder.stdin.flush()
+        assert waiter.stdout.readline().strip() == "got it"
+    finally:
+        waiter.kill()
+        waiter.wait()